@@ -0,0 +1,417 @@
+"""IVF-flat approximate nearest-neighbour index over the 64-d unit user vectors (pure NumPy).
+
+Spherical k-means splits the vectors into ``nlist`` cells. Each cell keeps its
+own contiguous float32 block of member vectors (the inverted list). A query
+scores the ``nprobe`` nearest centroids and scans only those cells, exactly,
+so the cost is about nprobe / nlist of a full scan. Recall is tuned with:
+
+    ANN_NLIST       cells (0 = auto, ~sqrt(users))
+    ANN_NPROBE      cells scanned per query (more → higher recall, slower)
+    ANN_STALE_RATIO changes since training, as a fraction of the trained size,
+                    after which the centroids count as stale (callers fall back
+                    to an exact scan and retrain)
+
+Inserts, updates (re-assigned to their nearest cell) and deletes are
+incremental. ``save`` / ``load`` persist centroids and cells to one .npz, and
+``sync`` reconciles a loaded index with the current vectors.
+
+The servers opt in with ANN_INDEX=ivf. ``AnnMaintainer`` then keeps an index
+attached to their VectorIndex (loaded from disk or trained in the background
+once there are ANN_MIN_USERS users, retrained when stale), and /api/matches
+serves pages from its nearest users while the distance penalty cannot reorder
+them against the rest (see match_pages.select_candidate_page). The probe is
+approximate, so "the rest" is bounded exactly: users in unprobed cells by each
+cell's centroid score plus its radius (``search_bounded``). Unlimited
+requests and deeper pages scan every user. Until an index is
+attached, and whenever it is stale, matching uses the exact scan.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Sequence
+
+import numpy as np
+
+DEFAULT_NLIST = int(os.environ.get("ANN_NLIST", "0"))
+DEFAULT_NPROBE = int(os.environ.get("ANN_NPROBE", "32"))
+DEFAULT_STALE_RATIO = float(os.environ.get("ANN_STALE_RATIO", "0.5"))
+TRAIN_PER_CELL = 64  # k-means trains on at most this many sampled vectors per cell
+ASSIGN_CHUNK = 65536
+
+ENABLED = os.environ.get("ANN_INDEX", "off") == "ivf"
+MIN_USERS = int(os.environ.get("ANN_MIN_USERS", "50000"))
+CANDIDATES = int(os.environ.get("ANN_CANDIDATES", "1000"))
+
+
+def auto_nlist(n: int) -> int:
+    return int(max(1, min(n, round(np.sqrt(n)))))
+
+
+def _normalize(X: np.ndarray) -> np.ndarray:
+    return X / np.maximum(np.linalg.norm(X, axis=-1, keepdims=True), 1e-12)
+
+
+def assign(X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (max dot product) per row, in chunks to bound the score matrix."""
+    out = np.empty(len(X), dtype=np.int64)
+    for i in range(0, len(X), ASSIGN_CHUNK):
+        out[i : i + ASSIGN_CHUNK] = np.argmax(X[i : i + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(X: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means: (k, dim) unit centroids. Empty cells are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    X = _normalize(np.asarray(X, dtype=np.float32))
+    if len(X) > k * TRAIN_PER_CELL:
+        X = X[rng.choice(len(X), k * TRAIN_PER_CELL, replace=False)]
+    centroids = X[rng.choice(len(X), k, replace=len(X) < k)].copy()
+    for _ in range(iters):
+        labels = assign(X, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, X)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = X[rng.choice(len(X), int(empty.sum()))]
+        centroids = _normalize(sums).astype(np.float32)
+    return centroids
+
+
+class _Cell:
+    """
+    One inverted list: member ids and their vectors, contiguous, grown by doubling.
+    ``radius`` bounds the distance of every member from the cell's centroid; it
+    grows on ``extend`` and is not shrunk on ``pop``, so it stays an upper bound.
+    """
+
+    def __init__(self, centroid: np.ndarray, capacity: int = 16):
+        self.n = 0
+        self.centroid = centroid
+        self.radius = 0.0
+        self.X = np.empty((capacity, len(centroid)), dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=object)
+
+    def reserve(self, extra: int) -> None:
+        if self.n + extra > len(self.X):
+            capacity = max(2 * len(self.X), self.n + extra)
+            X = np.empty((capacity, self.X.shape[1]), dtype=np.float32)
+            ids = np.empty(capacity, dtype=object)
+            X[: self.n], ids[: self.n] = self.X[: self.n], self.ids[: self.n]
+            self.X, self.ids = X, ids
+
+    def extend(self, ids: Sequence[str], X: np.ndarray) -> int:
+        """Append rows; returns the slot of the first one."""
+        self.reserve(len(ids))
+        start = self.n
+        self.X[start : start + len(ids)] = X
+        self.ids[start : start + len(ids)] = ids
+        self.n += len(ids)
+        if len(ids):
+            self.radius = max(self.radius, float(np.linalg.norm(X - self.centroid, axis=-1).max()))
+        return start
+
+    def pop(self, slot: int) -> str | None:
+        """Remove ``slot`` by moving the last row into it; returns the moved id (None if it was last)."""
+        last = self.n - 1
+        moved = None
+        if slot != last:
+            self.X[slot], self.ids[slot] = self.X[last], self.ids[last]
+            moved = self.ids[slot]
+        self.ids[last] = None
+        self.n = last
+        return moved
+
+
+class IVFIndex:
+    """Inverted-file index: ``add`` inserts or re-assigns, ``remove`` deletes, ``search`` probes ``nprobe`` cells."""
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        nprobe: int = DEFAULT_NPROBE,
+        stale_ratio: float = DEFAULT_STALE_RATIO,
+    ):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.dim = self.centroids.shape[1]
+        self.nprobe = nprobe
+        self.stale_ratio = stale_ratio
+        self.trained_size = 0
+        self.changes = 0
+        self._cells = [_Cell(c) for c in self.centroids]
+        self._where: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[str],
+        X: np.ndarray,
+        nlist: int = DEFAULT_NLIST,
+        iters: int = 10,
+        seed: int = 0,
+        **kwargs: Any,
+    ) -> "IVFIndex":
+        """Train centroids on ``X`` (a sample of it for large inputs) and insert every row."""
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) == 0:
+            raise ValueError("cannot train an IVF index on zero vectors")
+        index = cls(kmeans(X, nlist or auto_nlist(len(X)), iters=iters, seed=seed), **kwargs)
+        index.add_many(ids, X)
+        index.trained_size = len(X)
+        index.changes = 0
+        return index
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def stale(self) -> bool:
+        """True once changes since training exceed ``stale_ratio`` of the trained size."""
+        return self.trained_size == 0 or self.changes > self.stale_ratio * self.trained_size
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._where
+
+    # --- writes ---
+
+    def _remove(self, user_id: str) -> bool:
+        where = self._where.pop(user_id, None)
+        if where is None:
+            return False
+        cell, slot = where
+        moved = self._cells[cell].pop(slot)
+        if moved is not None:
+            self._where[moved] = (cell, slot)
+        return True
+
+    def add(self, user_id: str, vector) -> None:
+        """Insert ``user_id`` or move it to the cell of its new vector."""
+        self.add_many([user_id], np.asarray(vector, dtype=np.float32)[None])
+
+    def add_many(self, ids: Sequence[str], X: np.ndarray) -> None:
+        X = np.asarray(X, dtype=np.float32).reshape(len(ids), self.dim)
+        last = {user_id: i for i, user_id in enumerate(ids)}
+        if len(last) < len(ids):  # repeated id: its last vector wins
+            keep = sorted(last.values())
+            ids, X = [ids[i] for i in keep], X[keep]
+        labels = assign(X, self.centroids)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        with self._lock:
+            for user_id in ids:
+                self._remove(user_id)
+            for rows in np.split(order, bounds):
+                if not len(rows):
+                    continue
+                cell = int(labels[rows[0]])
+                members = [ids[i] for i in rows]
+                start = self._cells[cell].extend(members, X[rows])
+                for offset, user_id in enumerate(members):
+                    self._where[user_id] = (cell, start + offset)
+            self.changes += len(ids)
+
+    def remove(self, user_id: str) -> bool:
+        with self._lock:
+            removed = self._remove(user_id)
+            self.changes += removed
+            return removed
+
+    def sync(self, ids: Sequence[str], X: np.ndarray) -> int:
+        """Make the index hold exactly these (id, vector) rows; returns how many rows changed."""
+        X = np.asarray(X, dtype=np.float32)
+        wanted = set(ids)
+        with self._lock:
+            extra = [user_id for user_id in self._where if user_id not in wanted]
+            for user_id in extra:
+                self._remove(user_id)
+            self.changes += len(extra)
+            changed = []
+            for i, user_id in enumerate(ids):
+                where = self._where.get(user_id)
+                if where is None or not np.array_equal(self._cells[where[0]].X[where[1]], X[i]):
+                    changed.append(i)
+        if changed:
+            self.add_many([ids[i] for i in changed], X[changed])
+        return len(extra) + len(changed)
+
+    # --- reads ---
+
+    def search(
+        self,
+        query,
+        k: int,
+        nprobe: int | None = None,
+        exclude: str | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Ids and dot-product scores of the best ``k`` rows in the ``nprobe`` nearest cells, best first."""
+        ids, scores, _ = self.search_bounded(query, k, nprobe, exclude)
+        return ids, scores
+
+    def search_bounded(
+        self,
+        query,
+        k: int,
+        nprobe: int | None = None,
+        exclude: str | None = None,
+    ) -> tuple[np.ndarray, np.ndarray, float]:
+        """
+        ``search`` plus an upper bound on the score of every row it left out
+        (-inf when none was): the k-th score for rows cut from the probed
+        cells, q·centroid + radius·|q| for the cells it did not probe.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        skipped = np.ones(self.nlist, dtype=bool)
+        skipped[probe] = False
+        with self._lock:
+            cells = [self._cells[c] for c in probe if self._cells[c].n]
+            ids = np.concatenate([c.ids[: c.n] for c in cells]) if cells else np.empty(0, dtype=object)
+            scores = np.concatenate([c.X[: c.n] @ query for c in cells]) if cells else np.empty(0, dtype=np.float32)
+            rest = [(c, self._cells[c].radius) for c in np.flatnonzero(skipped).tolist() if self._cells[c].n]
+        bound = float("-inf")
+        if rest:
+            cells, radii = zip(*rest)
+            bound = float((centroid_scores[list(cells)] + np.array(radii) * np.linalg.norm(query)).max()) + 1e-5
+        if exclude is not None:
+            keep = ids != exclude
+            ids, scores = ids[keep], scores[keep]
+        k = min(k, len(scores))
+        if k <= 0:
+            return ids[:0], scores[:0], max([bound, *scores.tolist()])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if k < len(scores):
+            bound = max(bound, float(scores[top[-1]]))
+        return ids[top], scores[top], bound
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            sizes = np.array([c.n for c in self._cells])
+            return {
+                "size": len(self._where),
+                "nlist": self.nlist,
+                "nprobe": self.nprobe,
+                "cell_size_mean": round(float(sizes.mean()), 1),
+                "cell_size_max": int(sizes.max()),
+                "trained_size": self.trained_size,
+                "changes": self.changes,
+                "stale": self.stale,
+            }
+
+    # --- persistence ---
+
+    def save(self, path: str) -> None:
+        """Write centroids and cells to ``path`` (.npz), atomically."""
+        with self._lock:
+            counts = np.array([c.n for c in self._cells], dtype=np.int64)
+            ids = np.array([i for c in self._cells for i in c.ids[: c.n]], dtype=str)
+            X = np.concatenate([c.X[: c.n] for c in self._cells]) if len(ids) else np.empty((0, self.dim), np.float32)
+            meta = np.array([self.trained_size, self.changes], dtype=np.int64)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, counts=counts, ids=ids, X=X, meta=meta)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs: Any) -> "IVFIndex":
+        data = np.load(path, allow_pickle=False)
+        index = cls(data["centroids"], **kwargs)
+        ids, X, start = data["ids"].tolist(), data["X"], 0
+        for cell, count in enumerate(data["counts"]):
+            members = ids[start : start + count]
+            index._cells[cell].extend(members, X[start : start + count])
+            for slot, user_id in enumerate(members):
+                index._where[user_id] = (cell, slot)
+            start += count
+        index.trained_size, index.changes = (int(v) for v in data["meta"])
+        return index
+
+
+class AnnMaintainer:
+    """
+    Owns the IVF index attached to a VectorIndex. ``start`` loads the saved
+    index (reconciled with the current vectors) or trains one; ``refresh``
+    retrains when the attached index is missing or stale. Both work off-thread
+    from a snapshot, and the swap replays writes made meanwhile (see
+    VectorIndex.attach_ann). Every trained index is saved to ``path``.
+    """
+
+    def __init__(self, index, path: str, min_users: int = MIN_USERS, nlist: int = DEFAULT_NLIST, nprobe: int = DEFAULT_NPROBE):
+        self.index = index
+        self.path = path
+        self.min_users = min_users
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.builds = 0
+        self.last_build_s: float | None = None
+        self.error: str | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _spawn(self, target) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(target=target, daemon=True, name="ann-index")
+            self._thread.start()
+
+    def start(self) -> None:
+        self._spawn(self._load_or_train)
+
+    def refresh(self) -> None:
+        """Retrain in the background if the index is missing or stale and there are enough users (cheap to call per request)."""
+        ann = self.index.ann
+        if (ann is None or ann.stale) and len(self.index) >= self.min_users and not self.running:
+            self._spawn(self._train)
+
+    def _load_or_train(self) -> None:
+        if os.path.exists(self.path):
+            try:
+                ids, X, clock = self.index.snapshot()
+                ann = IVFIndex.load(self.path, nprobe=self.nprobe)
+                ann.sync(ids.tolist(), X)
+                self.index.attach_ann(ann, since=clock)
+            except (OSError, ValueError, KeyError) as e:
+                self.error = f"load failed: {e}"
+        if self.index.ann is None or self.index.ann.stale:
+            if len(self.index) >= self.min_users:
+                self._train()
+
+    def _train(self) -> None:
+        try:
+            start = time.perf_counter()
+            ids, X, clock = self.index.snapshot()
+            ann = IVFIndex.build(ids, X, nlist=self.nlist, nprobe=self.nprobe)
+            self.index.attach_ann(ann, since=clock)
+            ann.save(self.path)
+            self.builds += 1
+            self.last_build_s = round(time.perf_counter() - start, 3)
+            self.error = None
+        except Exception as e:  # keep serving exact scans; surface the failure in stats
+            self.error = f"train failed: {e}"
+
+    def stats(self) -> dict[str, Any]:
+        out = {
+            "path": self.path,
+            "min_users": self.min_users,
+            "building": self.running,
+            "builds": self.builds,
+            "last_build_s": self.last_build_s,
+            "in_use": self.index.ann is not None and not self.index.ann.stale,
+        }
+        if self.error:
+            out["error"] = self.error
+        return out
@@ -0,0 +1,115 @@
+"""Benchmark user-vector storage modes: memory per user, scan throughput, top-k agreement with float32.
+
+Synthetic clustered unit vectors by default, or the users table of a server DB:
+
+    python bench_vectors.py --users 1000000 --queries 50
+    python bench_vectors.py --db friend/friend.db
+    python bench_vectors.py --ann --nprobe 8,32,64      # IVF recall / latency per nprobe
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+from vector_quant import MODES, QuantizedMatrix
+from vector_store import unpack_vector
+
+
+def synthetic_vectors(n: int, dim: int = 64, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Unit vectors around random centroids (closer to real embeddings than isotropic noise)."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dim)).astype(np.float32)
+    X = centroids[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def db_vectors(db_path: str) -> np.ndarray:
+    conn = sqlite3.connect(db_path)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    fmt = "vector_format" if "vector_format" in columns else "NULL"  # DBs from before the binary column
+    rows = conn.execute(f"SELECT vector, {fmt} FROM users").fetchall()
+    conn.close()
+    return np.array([unpack_vector(value, fmt) for value, fmt in rows], dtype=np.float32)
+
+
+def run(X: np.ndarray, queries: np.ndarray, k: int = 10, rerank: int = 100) -> list[dict]:
+    exact_top = [set(np.argsort(-(X @ q))[:k]) for q in queries]
+    results = []
+    for mode in MODES:
+        qm = QuantizedMatrix.from_float32(X, mode)
+        qm.dot(queries[0])  # warm caches
+        t0 = time.perf_counter()
+        for q in queries:
+            qm.dot(q)
+        scan_s = (time.perf_counter() - t0) / len(queries)
+        row = {
+            "mode": mode,
+            "users": len(X),
+            "bytes_per_user": qm.bytes_per_vector,
+            "total_mb": round(qm.nbytes / 2**20, 2),
+            "scan_ms": round(scan_s * 1000, 3),
+            "scan_users_per_s": int(len(X) / scan_s),
+            f"top{k}_overlap": round(float(np.mean([
+                len(set(qm.top_k(q, k)[0]) & ref) / k for q, ref in zip(queries, exact_top)
+            ])), 4),
+        }
+        if mode != "float32" and rerank:
+            row[f"top{k}_overlap_rerank{rerank}"] = round(float(np.mean([
+                len(set(qm.top_k(q, k, exact=lambda idx: X[idx], rerank=rerank)[0]) & ref) / k
+                for q, ref in zip(queries, exact_top)
+            ])), 4)
+        results.append(row)
+    return results
+
+
+def run_ann(X: np.ndarray, queries: np.ndarray, k: int = 10, nlist: int = 0, nprobes: tuple[int, ...] = (32,)) -> list[dict]:
+    """Train an IVF index on X, then recall@k against the exact scan and query latency per nprobe."""
+    exact_top = [set(np.argsort(-(X @ q))[:k]) for q in queries]
+    t0 = time.perf_counter()
+    ann = IVFIndex.build(np.arange(len(X)), X, nlist=nlist)
+    build_s = time.perf_counter() - t0
+    results = []
+    for nprobe in nprobes:
+        t0 = time.perf_counter()
+        found = [ann.search(q, k, nprobe=nprobe)[0] for q in queries]
+        search_s = (time.perf_counter() - t0) / len(queries)
+        results.append({
+            "mode": "ivf",
+            "users": len(X),
+            "nlist": ann.nlist,
+            "nprobe": nprobe,
+            "build_s": round(build_s, 2),
+            "search_ms": round(search_s * 1000, 3),
+            f"recall@{k}": round(float(np.mean([len(set(f.tolist()) & ref) / k for f, ref in zip(found, exact_top)])), 4),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark float32 / float16 / int8 user-vector scoring.")
+    parser.add_argument("--users", type=int, default=200_000, help="synthetic user count")
+    parser.add_argument("--db", help="use the users table of this server DB instead")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=100)
+    parser.add_argument("--ann", action="store_true", help="benchmark the IVF index instead of the storage modes")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF cells (0 = auto)")
+    parser.add_argument("--nprobe", default="8,32,64", help="comma-separated nprobe values to sweep")
+    args = parser.parse_args()
+
+    X = db_vectors(args.db) if args.db else synthetic_vectors(args.users)
+    rng = np.random.default_rng(1)
+    queries = X[rng.choice(len(X), size=min(args.queries, len(X)), replace=False)]
+    if args.ann:
+        nprobes = tuple(int(v) for v in args.nprobe.split(","))
+        rows = run_ann(X, queries, k=args.k, nlist=args.nlist, nprobes=nprobes)
+    else:
+        rows = run(X, queries, k=args.k, rerank=args.rerank)
+    for row in rows:
+        print(json.dumps(row))
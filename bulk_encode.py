@@ -0,0 +1,170 @@
+"""Bulk sentence encoding for offline jobs: length-bucketed batches fanned out to worker processes.
+
+Inputs are sorted by approximate token length so each batch pads to a similar
+length, batches are spread over a pool of processes (each with its own
+encoder), and rows come back in the original order.
+
+Prime the shared embedding cache with every stored response string:
+
+    python bulk_encode.py --db friend/friend.db --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Callable, Iterator, Sequence
+
+import numpy as np
+
+from encoder_backends import DEFAULT_ENCODER, make_encoder
+
+Progress = Callable[[int, int], None]
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_worker_encoder = None
+
+
+def approx_tokens(text: str) -> int:
+    """Cheap token-count estimate (words + punctuation), good enough for bucketing."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def length_buckets(strings: Sequence[str], batch_size: int) -> list[list[int]]:
+    """Positions of strings grouped into batches of similar token length (longest first)."""
+    order = sorted(range(len(strings)), key=lambda i: -approx_tokens(strings[i]))
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _init_worker(backend: str | None, model_name: str, threads: int) -> None:
+    global _worker_encoder
+    import torch
+
+    torch.set_num_threads(threads)
+    _worker_encoder = make_encoder(backend, model_name)
+
+
+def _encode_batch(job: tuple[int, list[str], int]) -> tuple[int, np.ndarray]:
+    batch_id, texts, batch_size = job
+    return batch_id, _worker_encoder.encode(texts, batch_size=batch_size)
+
+
+def print_progress(done: int, total: int) -> None:
+    print(f"\rEncoded {done}/{total}", end="\n" if done == total else "", file=sys.stderr, flush=True)
+
+
+def iter_bulk_encode(
+    strings: Sequence[str],
+    workers: int | None = None,
+    batch_size: int = 64,
+    backend: str | None = None,
+    model_name: str = DEFAULT_ENCODER,
+) -> Iterator[tuple[list[int], np.ndarray]]:
+    """
+    Yield (positions, embeddings) per finished batch, in completion order.
+    ``workers`` <= 1 encodes in this process with the shared encoder.
+    """
+    buckets = length_buckets(strings, batch_size)
+    if not buckets:
+        return
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        from encoder_registry import get_encoder
+
+        encoder = get_encoder(backend, model_name)
+        for positions in buckets:
+            yield positions, encoder.encode([strings[i] for i in positions], batch_size=batch_size)
+        return
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    jobs = [(b, [strings[i] for i in positions], batch_size) for b, positions in enumerate(buckets)]
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(backend, model_name, threads)) as pool:
+        for batch_id, embeddings in pool.imap_unordered(_encode_batch, jobs):
+            yield buckets[batch_id], embeddings
+
+
+def bulk_encode(
+    strings: Sequence[str],
+    workers: int | None = None,
+    batch_size: int = 64,
+    backend: str | None = None,
+    model_name: str = DEFAULT_ENCODER,
+    cache=None,
+    progress: Progress | None = print_progress,
+    dim: int | None = None,
+) -> np.ndarray:
+    """
+    Encode strings into a (len(strings), dim) float32 matrix in input order.
+    With an EmbeddingCache, cached rows are reused and only unique misses are
+    encoded (and then stored). Empty input gives (0, dim): ``dim``, else the
+    cache's width, else the encoder's.
+    """
+    strings = list(strings)
+    if cache is not None:
+        out, missing = cache.lookup(strings)
+        todo = list(dict.fromkeys(strings[i] for i in missing))
+    else:
+        out, missing, todo = None, list(range(len(strings))), strings
+    total, done = len(todo), 0
+    encoded = None
+    for positions, embeddings in iter_bulk_encode(todo, workers, batch_size, backend, model_name):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if encoded is None:
+            encoded = np.zeros((total, embeddings.shape[1]), dtype=np.float32)
+        encoded[positions] = embeddings
+        done += len(positions)
+        if progress is not None:
+            progress(done, total)
+    if cache is None:
+        if encoded is None:
+            from encoder_registry import get_encoder
+
+            encoded = np.zeros((0, dim or get_encoder(backend, model_name).dim), dtype=np.float32)
+        return encoded
+    if todo:
+        cache.put_many(todo, encoded)
+        rows = {text: i for i, text in enumerate(todo)}
+        for i in missing:
+            out[i] = encoded[rows[strings[i]]]
+    return out
+
+
+def response_strings(db_path: str) -> list[str]:
+    """Every question and answer string stored in a responses table."""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT questions, answers FROM responses ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    strings = []
+    for questions, answers in rows:
+        strings.extend(json.loads(questions))
+        strings.extend(json.loads(answers))
+    return strings
+
+
+if __name__ == "__main__":
+    from embedding_cache import EmbeddingCache
+    from encoder_backends import DEFAULT_BACKEND, cache_name
+    from encoder_registry import get_encoder
+
+    parser = argparse.ArgumentParser(description="Encode every stored response string into the embedding cache.")
+    parser.add_argument("--db", required=True, nargs="+", help="SQLite database(s) with a responses table")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backend", default=DEFAULT_BACKEND)
+    args = parser.parse_args()
+
+    strings = [s for path in args.db for s in response_strings(path)]
+    cache = EmbeddingCache(cache_name(args.backend, DEFAULT_ENCODER), dim=get_encoder(args.backend, DEFAULT_ENCODER).dim)
+    t0 = time.perf_counter()
+    bulk_encode(strings, workers=args.workers, batch_size=args.batch_size, backend=args.backend, cache=cache)
+    print(f"{len(strings)} strings, {len(cache)} cached rows, {time.perf_counter() - t0:.1f}s")
+    cache.close()
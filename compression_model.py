@@ -22,11 +22,11 @@ class CompressionModel(nn.Module):
 
     def forward(self, Q: torch.Tensor, A: torch.Tensor) -> torch.Tensor:
         """
-        Q: (batch, 10, n), A: (batch, 10, n)
+        Q: (batch, 10, n), or one (10, n) block shared by the whole batch; A: (batch, 10, n)
         Returns: (batch, 64)
         """
-        # M[i,j] = dot(Q[i], A[j]) per batch
-        M_raw = torch.bmm(Q, A.transpose(1, 2))  # (B, 10, 10)
+        # M[i,j] = dot(Q[i], A[j]) per batch; a shared Q block is one matmul against all answers
+        M_raw = torch.matmul(A, Q.transpose(-1, -2)).transpose(-1, -2)  # (B, 10, 10)
 
         # Learned scale and bias on dot products
         M = self.dot_scale * M_raw + self.dot_bias
@@ -24,11 +24,11 @@ class CompressionModel5xn(nn.Module):
 
     def forward(self, Q: torch.Tensor, A: torch.Tensor) -> torch.Tensor:
         """
-        Q: (batch, 5, n), A: (batch, 5, n)
+        Q: (batch, 5, n), or one (5, n) block shared by the whole batch; A: (batch, 5, n)
         Returns: (batch, 64)
         """
-        # M[i,j] = dot(Q[i], A[j]) per batch
-        M_raw = torch.bmm(Q, A.transpose(1, 2))  # (B, 5, 5)
+        # M[i,j] = dot(Q[i], A[j]) per batch; a shared Q block is one matmul against all answers
+        M_raw = torch.matmul(A, Q.transpose(-1, -2)).transpose(-1, -2)  # (B, 5, 5)
 
         # Learned scale and bias on dot products
         M = self.dot_scale * M_raw + self.dot_bias
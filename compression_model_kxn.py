@@ -0,0 +1,89 @@
+"""PyTorch compression model: up to k×n Q/A (padding-masked) → 64-dim vector.
+
+Same parameters and math as CompressionModel (k=10) / CompressionModel5xn (k=5),
+so their checkpoints load unchanged; a mask over the k question slots lets
+profiles with fewer (or skipped) questions share one batched forward pass
+(numpy_runtime.pad_profiles builds the padded batch and mask).
+"""
+
+from typing import Optional
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class CompressionModelKxn(nn.Module):
+    def __init__(self, k: int = 10, n: int = 384):
+        super().__init__()
+        self.k = k
+        self.n = n
+
+        # Learned scale and bias for each k×k interaction element
+        self.dot_scale = nn.Parameter(torch.ones(k, k))
+        self.dot_bias = nn.Parameter(torch.zeros(k, k))
+
+        # w: 1×k aggregation over questions
+        self.w = nn.Parameter(torch.ones(1, k) / k)
+
+        # W: k×64 projection
+        self.proj = nn.Linear(k, 64)
+
+    def forward(self, Q: torch.Tensor, A: torch.Tensor, mask: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        Q: (batch, m, n) or one shared (m, n) block, A: (batch, m, n) with m <= k; shorter inputs are zero-padded to k.
+        mask: (batch, k), 1 = answered slot, 0 = padding/skipped. None means the
+        first m slots are present (all k for full-size input, i.e. the unmasked model).
+        Returns: (batch, 64)
+        """
+        B, m, _ = A.shape
+        if m < self.k:
+            pad = (0, 0, 0, self.k - m)
+            Q, A = F.pad(Q, pad), F.pad(A, pad)
+            if mask is None:
+                mask = torch.zeros(B, self.k, dtype=Q.dtype, device=Q.device)
+                mask[:, :m] = 1
+
+        M_raw = torch.matmul(A, Q.transpose(-1, -2)).transpose(-1, -2)  # (B, k, k)
+        M = F.relu(self.dot_scale * M_raw + self.dot_bias)
+
+        # Drop every interaction touching a padded slot: its row leaves the w aggregation,
+        # its column leaves z.
+        if mask is not None:
+            mask = mask.to(M.dtype)
+            M = M * (mask[:, :, None] * mask[:, None, :])
+
+        z = torch.matmul(self.w, M).squeeze(1)  # (B, k)
+        z = F.relu(z)
+
+        v = self.proj(z)  # (B, 64)
+        return v
+
+    @classmethod
+    def from_state_dict(cls, state: dict, k: Optional[int] = None, n: int = 384) -> "CompressionModelKxn":
+        """
+        Build from a CompressionModel / CompressionModel5xn / Kxn state dict. With a
+        larger ``k`` the checkpoint fills the leading block and the extra slots get
+        zero weights, so profiles of the checkpoint's size embed exactly as before.
+        """
+        k_ckpt = state["dot_scale"].shape[0]
+        model = cls(k=k or k_ckpt, n=n)
+        if model.k == k_ckpt:
+            model.load_state_dict(state)
+            return model
+        if model.k < k_ckpt:
+            raise ValueError(f"Cannot fit a {k_ckpt}-question checkpoint into k={model.k}")
+        with torch.no_grad():
+            for p in model.parameters():
+                p.zero_()
+            model.dot_scale[:k_ckpt, :k_ckpt] = state["dot_scale"]
+            model.dot_bias[:k_ckpt, :k_ckpt] = state["dot_bias"]
+            model.w[:, :k_ckpt] = state["w"]
+            model.proj.weight[:, :k_ckpt] = state["proj.weight"]
+            model.proj.bias.copy_(state["proj.bias"])
+        return model
+
+    @classmethod
+    def from_checkpoint(cls, path: str, k: Optional[int] = None, device="cpu") -> "CompressionModelKxn":
+        ckpt = torch.load(path, map_location=device, weights_only=True)
+        return cls.from_state_dict(ckpt["model_state_dict"], k=k, n=ckpt.get("n", 384)).to(device)
@@ -0,0 +1,206 @@
+"""CPU scheduling for the servers: bounded-concurrency pools for encoding, inference and vector scans.
+
+Left alone, every Flask request thread runs the sentence encoder and torch ops
+with intra-op threads on every core, so a few concurrent requests oversubscribe
+the CPU. Here the usable cores are split into per-pool budgets; each pool runs
+at most ``workers`` tasks at once on its own threads, and torch / BLAS
+intra-op threads are capped at the largest per-task core share. Callers block
+in ``run`` while their task waits for a slot, and each pool keeps queue wait,
+run time and utilization so pods can be sized from measurements.
+
+This limits concurrency only, it does not isolate the pools: all of them run
+in one process, torch and BLAS keep one process-wide intra-op thread pool
+(``limit_threads`` caps it for every pool at once), and the OS may schedule
+any task on any core. A pool's ``cores`` are the budget its worker count and
+thread share are derived from, not an affinity mask.
+
+CPU_POOLS overrides the split, as ``name=cores[/workers]`` pairs:
+
+    CPU_POOLS="encode=4/2,inference=2/1,scan=2/2"
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import numpy as np
+
+POOLS = ("encode", "inference", "scan")
+# Share of cores per pool when CPU_POOLS is unset
+DEFAULT_SHARES = {"encode": 0.5, "inference": 0.25, "scan": 0.25}
+
+
+def available_cores() -> list[int]:
+    """Cores this process may run on (respects cgroup / taskset affinity where the OS exposes it)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_spec(spec: str) -> dict[str, tuple[int, int | None]]:
+    """``"encode=4/2,scan=2"`` → {"encode": (4, 2), "scan": (2, None)}."""
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in POOLS:
+            raise ValueError(f"CPU_POOLS: unknown pool {name!r} (expected one of {POOLS})")
+        cores, _, workers = value.partition("/")
+        out[name] = (int(cores), int(workers) if workers else None)
+    return out
+
+
+def plan(cores: list[int], spec: str = "") -> dict[str, tuple[list[int], int]]:
+    """
+    Assign cores and a worker count to every pool. Pools get disjoint core
+    ranges while cores last; on small machines they share, so each pool
+    always has at least one core. Default workers: one per 2 cores for
+    encode / inference (batched torch work likes a couple of threads), one
+    per core for scan.
+    """
+    requested = parse_spec(spec)
+    n = len(cores)
+    sizes = {}
+    for name in POOLS:
+        if name in requested:
+            sizes[name] = max(1, requested[name][0])
+        else:
+            sizes[name] = max(1, int(n * DEFAULT_SHARES[name]))
+    out, start = {}, 0
+    for name in POOLS:
+        size = min(sizes[name], n)
+        if start + size > n:
+            start = 0
+        assigned = cores[start : start + size]
+        start += size
+        workers = requested.get(name, (0, None))[1]
+        if workers is None:
+            workers = len(assigned) if name == "scan" else max(1, len(assigned) // 2)
+        out[name] = (assigned, max(1, workers))
+    return out
+
+
+def limit_threads(threads: int) -> None:
+    """Cap torch and BLAS intra-op threads for the whole process (threadpoolctl used when installed)."""
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # already set, or inter-op work has started
+    except ImportError:
+        pass
+    try:
+        from threadpoolctl import threadpool_limits
+
+        threadpool_limits(limits=threads)
+    except ImportError:
+        pass
+
+
+class CorePool:
+    """Bounded-concurrency executor sized from a core budget, with queue-wait / utilization stats."""
+
+    def __init__(self, name: str, cores: list[int], workers: int, history: int = 1024):
+        self.name = name
+        self.cores = cores
+        self.workers = workers
+        self.threads = max(1, len(cores) // workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"cpu-{name}")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._max_queued = 0
+        self._tasks = 0
+        self._busy_s = 0.0
+        self._started = time.perf_counter()
+        self._waits_ms: deque = deque(maxlen=history)
+        self._runs_ms: deque = deque(maxlen=history)
+        self._recent: deque = deque(maxlen=history)  # (end time, busy seconds) for windowed utilization
+
+    def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run ``fn`` on one of this pool's threads and block for its result."""
+        if threading.current_thread().name.startswith(f"cpu-{self.name}"):
+            return fn(*args, **kwargs)  # nested call from this pool: don't wait on ourselves
+        submitted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+        def task():
+            start = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                with self._lock:
+                    self._active -= 1
+                    self._tasks += 1
+                    self._busy_s += end - start
+                    self._waits_ms.append((start - submitted) * 1000.0)
+                    self._runs_ms.append((end - start) * 1000.0)
+                    self._recent.append((end, end - start))
+
+        return self._executor.submit(task).result()
+
+    def stats(self, window_s: float = 60.0) -> dict:
+        """Workers, cores, queue depth, utilization (lifetime and last ``window_s``), wait / run percentiles."""
+        now = time.perf_counter()
+        with self._lock:
+            uptime = now - self._started
+            recent_busy = sum(busy for end, busy in self._recent if end >= now - window_s)
+            waits = np.array(self._waits_ms, dtype=np.float64)
+            runs = np.array(self._runs_ms, dtype=np.float64)
+            out = {
+                "cores": self.cores,
+                "workers": self.workers,
+                "threads_per_task": self.threads,
+                "active": self._active,
+                "queued": self._queued,
+                "max_queued": self._max_queued,
+                "tasks": self._tasks,
+                "utilization": round(self._busy_s / (self.workers * uptime), 4) if uptime > 0 else 0.0,
+                "utilization_recent": round(recent_busy / (self.workers * min(window_s, uptime)), 4) if uptime > 0 else 0.0,
+            }
+        if len(waits):
+            out["queue_wait_ms_p50"] = round(float(np.percentile(waits, 50)), 3)
+            out["queue_wait_ms_p99"] = round(float(np.percentile(waits, 99)), 3)
+            out["run_ms_p50"] = round(float(np.percentile(runs, 50)), 3)
+            out["run_ms_p99"] = round(float(np.percentile(runs, 99)), 3)
+        return out
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+class CpuScheduler:
+    """The encode / inference / scan pools for one server process."""
+
+    def __init__(self, spec: str | None = None, cores: list[int] | None = None):
+        spec = os.environ.get("CPU_POOLS", "") if spec is None else spec
+        self.pools = {
+            name: CorePool(name, assigned, workers)
+            for name, (assigned, workers) in plan(cores or available_cores(), spec).items()
+        }
+        self.threads = max(self.pools["encode"].threads, self.pools["inference"].threads)
+        limit_threads(self.threads)
+
+    def run(self, pool: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return self.pools[pool].run(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {"intra_op_threads": self.threads, **{name: p.stats() for name, p in self.pools.items()}}
+
+    def shutdown(self) -> None:
+        for p in self.pools.values():
+            p.shutdown()
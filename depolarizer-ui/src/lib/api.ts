@@ -44,6 +44,7 @@ export interface Match {
 export interface MatchesResponse {
   user_id: string;
   matches: Match[];
+  next_cursor?: string | null;
 }
 
 export async function fetchQuestions(): Promise<QuestionsResponse> {
@@ -70,6 +71,8 @@ export async function findMatches(params: {
   user_id?: string;
   questions?: string[];
   answers?: string[];
+  limit?: number;
+  cursor?: string;
 }): Promise<MatchesResponse> {
   const res = await fetch(`${API_BASE}/api/matches`, {
     method: "POST",
@@ -83,12 +86,14 @@ export async function findMatches(params: {
 
 export async function getMatches(
   userId: string,
-  opts?: { minSimilarity?: number; maxSimilarity?: number; includeSameStance?: boolean }
-): Promise<{ matches: Match[] }> {
+  opts?: { minSimilarity?: number; maxSimilarity?: number; includeSameStance?: boolean; limit?: number; cursor?: string }
+): Promise<{ matches: Match[]; next_cursor?: string | null }> {
   const params = new URLSearchParams({ user_id: userId });
   if (typeof opts?.minSimilarity === "number") params.set("min_similarity", String(opts.minSimilarity));
   if (typeof opts?.maxSimilarity === "number") params.set("max_similarity", String(opts.maxSimilarity));
   if (opts?.includeSameStance) params.set("include_same_stance", "true");
+  if (typeof opts?.limit === "number") params.set("limit", String(opts.limit));
+  if (opts?.cursor) params.set("cursor", opts.cursor);
   const res = await fetch(`${API_BASE}/api/matches?${params.toString()}`);
   const data = await res.json();
   if (!res.ok) throw new Error(data.error || "Failed to fetch matches");
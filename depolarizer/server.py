@@ -6,10 +6,9 @@ import random
 import sqlite3
 import string
 import sys
+import threading
 
 import numpy as np
-import torch
-import torch.nn.functional as F
 
 _here = os.path.dirname(os.path.abspath(__file__))
 _parent = os.path.dirname(_here)
@@ -23,7 +22,22 @@ UI_BASE = os.environ.get("DEPOLARIZER_UI", "http://localhost:3000")
 
 # Depolarizer uses its own response_modify and train_political (run from depolarizer/)
 sys.path.insert(0, _here)
-from response_modify import to_matrix
+from embedding_store import ensure_embedding_columns, insert_response
+import model_artifacts
+from embed_service import MAX_EMBED_BATCH, EmbedService, register_admin_routes
+from model_registry import ModelRegistry, ensure_version_column
+from vector_store import (
+    WRITE_FORMAT,
+    check_vector,
+    ensure_vector_format_column,
+    load_vectors,
+    pack_vector,
+    unpack_vector,
+)
+from question_bank import QuestionBank
+from vector_index import PartitionedIndex
+from match_pages import encode_cursor, pair_jitter, parse_page_args, select_page, user_jitter
+from response_modify import embedding_dim, encoder_identity, set_projection, to_matrix, warmup as warmup_encoder
 from train_political import load_checkpoint, get_device
 
 app = Flask(__name__, static_folder=".", static_url_path="")
@@ -37,7 +51,7 @@ def _cors(resp):
     return resp
 
 SIMILARITY_THRESHOLD = 75.0  # Must be >= 75% similar to match
-POLITICAL_STANCES = [
+CANONICAL_STANCES = [
     "far-left",
     "left-leaning",
     "moderate-left",
@@ -45,12 +59,22 @@ POLITICAL_STANCES = [
     "moderate-right",
     "right-leaning",
     "far-right",
-    # Backward compatibility with older saved values
-    "progressive",
-    "conservative",
-    "moderate",
 ]
-STANCE_ERROR_MSG = f"political_stance required ({', '.join(POLITICAL_STANCES[:7])})"
+# Backward compatibility with older saved values: folded into a canonical stance
+STANCE_ALIASES = {
+    "progressive": "left-leaning",
+    "conservative": "right-leaning",
+    "moderate": "centrist",
+    "left": "left-leaning",
+    "right": "right-leaning",
+    "center-left": "moderate-left",
+    "center-right": "moderate-right",
+    "center": "centrist",
+}
+POLITICAL_STANCES = CANONICAL_STANCES + list(STANCE_ALIASES)
+LEFT_STANCES = {"far-left", "left-leaning", "moderate-left"}
+RIGHT_STANCES = {"moderate-right", "right-leaning", "far-right"}
+STANCE_ERROR_MSG = f"political_stance required ({', '.join(CANONICAL_STANCES)})"
 
 GLOBAL_QUESTIONS = [
     "Do you believe the government should take an active role in solving social problems, or should individuals and private organizations handle them?",
@@ -73,10 +97,15 @@ Q11_POLITICAL_STANCE = {
     ],
 }
 
-_model = None
-_device = None
 _db_path = os.path.join(_here, "depolarizer.db")
 _niche_pool = []
+_question_bank = None
+_service = EmbedService(10, lambda questions: _question_matrix(questions), to_matrix, load_checkpoint, set_projection)
+_index = PartitionedIndex(
+    "political_stance", columns=("emoji", "jitter"), exact=lambda ids: load_vectors(_db_path, ids)
+)
+_setup_lock = threading.Lock()
+_setup_done = False
 
 
 def get_db():
@@ -90,9 +119,11 @@ def init_db():
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
-            vector TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            vector_format TEXT,
             political_stance TEXT NOT NULL,
             city TEXT NOT NULL DEFAULT '',
+            model_version TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         CREATE TABLE IF NOT EXISTS responses (
@@ -100,11 +131,16 @@ def init_db():
             user_id TEXT NOT NULL,
             questions TEXT NOT NULL,
             answers TEXT NOT NULL,
+            q_embeddings BLOB,
+            a_embeddings BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users(id)
         );
     """)
     conn.commit()
+    ensure_embedding_columns(conn)
+    ensure_version_column(conn)
+    ensure_vector_format_column(conn)
     conn.close()
 
 
@@ -119,9 +155,24 @@ def _load_niche_pool():
         _niche_pool = []
 
 
+def _load_question_bank():
+    """Embed the global + niche political question universe once, or load it from question_embeddings.npy."""
+    global _question_bank
+    texts = GLOBAL_QUESTIONS + [qa["question"] for qa in _niche_pool]
+    path = os.path.join(_here, "question_embeddings.npy")
+    _question_bank = QuestionBank.load_or_build(
+        path, texts, to_matrix, dim=embedding_dim(), identity=encoder_identity()
+    )
+
+
+def _question_matrix(questions: list[str]) -> np.ndarray:
+    if _question_bank is None:
+        return to_matrix(questions)
+    return _question_bank.encode(questions, to_matrix)
+
+
 def _load_models():
-    global _model, _device
-    _device = get_device()
+    _service.device = get_device()
     # Check depolarizer/ first, then project root
     model_path = os.path.join(_here, "political_compression_model.pt")
     if not os.path.exists(model_path):
@@ -130,22 +181,8 @@ def _load_models():
         raise FileNotFoundError(
             f"Model not found: {model_path}. Run python depolarizer/train_political.py first."
         )
-    _model, _ = load_checkpoint(path=model_path, device=_device)
-    _model.eval()
-
-
-def _embed(questions: list[str], answers: list[str]) -> list[float]:
-    """Compute political compatibility embedding from 10 Q/A."""
-    if len(questions) != 10 or len(answers) != 10:
-        raise ValueError("Need exactly 10 questions and 10 answers")
-    embeddings = to_matrix(questions + answers)
-    n = 10
-    Q = torch.tensor(embeddings[:n], dtype=torch.float32, device=_device).unsqueeze(0)
-    A = torch.tensor(embeddings[n : 2 * n], dtype=torch.float32, device=_device).unsqueeze(0)
-    with torch.no_grad():
-        v = _model(Q, A)
-        v = F.normalize(v, dim=-1)
-        return v.cpu().numpy().flatten().tolist()
+    _service.registry = ModelRegistry(model_path, _service.load_model_file)
+    print(f"Active model version: {_service.registry.start()}")
 
 
 def _cosine_sim(vec_a: list[float], vec_b: list[float]) -> float:
@@ -154,42 +191,105 @@ def _cosine_sim(vec_a: list[float], vec_b: list[float]) -> float:
     return float(np.dot(a, b))
 
 
-def _similarity_to_pct(sim: float) -> float:
-    return ((sim + 1) / 2) * 100
+def _normalize_stance(value: str | None) -> str | None:
+    """Canonical stance for a submitted or stored value (case, spacing and legacy aliases folded); None if unrecognized."""
+    key = (value or "").strip().lower().replace("_", "-").replace(" ", "-")
+    return key if key in CANONICAL_STANCES else STANCE_ALIASES.get(key)
 
 
-def _stances_differ(s1: str, s2: str) -> bool:
-    """True if two users have meaningfully different political stances."""
-    if not s1 or not s2:
-        return False
-    return s1.lower() != s2.lower()
+def _stance_key(value: str | None) -> str:
+    """Index partition of a stored stance: canonical when recognized, else the lowercased value; empty = centrist."""
+    return _normalize_stance(value) or (value or "").strip().lower() or "centrist"
 
 
-def _generate_user_id() -> str:
-    return "DP-" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
+def _index_row(user_id: str, vector: list[float], political_stance: str | None) -> tuple[str, list[float], dict]:
+    """(id, vector, metadata) row for the resident index: canonical stance (the partition) plus its emoji."""
+    stance = _stance_key(political_stance)
+    if stance in LEFT_STANCES:
+        emoji = "🔵"
+    elif stance in RIGHT_STANCES:
+        emoji = "🔴"
+    else:
+        emoji = "🟣"
+    return user_id, vector, {"political_stance": stance, "emoji": emoji, "jitter": user_jitter(user_id)}
 
 
-def _load_users_from_db(exclude_id: str = None) -> list[dict]:
+def _load_index():
+    """Load every stored user into the resident vector index (once, at startup)."""
     conn = get_db()
-    cur = conn.execute(
-        "SELECT id, vector, political_stance, city FROM users"
-    )
-    rows = cur.fetchall()
+    rows = conn.execute("SELECT id, vector, vector_format, political_stance FROM users").fetchall()
     conn.close()
-
-    users = []
+    added = []
     for row in rows:
-        if exclude_id and row["id"] == exclude_id:
+        try:
+            vec = check_vector(unpack_vector(row["vector"], row["vector_format"]))
+        except ValueError as e:
+            print(f"Skipping user {row['id']} in the vector index: {e}")
             continue
-        vec = json.loads(row["vector"])
-        users.append({
-            "id": row["id"],
-            "vector": vec,
-            "political_stance": row["political_stance"] or "moderate",
-            "distance": round(random.uniform(0.5, 12), 1),
-            "emoji": "🔵" if (row["political_stance"] or "").lower() in {"far-left", "left-leaning", "moderate-left", "left", "center-left", "progressive"} else ("🔴" if (row["political_stance"] or "").lower() in {"moderate-right", "right-leaning", "far-right", "right", "center-right", "conservative"} else "🟣"),
-        })
-    return users
+        added.append(_index_row(row["id"], vec, row["political_stance"]))
+    _index.upsert_many(added)
+
+
+def _similarity_to_pct(sim: float) -> float:
+    return ((sim + 1) / 2) * 100
+
+
+def _generate_user_id() -> str:
+    return "DP-" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
+
+
+def _match_results(
+    user_vec: list[float],
+    user_id: str,
+    user_stance: str,
+    min_similarity: float | None = SIMILARITY_THRESHOLD,
+    max_similarity: float | None = None,
+    include_same_stance: bool = False,
+    limit: int | None = None,
+    after: tuple[float, str] | None = None,
+) -> tuple[list[dict], str | None]:
+    """
+    Score the other indexed users against user_vec (scan CPU pool), keep those within the
+    similarity window, best match first. Only partitions of other stances are scanned
+    (all with include_same_stance), and partitions that cannot reach min_similarity are skipped.
+    Returns the page after ``after`` (at most ``limit`` matches) and the cursor of the next page.
+    """
+    stance = _stance_key(user_stance)
+    partitions = None if include_same_stance else [p for p in _index.partitions() if p != stance]
+    min_score = None if min_similarity is None else 2 * min_similarity / 100 - 1  # inverse of _similarity_to_pct
+    ids, sims, meta = _service.on_pool("scan", _index.search, user_vec, user_id, partitions, min_score)
+    distance = np.round(0.5 + 11.5 * pair_jitter(user_id, meta["jitter"]), 1)
+    pct = _similarity_to_pct(sims.astype(np.float64))
+    keep = np.ones(len(ids), dtype=bool)
+    if min_similarity is not None:
+        keep &= pct >= min_similarity
+    if max_similarity is not None:
+        keep &= pct < max_similarity
+    rows = np.flatnonzero(keep)
+    dist_penalty = np.minimum(10, distance * 0.5)
+    if min_similarity is not None and min_similarity >= SIMILARITY_THRESHOLD and max_similarity is None:
+        match_score = np.clip(pct - dist_penalty, SIMILARITY_THRESHOLD, 100)
+    else:
+        match_score = np.clip(pct - dist_penalty, 0, 100)
+    match_score = np.round(match_score, 1)
+    page, next_after = select_page(match_score[rows], ids[rows], limit, after)
+    order = rows[page]
+    matches = [
+        {
+            "id": uid,
+            "emoji": emoji,
+            "matchScore": score,
+            "similarityScore": round(sim, 1),
+            "politicalStance": stance,
+            "distance": dist,
+            "traits": f"Political stance: {stance.title()}",
+        }
+        for uid, emoji, score, sim, stance, dist in zip(
+            ids[order].tolist(), meta["emoji"][order].tolist(), match_score[order].tolist(),
+            pct[order].tolist(), meta["political_stance"][order].tolist(), distance[order].tolist(),
+        )
+    ]
+    return matches, encode_cursor(*next_after) if next_after else None
 
 
 # --- Routes ---
@@ -228,7 +328,12 @@ def health():
     conn = get_db()
     count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
     conn.close()
-    return jsonify({"ok": True, "db_size": count})
+    result = {"db_size": count, "index": _index.stats()}
+    result, status = _service.health(result)
+    return jsonify(result), status
+
+
+register_admin_routes(app, _service, lambda: _db_path, embedding_dim, _index.update_vectors)
 
 
 @app.route("/api/questions", methods=["GET"])
@@ -249,149 +354,209 @@ def get_questions():
 @app.route("/api/embed", methods=["POST"])
 def embed():
     """
-    Compute embedding from 10 political Q/A.
+    Compute embedding from up to 10 political Q/A (a null or blank answer is a skipped question).
     Body: { questions, answers }
-    Returns { vector }
+    Returns { vector, model_version }
     """
     data = request.get_json()
-    if not data or "questions" not in data or "answers" not in data:
-        return jsonify({"error": "questions and answers required"}), 400
-    questions = data["questions"]
-    answers = data["answers"]
-    if len(questions) != 10 or len(answers) != 10:
-        return jsonify({"error": "need exactly 10 questions and 10 answers"}), 400
     try:
-        vec = _embed(questions, answers)
-        return jsonify({"vector": vec})
+        questions, answers = _service.profile_pair(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        vec, _, _, version = _service.embed_full(questions, answers)
+        return jsonify({"vector": vec, "model_version": version})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/embed-batch", methods=["POST"])
+def embed_batch():
+    """
+    Compute embeddings for many profiles with one encoder pass and one forward pass.
+    Body: { profiles: [{ questions, answers, political_stance?, city? }, ...], save? }
+    political_stance is required per profile when save is set.
+    Returns { results, errors }: one entry per profile in request order, either
+    { vector, model_version } (plus user_id when saved) or { error }. Saved users are inserted in one transaction.
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get("profiles"), list):
+        return jsonify({"error": "profiles array required"}), 400
+    items = data["profiles"]
+    if len(items) > MAX_EMBED_BATCH:
+        return jsonify({"error": f"at most {MAX_EMBED_BATCH} profiles per batch"}), 400
+    save = bool(data.get("save"))
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        try:
+            questions, answers = _service.profile_pair(item)
+            stance = item.get("political_stance")
+            if save and _normalize_stance(stance) is None:
+                raise ValueError(STANCE_ERROR_MSG)
+            user = (_normalize_stance(stance) or "", str(item.get("city", "")))
+        except ValueError as e:
+            results[i] = {"error": str(e)}
+            continue
+        valid.append((i, questions, answers, user))
+    try:
+        embedded = _service.embed_batch([(q, a) for _, q, a, _ in valid]) if valid else []
+        for (i, _, _, _), (vec, _, _, version) in zip(valid, embedded):
+            results[i] = {"vector": vec, "model_version": version}
+        if save and valid:
+            added = []
+            conn = get_db()
+            try:
+                for (i, questions, answers, (political_stance, city)), (vec, Q, A, version) in zip(valid, embedded):
+                    user_id = _generate_user_id()
+                    conn.execute(
+                        "INSERT INTO users (id, vector, vector_format, political_stance, city, model_version) VALUES (?, ?, ?, ?, ?, ?)",
+                        (user_id, pack_vector(vec), WRITE_FORMAT, political_stance, city, version),
+                    )
+                    insert_response(conn, user_id, json.dumps(questions), json.dumps(answers), Q, A)
+                    results[i]["user_id"] = user_id
+                    added.append(_index_row(user_id, vec, political_stance))
+                conn.commit()
+            finally:
+                conn.close()
+            _index.upsert_many(added)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"results": results, "errors": len(items) - len(valid)})
+
+
 @app.route("/api/matches", methods=["GET"])
 def get_matches():
-    """Returns depolarizer matches for existing user with optional similarity filters."""
+    """
+    Returns depolarizer matches for existing user with optional similarity filters.
+    Query: user_id, min_similarity?, max_similarity?, include_same_stance?, limit?, cursor?
+    With limit, returns one page and next_cursor (null on the last page); pass it back as cursor.
+    """
     user_id = request.args.get("user_id")
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     min_similarity = request.args.get("min_similarity", type=float)
     max_similarity = request.args.get("max_similarity", type=float)
     include_same_stance = (request.args.get("include_same_stance", "false") or "").lower() in {"1", "true", "yes"}
     if min_similarity is None:
         min_similarity = SIMILARITY_THRESHOLD
-    conn = get_db()
-    row = conn.execute(
-        "SELECT vector, political_stance FROM users WHERE id = ?", (user_id,)
-    ).fetchone()
-    conn.close()
-    if not row:
+    user_vec = _index.vector(user_id)
+    if user_vec is None:
         return jsonify({"error": "user not found"}), 404
-    user_vec = json.loads(row["vector"])
-    user_stance = row["political_stance"] or "moderate"
-
-    db_users = _load_users_from_db(exclude_id=user_id)
-    results = []
-    for u in db_users:
-        raw_sim = _cosine_sim(user_vec, u["vector"])
-        pct = _similarity_to_pct(raw_sim)
-        if min_similarity is not None and pct < min_similarity:
-            continue
-        if max_similarity is not None and pct >= max_similarity:
-            continue
-        if not include_same_stance and not _stances_differ(user_stance, u["political_stance"]):
-            continue
-        dist_penalty = min(10, u["distance"] * 0.5)
-        if min_similarity >= SIMILARITY_THRESHOLD and max_similarity is None:
-            match_score = max(SIMILARITY_THRESHOLD, min(100, pct - dist_penalty))
-        else:
-            match_score = max(0, min(100, pct - dist_penalty))
-        results.append({
-            "id": u["id"],
-            "emoji": u["emoji"],
-            "matchScore": round(match_score, 1),
-            "similarityScore": round(pct, 1),
-            "politicalStance": u["political_stance"],
-            "distance": u["distance"],
-            "traits": f"Political stance: {u['political_stance'].title()}",
-        })
-    results.sort(key=lambda x: -x["matchScore"])
-    return jsonify({"matches": results})
+    user_stance = _index.get(user_id, "political_stance")
+    matches, next_cursor = _match_results(
+        user_vec, user_id, user_stance, min_similarity, max_similarity, include_same_stance, limit, after
+    )
+    if limit is None:
+        return jsonify({"matches": matches})
+    return jsonify({"matches": matches, "next_cursor": next_cursor})
 
 
 @app.route("/api/matches", methods=["POST"])
 def matches():
     """
     Register user and return depolarizer matches.
-    Body: { vector, political_stance, city, user_id?, questions?, answers? }
-    Matches: >= 75% similar AND differing political stance.
+    Body: { vector, political_stance, city, user_id?, questions?, answers?, limit?, cursor? }
+    Matches: >= 75% similar AND differing political stance; limit / cursor page them as in GET.
     """
     data = request.get_json()
     if not data or "vector" not in data:
         return jsonify({"error": "vector required"}), 400
-    if "political_stance" not in data or data["political_stance"] not in POLITICAL_STANCES:
+    political_stance = _normalize_stance(data.get("political_stance"))
+    if political_stance is None:
         return jsonify({"error": STANCE_ERROR_MSG}), 400
+    try:
+        limit, after = parse_page_args(data)
+        user_vec = check_vector(data["vector"]).tolist()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    user_vec = data["vector"]
-    political_stance = data["political_stance"].lower()
     city = data.get("city", "")
     user_id = data.get("user_id")
     questions = data.get("questions")
     answers = data.get("answers")
+    model_version = _service.registry.active_version  # set server-side; a client-sent model_version is ignored
 
-    conn = get_db()
-
-    if user_id:
-        conn.execute(
-            "UPDATE users SET vector=?, political_stance=?, city=? WHERE id=?",
-            (json.dumps(user_vec), political_stance, city, user_id),
-        )
-    else:
-        user_id = _generate_user_id()
-        conn.execute(
-            "INSERT INTO users (id, vector, political_stance, city) VALUES (?, ?, ?, ?)",
-            (user_id, json.dumps(user_vec), political_stance, city),
-        )
-
+    # The profile's raw Q/A embeddings (a profile-memo hit after /api/embed), before any write
+    raw = None
     if questions and answers:
-        conn.execute(
-            "INSERT INTO responses (user_id, questions, answers) VALUES (?, ?, ?)",
-            (user_id, json.dumps(questions), json.dumps(answers)),
-        )
+        try:
+            raw = _service.raw_embeddings(questions, answers)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
 
-    conn.commit()
-    conn.close()
-
-    db_users = _load_users_from_db(exclude_id=user_id)
-    results = []
-    for u in db_users:
-        raw_sim = _cosine_sim(user_vec, u["vector"])
-        pct = _similarity_to_pct(raw_sim)
-        if pct < SIMILARITY_THRESHOLD:
-            continue
-        if not _stances_differ(political_stance, u["political_stance"]):
-            continue
-        dist_penalty = min(10, u["distance"] * 0.5)
-        match_score = max(SIMILARITY_THRESHOLD, min(100, pct - dist_penalty))
-        results.append({
-            "id": u["id"],
-            "emoji": u["emoji"],
-            "matchScore": round(match_score, 1),
-            "similarityScore": round(pct, 1),
-            "politicalStance": u["political_stance"],
-            "distance": u["distance"],
-            "traits": f"Political stance: {u['political_stance'].title()}",
-        })
-
-    results.sort(key=lambda x: -x["matchScore"])
-    return jsonify({"user_id": user_id, "matches": results})
+    conn = get_db()
+    try:
+        if user_id:
+            stored = conn.execute(
+                "UPDATE users SET vector=?, vector_format=?, political_stance=?, city=?, model_version=? WHERE id=?",
+                (pack_vector(user_vec), WRITE_FORMAT, political_stance, city, model_version, user_id),
+            ).rowcount
+        else:
+            user_id = _generate_user_id()
+            conn.execute(
+                "INSERT INTO users (id, vector, vector_format, political_stance, city, model_version) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, pack_vector(user_vec), WRITE_FORMAT, political_stance, city, model_version),
+            )
+            stored = 1
+
+        if raw is not None:
+            insert_response(conn, user_id, json.dumps(questions), json.dumps(answers), *raw)
+        conn.commit()
+    finally:
+        conn.close()
+    if stored:  # an unknown user_id updates nothing, so it stays out of the index too
+        _index.upsert_many([_index_row(user_id, user_vec, political_stance)])
+
+    matches, next_cursor = _match_results(user_vec, user_id, political_stance, limit=limit, after=after)
+    if limit is None:
+        return jsonify({"user_id": user_id, "matches": matches})
+    return jsonify({"user_id": user_id, "matches": matches, "next_cursor": next_cursor})
+
+
+def setup():
+    """
+    Load the models, question bank, database and vector index, then start the
+    background warmup. Runs once: from __main__, or on the first request when
+    the app is served by a WSGI server instead.
+    """
+    global _setup_done
+    with _setup_lock:
+        if _setup_done:
+            return
+        print("Configuring CPU pools...")
+        _service.start_cpu_pools()
+        print("Loading political compression model...")
+        _load_models()
+        print("Loading sentence encoder...")
+        warmup_encoder()
+        print("Loading niche political questions...")
+        _load_niche_pool()
+        print("Embedding question bank...")
+        _load_question_bank()
+        print("Starting embedding micro-batcher...")
+        _service.start_batcher()
+        print("Initializing database...")
+        init_db()
+        print("Loading vector index...")
+        _load_index()
+        print(f"Warming up ({model_artifacts.RUNTIME} runtime) in the background...")
+        _service.start_warmup(_question_bank.texts)
+        _setup_done = True
+
+
+@app.before_request
+def _setup_on_first_request():
+    if not _setup_done:
+        setup()
 
 
 if __name__ == "__main__":
-    print("Loading political compression model...")
-    _load_models()
-    print("Loading niche political questions...")
-    _load_niche_pool()
-    print("Initializing database...")
-    init_db()
+    setup()
     port = int(os.environ.get("PORT", 6262))
     print(f"Depolarizer ready. Open http://127.0.0.1:{port}")
     app.run(host="0.0.0.0", port=port, debug=True, use_reloader=False)
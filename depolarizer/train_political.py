@@ -14,12 +14,31 @@ if PROJECT_ROOT not in sys.path:
 import numpy as np
 import torch
 
-from response_modify import vectorize_pair
+from response_modify import embedding_dim, encoder_identity, projection_state, set_projection, to_matrix
+from dim_reduction import Projection
 from compression_model import CompressionModel, SimilarityConsistencyLoss
+from embedding_bank import EmbeddingBank
 
 POLITICAL_ANSWERS_PATH = os.path.join(PROJECT_ROOT, "political_answers.json")
 NICHE_POLITICAL_PATH = os.path.join(PROJECT_ROOT, "niche_political_questions.json")
 SAVE_PATH = os.path.join(PROJECT_ROOT, "political_compression_model.pt")
+# .npy + .json written by `python train_political.py --encode-corpus`
+BANK_PATH = os.path.join(SCRIPT_DIR, "corpus_embeddings")
+
+GLOBAL_QUESTIONS = [
+    "Do you believe the government should take an active role in solving social problems, or should individuals and private organizations handle them?",
+    "Which is more important to you: economic growth even if it increases inequality, or reducing inequality even if it slows growth?",
+    "Should society prioritize preserving traditional values or adapting to changing social norms?",
+    "How urgent is it for governments to take strong action against climate change?",
+    "Do you think a country should focus more on global cooperation or prioritize national interests?",
+]
+GLOBAL_ANSWER_KEYS = [
+    "q1_role_of_government",
+    "q2_economic_priorities",
+    "q3_social_change_tradition",
+    "q4_climate_environment",
+    "q5_global_vs_local",
+]
 
 
 def get_device() -> torch.device:
@@ -46,27 +65,14 @@ def build_user_profile(
     Q1-5: global political questions with the user's answers.
     Q6-10: randomly sampled niche political questions with their answers.
     """
-    global_questions = [
-        "Do you believe the government should take an active role in solving social problems, or should individuals and private organizations handle them?",
-        "Which is more important to you: economic growth even if it increases inequality, or reducing inequality even if it slows growth?",
-        "Should society prioritize preserving traditional values or adapting to changing social norms?",
-        "How urgent is it for governments to take strong action against climate change?",
-        "Do you think a country should focus more on global cooperation or prioritize national interests?",
-    ]
     ans = political_entry["answers"]
-    global_answers = [
-        ans["q1_role_of_government"],
-        ans["q2_economic_priorities"],
-        ans["q3_social_change_tradition"],
-        ans["q4_climate_environment"],
-        ans["q5_global_vs_local"],
-    ]
+    global_answers = [ans[key] for key in GLOBAL_ANSWER_KEYS]
 
     niche_sample = rng.sample(niche_pool, 5)
     niche_questions = [qa["question"] for qa in niche_sample]
     niche_answers = [qa["answer"] for qa in niche_sample]
 
-    questions = global_questions + niche_questions
+    questions = GLOBAL_QUESTIONS + niche_questions
     answers = global_answers + niche_answers
     return questions, answers
 
@@ -90,23 +96,40 @@ def build_pairs(political: dict, niche: dict, n_pairs: int, seed: int = 42) -> l
     return pairs
 
 
-def collate_batch(pairs: list, device: torch.device) -> tuple:
-    """Vectorize a batch of pairs and return (Q1, A1, Q2, A2) tensors."""
-    Q1_list, A1_list, Q2_list, A2_list = [], [], [], []
+def corpus_strings(political: dict, niche: dict) -> list[str]:
+    """Every string build_user_profile can emit: global questions, global answers, niche Q/A."""
+    strings = list(GLOBAL_QUESTIONS)
+    for entry in political["responses"]:
+        strings.extend(entry["answers"][key] for key in GLOBAL_ANSWER_KEYS)
+    for qa in niche["qa_pairs"]:
+        strings.extend((qa["question"], qa["answer"]))
+    return strings
 
-    for q1, a1, q2, a2 in pairs:
-        Q1, A1, Q2, A2 = vectorize_pair(q1, a1, q2, a2)
-        Q1_list.append(Q1)
-        A1_list.append(A1)
-        Q2_list.append(Q2)
-        A2_list.append(A2)
 
-    Q1 = torch.tensor(np.stack(Q1_list), dtype=torch.float32, device=device)
-    A1 = torch.tensor(np.stack(A1_list), dtype=torch.float32, device=device)
-    Q2 = torch.tensor(np.stack(Q2_list), dtype=torch.float32, device=device)
-    A2 = torch.tensor(np.stack(A2_list), dtype=torch.float32, device=device)
+def encode_corpus(political: dict, niche: dict, dtype=np.float32) -> EmbeddingBank:
+    """
+    Offline step: encode the whole training corpus once into BANK_PATH (.npy + .json).
+    Reuses the saved bank when it already covers the corpus and was encoded with the active encoder and projection.
+    """
+    return EmbeddingBank.load_or_build(
+        BANK_PATH,
+        corpus_strings(political, niche),
+        to_matrix,
+        dtype=dtype,
+        dim=embedding_dim(),
+        identity=encoder_identity(),
+    )
+
 
-    return Q1, A1, Q2, A2
+def index_pairs(pairs: list, bank: EmbeddingBank) -> np.ndarray:
+    """Turn (q1, a1, q2, a2) string pairs into a (n_pairs, 4, 10) array of bank row ids."""
+    return np.array([[bank.ids(part) for part in pair] for pair in pairs], dtype=np.int64)
+
+
+def collate_batch(idx: np.ndarray, bank: EmbeddingBank, device: torch.device) -> tuple:
+    """Gather a batch of indexed pairs from the bank and return (Q1, A1, Q2, A2) tensors."""
+    rows = torch.from_numpy(bank.gather(idx)).to(device)  # (B, 4, 10, n)
+    return rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
 
 
 def save_checkpoint(model, loss_fn, epoch, loss, path=SAVE_PATH):
@@ -116,16 +139,21 @@ def save_checkpoint(model, loss_fn, epoch, loss, path=SAVE_PATH):
             "loss": loss,
             "model_state_dict": model.state_dict(),
             "loss_fn_state_dict": loss_fn.state_dict(),
+            "n": model.n,
+            "projection": projection_state(),
         },
         path,
     )
 
 
 def load_checkpoint(path=SAVE_PATH, device=None):
+    """Load model + loss; also switches to_matrix to the encoder projection the checkpoint was trained with."""
     device = device or get_device()
-    model = CompressionModel(n=384).to(device)
-    loss_fn = SimilarityConsistencyLoss().to(device)
     ckpt = torch.load(path, map_location=device, weights_only=True)
+    projection = ckpt.get("projection")
+    set_projection(Projection.from_dict(projection) if projection else None)
+    model = CompressionModel(n=ckpt.get("n", 384)).to(device)
+    loss_fn = SimilarityConsistencyLoss().to(device)
     model.load_state_dict(ckpt["model_state_dict"])
     loss_fn.load_state_dict(ckpt["loss_fn_state_dict"])
     print(f"Loaded checkpoint from epoch {ckpt['epoch']} (loss={ckpt['loss']:.4f})")
@@ -150,14 +178,15 @@ def train(
         f"{niche['total']} niche political Q/A pairs"
     )
 
-    model = CompressionModel(n=384).to(device)
+    model = CompressionModel(n=embedding_dim()).to(device)
     loss_fn = SimilarityConsistencyLoss().to(device)
     opt = torch.optim.Adam(
         list(model.parameters()) + list(loss_fn.parameters()), lr=lr
     )
     scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(opt, T_max=n_epochs)
 
-    pairs = build_pairs(political, niche, n_pairs=n_pairs)
+    bank = encode_corpus(political, niche)
+    pairs = index_pairs(build_pairs(political, niche, n_pairs=n_pairs), bank)
     n_batches = (len(pairs) + batch_size - 1) // batch_size
 
     best_loss = float("inf")
@@ -166,7 +195,7 @@ def train(
         total_loss = 0.0
         for i in range(0, len(pairs), batch_size):
             batch = pairs[i : i + batch_size]
-            Q1, A1, Q2, A2 = collate_batch(batch, device)
+            Q1, A1, Q2, A2 = collate_batch(batch, bank, device)
 
             opt.zero_grad()
             v1 = model(Q1, A1)
@@ -194,4 +223,10 @@ def train(
 
 
 if __name__ == "__main__":
-    train(n_epochs=1000, batch_size=64, n_pairs=32)
+    if "--encode-corpus" in sys.argv:
+        political, niche = load_data()
+        dtype = np.float16 if "--float16" in sys.argv else np.float32
+        bank = encode_corpus(political, niche, dtype=dtype)
+        print(f"Encoded {len(bank)} strings to {BANK_PATH}.npy")
+    else:
+        train(n_epochs=1000, batch_size=64, n_pairs=32)
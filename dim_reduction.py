@@ -0,0 +1,170 @@
+"""Reduced-dimension sentence embeddings: Matryoshka-style truncation or a PCA projection.
+
+Fit a projection on an encoded corpus (any (N, 384) .npy, e.g. a training
+corpus bank or stream_encode output), check how much pairwise-similarity
+fidelity each dimension keeps, then point ENCODER_PROJECTION at the .npz:
+
+    python dim_reduction.py report friend/corpus_embeddings.npy --dims 256 128 64
+    python dim_reduction.py fit friend/corpus_embeddings.npy --dim 128 --out projection_pca128.npz
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+
+import numpy as np
+
+METHODS = ("truncate", "pca")
+
+
+class Projection:
+    """Maps 384-d encoder rows to ``dim`` dims (then re-normalizes to unit length)."""
+
+    def __init__(self, method: str, dim: int, mean: np.ndarray | None = None, components: np.ndarray | None = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown projection method {method!r}")
+        if method == "pca" and (mean is None or components is None):
+            raise ValueError("PCA projection needs mean and components")
+        self.method = method
+        self.dim = dim
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.components = None if components is None else np.asarray(components, dtype=np.float32)
+
+    @property
+    def tag(self) -> str:
+        """Short identifier, used to keep caches of different projections apart."""
+        h = hashlib.sha1(self.method.encode())
+        if self.components is not None:
+            h.update(self.mean.tobytes())
+            h.update(self.components.tobytes())
+        return f"{self.method}{self.dim}-{h.hexdigest()[:8]}"
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if self.method == "truncate":
+            Y = X[..., : self.dim]
+        else:
+            Y = (X - self.mean) @ self.components
+        norms = np.linalg.norm(Y, axis=-1, keepdims=True)
+        return (Y / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    def to_dict(self) -> dict:
+        """Plain-Python form, safe to store inside a torch checkpoint."""
+        return {
+            "method": self.method,
+            "dim": self.dim,
+            "mean": None if self.mean is None else self.mean.tolist(),
+            "components": None if self.components is None else self.components.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Projection":
+        return cls(d["method"], int(d["dim"]), d.get("mean"), d.get("components"))
+
+    def save(self, path: str) -> None:
+        arrays = {"method": np.array(self.method), "dim": np.array(self.dim)}
+        if self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        data = np.load(path)
+        mean = data["mean"] if "mean" in data else None
+        components = data["components"] if "components" in data else None
+        return cls(str(data["method"]), int(data["dim"]), mean, components)
+
+
+def load_projection(path: str | None) -> Projection | None:
+    return Projection.load(path) if path else None
+
+
+def fit_pca(X: np.ndarray, dim: int, chunk_size: int = 65536) -> Projection:
+    """PCA from the covariance matrix, accumulated in chunks so X may be a memmap."""
+    n, d = X.shape
+    total = np.zeros(d, dtype=np.float64)
+    for i in range(0, n, chunk_size):
+        total += np.asarray(X[i : i + chunk_size], dtype=np.float64).sum(axis=0)
+    mean = total / n
+    cov = np.zeros((d, d), dtype=np.float64)
+    for i in range(0, n, chunk_size):
+        Xc = np.asarray(X[i : i + chunk_size], dtype=np.float64) - mean
+        cov += Xc.T @ Xc
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    order = np.argsort(eigvals)[::-1][:dim]
+    return Projection("pca", dim, mean=mean, components=eigvecs[:, order])
+
+
+def make_projection(method: str, dim: int, X: np.ndarray | None = None) -> Projection:
+    if method == "truncate":
+        return Projection("truncate", dim)
+    return fit_pca(X, dim)
+
+
+def _cosine_matrix(X: np.ndarray) -> np.ndarray:
+    X = X / np.maximum(np.linalg.norm(X, axis=-1, keepdims=True), 1e-12)
+    return X @ X.T
+
+
+def fidelity_report(
+    X: np.ndarray,
+    dims: list[int],
+    methods: tuple[str, ...] = METHODS,
+    sample: int = 2000,
+    k: int = 10,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Pairwise-similarity fidelity of each (method, dim) against the full embedding
+    on a random sample of rows: Pearson correlation and mean absolute error of the
+    cosine matrix, and mean top-k neighbour overlap.
+    """
+    rng = np.random.default_rng(seed)
+    idx = np.sort(rng.choice(len(X), size=min(sample, len(X)), replace=False))
+    base = np.asarray(X[idx], dtype=np.float32)
+    ref = _cosine_matrix(base)
+    off_diag = ~np.eye(len(base), dtype=bool)
+    k = min(k, len(base) - 1)
+    ref_nn = np.argsort(-np.where(off_diag, ref, -np.inf), axis=1)[:, :k]
+
+    rows = []
+    for method in methods:
+        for dim in dims:
+            proj = make_projection(method, dim, X)
+            sim = _cosine_matrix(proj.apply(base))
+            nn = np.argsort(-np.where(off_diag, sim, -np.inf), axis=1)[:, :k]
+            overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_nn, nn)])
+            rows.append({
+                "method": method,
+                "dim": dim,
+                "pearson": round(float(np.corrcoef(ref[off_diag], sim[off_diag])[0, 1]), 4),
+                "mae": round(float(np.abs(ref[off_diag] - sim[off_diag]).mean()), 4),
+                f"top{k}_overlap": round(float(overlap), 4),
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit or evaluate reduced-dimension encoder projections.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    fit = sub.add_parser("fit", help="fit a projection and save it as .npz")
+    fit.add_argument("embeddings", help="(N, 384) .npy of encoded corpus strings")
+    fit.add_argument("--dim", type=int, required=True)
+    fit.add_argument("--method", choices=METHODS, default="pca")
+    fit.add_argument("--out", required=True)
+    rep = sub.add_parser("report", help="pairwise-similarity fidelity per dimension")
+    rep.add_argument("embeddings")
+    rep.add_argument("--dims", type=int, nargs="+", default=[256, 128, 64])
+    rep.add_argument("--sample", type=int, default=2000)
+    args = parser.parse_args()
+
+    X = np.load(args.embeddings, mmap_mode="r")
+    if args.cmd == "fit":
+        proj = make_projection(args.method, args.dim, X)
+        proj.save(args.out)
+        print(f"Saved {proj.method} projection 384 → {proj.dim} to {args.out}")
+    else:
+        for row in fidelity_report(X, args.dims, sample=args.sample):
+            print(json.dumps(row))
@@ -0,0 +1,407 @@
+"""Embedding pipeline, warmup and admin endpoints shared by the friend, depolarizer and emo servers.
+
+Every server embeds a profile of ``k`` questions and answers the same way:
+the question rows come from a per-combination block cache and the answers
+from its encoder, both on the encode CPU pool; one compression-model forward
+pass per shared question block runs on the inference pool. A profile memo
+sits in front, and a micro-batcher merges concurrent /api/embed calls.
+EmbedService holds that state. The server passes in only what differs: k,
+how it encodes questions and answers, and how it loads a checkpoint.
+``register_admin_routes`` adds /api/admin/reembed and /api/admin/model for it
+(only with ADMIN_TOKEN set).
+
+Partial profiles (fewer than k questions, or skipped answers: null or blank)
+are zero-padded to k by ``pad_profiles`` and share one masked forward pass
+(CompressionModelKxn / the NumPy runtime), so a skipped question drops out of
+the interaction matrix instead of being embedded as text.
+"""
+
+from __future__ import annotations
+
+import hmac
+import os
+import sqlite3
+import threading
+from typing import Any, Callable
+
+import numpy as np
+
+import model_artifacts
+import numpy_runtime
+import reembed
+from cpu_pools import CpuScheduler
+from micro_batcher import MicroBatcher
+from model_registry import ModelRegistry, vectors_by_version
+from numpy_runtime import NumpyCompressionModel, answered, pad_profiles
+from profile_memo import ProfileMemo, profile_key
+from question_blocks import QuestionBlockCache, group_by_questions
+from vector_store import vector_formats
+
+MAX_EMBED_BATCH = int(os.environ.get("EMBED_BATCH_MAX_PROFILES", "1000"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+Matrix = Callable[[list[str]], np.ndarray]
+Embedded = tuple[list[float], np.ndarray, np.ndarray, str]  # (vector, raw Q, raw A, model version)
+
+
+class EmbedService:
+    """
+    One server's embedding pipeline. ``question_matrix`` / ``answer_matrix``
+    encode text to (len, dim) rows; ``load_checkpoint(path=, device=)``
+    returns (model, loss) as the app's train module does, and
+    ``set_projection`` switches the encoder to a checkpoint's projection.
+    The registry, device, CPU pools and batcher are set up by the server at
+    startup; until then every call runs inline.
+    """
+
+    def __init__(
+        self,
+        k: int,
+        question_matrix: Matrix,
+        answer_matrix: Matrix,
+        load_checkpoint: Callable[..., tuple[Any, Any]],
+        set_projection: Callable[[Any], None],
+    ):
+        self.k = k
+        self.question_matrix = question_matrix
+        self.answer_matrix = answer_matrix
+        self.load_checkpoint = load_checkpoint
+        self.set_projection = set_projection
+        self.registry: ModelRegistry | None = None
+        self.device = None
+        self.cpu: CpuScheduler | None = None
+        self.batcher: MicroBatcher | None = None
+        self.memo = ProfileMemo()
+        self.question_blocks = QuestionBlockCache(lambda questions: self.question_matrix(questions))
+        self.warmup_state = "pending"  # → "running" → "ready" | "failed"; reported by health()
+        self.warmup_stats = None
+
+    # --- models and pools ---
+
+    def load_model_file(self, path: str):
+        """Load one checkpoint for COMPRESSION_RUNTIME (also applies its encoder projection)."""
+        if numpy_runtime.RUNTIME == "numpy":
+            model = NumpyCompressionModel.from_checkpoint(path)
+            self.set_projection(model.projection)
+            return model
+        model, _ = self.load_checkpoint(path=path, device=self.device)
+        return self.optimize(model, path)
+
+    def optimize(self, model, ckpt_path: str | None):
+        """Serve a fixed-size CompressionModel / CompressionModel5xn as the masked k×n model, for COMPRESSION_RUNTIME."""
+        from compression_model_kxn import CompressionModelKxn
+
+        masked = CompressionModelKxn.from_state_dict(model.state_dict(), n=model.n).to(self.device)
+        return model_artifacts.optimize(masked.eval(), ckpt_path, self.device)
+
+    def start_cpu_pools(self) -> None:
+        """Split the core budget into encode / inference / scan pools (CPU_POOLS) and cap torch / BLAS threads."""
+        self.cpu = CpuScheduler()
+        for name, pool in self.cpu.pools.items():
+            print(f"  {name}: {len(pool.cores)} core(s), {pool.workers} worker(s)")
+
+    def on_pool(self, pool: str, fn, *args):
+        """Run fn on the named CPU pool (inline until the pools are started)."""
+        if self.cpu is None:
+            return fn(*args)
+        return self.cpu.run(pool, fn, *args)
+
+    def start_batcher(self) -> None:
+        """Route embed_full through a shared micro-batching worker (tuned via EMBED_BATCH_* env vars)."""
+        # embed_full checks the profile memo before queueing, so the worker only stores
+        self.batcher = MicroBatcher(lambda jobs: self.embed_batch(jobs, lookup=False))
+
+    # --- embedding ---
+
+    def forward(
+        self, Q_raw: np.ndarray, A_raw: np.ndarray, mask: np.ndarray | None = None
+    ) -> tuple[list[list[float]], str]:
+        """
+        One forward pass over raw (b, k, dim) embeddings on the active model; returns (unit vectors, version).
+        Q_raw may also be a single (k, dim) block shared by every row. ``mask`` is the (b, k) padding
+        mask from pad_profiles (None: every slot answered).
+        """
+        return self.on_pool("inference", self._forward_active, Q_raw, A_raw, mask)
+
+    def _forward_active(
+        self, Q_raw: np.ndarray, A_raw: np.ndarray, mask: np.ndarray | None
+    ) -> tuple[list[list[float]], str]:
+        with self.registry.acquire() as (version, model):
+            if isinstance(model, NumpyCompressionModel):
+                return model.embed(Q_raw, A_raw, mask).tolist(), version
+            import torch
+            import torch.nn.functional as F
+
+            Q = torch.tensor(Q_raw, dtype=torch.float32, device=self.device)
+            A = torch.tensor(A_raw, dtype=torch.float32, device=self.device)
+            with torch.no_grad():
+                if mask is None:
+                    v = model(Q, A)
+                else:
+                    v = model(Q, A, torch.tensor(mask, dtype=torch.float32, device=self.device))
+            return F.normalize(v, dim=-1).cpu().numpy().tolist(), version
+
+    def is_partial(self, questions: list[str], answers: list[str]) -> bool:
+        """True for a profile that needs the masked pass: fewer than k questions, or a skipped answer."""
+        return len(questions) < self.k or not all(answered(answers))
+
+    def embed_batch(
+        self, profiles: list[tuple[list[str], list[str]]], lookup: bool = True, store: bool = True
+    ) -> list[Embedded]:
+        """
+        Compute 64-dim embeddings for several users with one encoder pass and few forward passes.
+        Returns (vector, Q, A, model_version) per profile; Q/A are the raw (k, dim) sentence embeddings.
+        Q comes from the cached block of its question combination; profiles sharing a
+        combination share that block (one forward pass per shared combination, one for the rest).
+        Partial profiles return (m, dim) Q/A and get one masked pass of their own (see _embed_partial).
+        With ``lookup``, profiles already in the profile memo (same Q/A text, active model
+        version) skip both passes; with ``store``, computed results are added to it.
+        """
+        results = [None] * len(profiles)
+        if lookup:
+            version = self.registry.active_version
+            for i, (qs, ans) in enumerate(profiles):
+                hit = self.memo.get(profile_key(qs, ans, version))
+                if hit is not None:
+                    results[i] = (*hit, version)
+        partial = [i for i, r in enumerate(results) if r is None and self.is_partial(*profiles[i])]
+        if partial:
+            for i, result in zip(partial, self._embed_partial([profiles[i] for i in partial])):
+                results[i] = result
+                if store:
+                    self.memo.put(profile_key(*profiles[i], result[3]), *result[:3])
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            answers = [a for i in todo for a in profiles[i][1]]
+            blocks, A_raw = self.on_pool("encode", lambda: (
+                [self.question_blocks.get(profiles[i][0]) for i in todo],
+                self.answer_matrix(answers).reshape(len(todo), self.k, -1),
+            ))
+            shared, singles = group_by_questions([profiles[i][0] for i in todo])
+            passes = [(blocks[rows[0]], rows) for _, rows in shared]
+            if singles:
+                passes.append((np.stack([blocks[j] for j in singles]), singles))
+            for Q_raw, rows in passes:
+                vectors, version = self.forward(Q_raw, A_raw[rows])
+                for j, vec in zip(rows, vectors):
+                    i = todo[j]
+                    results[i] = (vec, blocks[j], A_raw[j], version)
+                    if store:
+                        self.memo.put(profile_key(*profiles[i], version), vec, blocks[j], A_raw[j])
+        return results
+
+    def _embed_partial(self, profiles: list[tuple[list[str], list[str]]]) -> list[Embedded]:
+        """One masked forward pass over profiles with fewer than k questions or skipped answers."""
+        lengths = [len(qs) for qs, _ in profiles]
+        Q_rows, A_rows = self.on_pool("encode", lambda: (
+            self.question_matrix([q for qs, _ in profiles for q in qs]),
+            self.answer_matrix([a for _, ans in profiles for a in ans]),
+        ))
+        bounds = np.cumsum(lengths)[:-1]
+        pairs = list(zip(np.split(Q_rows, bounds), np.split(A_rows, bounds)))
+        Q_raw, A_raw, mask = pad_profiles(pairs, self.k, answered=[answered(ans) for _, ans in profiles])
+        vectors, version = self.forward(Q_raw, A_raw, mask)
+        return [(vec, Q, A, version) for vec, (Q, A) in zip(vectors, pairs)]
+
+    def embed_full(self, questions: list[str], answers: list[str]) -> Embedded:
+        """Compute 64-dim embedding for one user, plus the raw Q/A sentence embeddings and the model version."""
+        self.check_profile(questions, answers)
+        version = self.registry.active_version
+        hit = self.memo.get(profile_key(questions, answers, version))
+        if hit is not None:
+            return (*hit, version)
+        if self.batcher is not None:
+            return self.batcher.submit((questions, answers), size=len(questions) + len(answers))
+        return self.embed_batch([(questions, answers)], lookup=False)[0]
+
+    def embed(self, questions: list[str], answers: list[str]) -> list[float]:
+        """Compute 64-dim embedding for one user."""
+        return self.embed_full(questions, answers)[0]
+
+    def raw_embeddings(self, questions: list[str], answers: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Raw Q/A sentence embeddings of a profile: the ones embed_full already computed
+        (profile memo, active model version), else encoded on the encode CPU pool.
+        """
+        answers = ["" if a is None else a for a in answers]
+        if self.registry is not None:
+            hit = self.memo.get(profile_key(questions, answers, self.registry.active_version))
+            if hit is not None:
+                return hit[1], hit[2]
+        return self.on_pool("encode", lambda: (self.question_matrix(questions), self.answer_matrix(answers)))
+
+    def check_profile(self, questions: list[str], answers: list[str]) -> None:
+        """Raise ValueError unless the profile has 1..k questions, one answer each, and at least one answered."""
+        if len(questions) != len(answers) or not 1 <= len(questions) <= self.k:
+            raise ValueError(f"need 1 to {self.k} questions and one answer per question")
+        if not any(answered(answers)):
+            raise ValueError("at least one question must be answered")
+
+    def profile_pair(self, item) -> tuple[list[str], list[str]]:
+        """
+        Validate one /api/embed or /api/embed-batch item → (questions, answers); raises ValueError with the reason.
+        A null answer is a skipped question and comes back as "".
+        """
+        if not isinstance(item, dict) or "questions" not in item or "answers" not in item:
+            raise ValueError("questions and answers required")
+        questions, answers = item["questions"], item["answers"]
+        if not isinstance(questions, list) or not isinstance(answers, list):
+            raise ValueError("questions and answers must be lists")
+        answers = ["" if a is None else a for a in answers]
+        if not all(isinstance(s, str) for s in questions + answers):
+            raise ValueError("questions and answers must be strings")
+        self.check_profile(questions, answers)
+        return questions, answers
+
+    # --- warmup and health ---
+
+    def _warmup(self, texts: list[str]) -> None:
+        """Run EMBED_WARMUP_BATCH-profile batches through embed_batch until latency settles, then mark ready."""
+        k = self.k
+        # Even rows share one question block, odd rows get their own: both forward paths warm up.
+        # The last row skips a question, so the masked pass warms up too.
+        profiles = [
+            ([texts[(i + j % 2 * j) % len(texts)] for i in range(k)], [f"warmup answer {j}.{i}" for i in range(k)])
+            for j in range(model_artifacts.WARMUP_BATCH)
+        ]
+        profiles[-1][1][-1] = ""
+        try:
+            self.warmup_stats = model_artifacts.warmup(lambda: self.embed_batch(profiles, lookup=False, store=False))
+            self.warmup_state = "ready"
+        except Exception as e:
+            self.warmup_stats = {"error": str(e)}
+            self.warmup_state = "failed"
+            print(f"Warmup failed: {e}")
+
+    def start_warmup(self, texts: list[str]) -> None:
+        """Warm up on questions from ``texts`` in the background; health() answers 503 until then, 500 on failure."""
+        self.warmup_state = "running"
+        threading.Thread(target=self._warmup, args=(texts,), name="warmup", daemon=True).start()
+
+    def health(self, result: dict) -> tuple[dict, int]:
+        """Add readiness and pipeline stats to the server's /api/health ``result``; returns it with the status code."""
+        import encoder_registry
+
+        result.update(ok=True, ready=self.warmup_state == "ready", warmup_state=self.warmup_state)
+        result["encoders"] = encoder_registry.stats()
+        if self.warmup_stats is not None:
+            result["warmup"] = self.warmup_stats
+        if self.registry is not None:
+            result["model"] = self.registry.stats()
+        result["profile_memo"] = self.memo.stats()
+        result["question_blocks"] = self.question_blocks.stats()
+        if self.batcher is not None:
+            result["embed_batcher"] = self.batcher.stats()
+        if self.cpu is not None:
+            result["cpu_pools"] = self.cpu.stats()
+        if self.warmup_state == "failed":
+            result["ok"] = False
+            return result, 500
+        return result, 200 if self.warmup_state == "ready" else 503
+
+
+def register_admin_routes(
+    app,
+    service: EmbedService,
+    db_path: Callable[[], str],
+    dim: Callable[[], int],
+    on_update: Callable[[list[tuple[str, list[float]]]], None],
+) -> None:
+    """
+    Add /api/admin/reembed and /api/admin/model to the Flask ``app``, only
+    when ADMIN_TOKEN is set; every call must send it as X-Admin-Token.
+    ``db_path`` and ``dim`` are read per request (the users database, the
+    width of the encoder rows); ``on_update`` receives re-embedded vectors.
+    """
+    if not ADMIN_TOKEN:
+        print("ADMIN_TOKEN not set; admin endpoints disabled")
+        return
+
+    from flask import jsonify, request
+
+    state: dict[str, reembed.ReembedJob | None] = {"job": None}
+
+    def forbidden():
+        if not hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"error": "forbidden"}), 403
+        return None
+
+    @app.route("/api/admin/reembed", methods=["GET", "POST"])
+    def admin_reembed():
+        """
+        GET: progress of the background re-embedding job.
+        POST { batch_size?, duty_cycle? }: re-embed every stored response with the active
+        model version, resuming a previous run for the same version. POST { stop: true } stops it.
+        Requires an X-Admin-Token header matching ADMIN_TOKEN.
+        """
+        denied = forbidden()
+        if denied:
+            return denied
+        job = state["job"]
+        if request.method == "POST":
+            data = request.get_json() or {}
+            if data.get("stop"):
+                if job is not None:
+                    job.stop()
+            elif job is None or not job.running:
+                job = state["job"] = reembed.ReembedJob(
+                    db_path(),
+                    k=service.k,
+                    dim=dim(),
+                    target_version=service.registry.active_version,
+                    forward=service.forward,
+                    question_matrix=lambda strings: service.on_pool("encode", service.question_matrix, strings),
+                    answer_matrix=lambda strings: service.on_pool("encode", service.answer_matrix, strings),
+                    batch_size=int(data.get("batch_size", reembed.DEFAULT_BATCH_SIZE)),
+                    duty_cycle=float(data.get("duty_cycle", reembed.DEFAULT_DUTY_CYCLE)),
+                    busy=lambda: service.batcher is not None and service.batcher.queue_depth > 0,
+                    on_update=on_update,
+                ).start()
+        if job is None:
+            return jsonify({"status": "idle", "running": False})
+        return jsonify(job.status())
+
+    @app.route("/api/admin/model", methods=["GET", "POST"])
+    def admin_model():
+        """
+        GET: registered model versions, the active one, and how many stored vectors
+        each version produced (?user_id= adds that user's version).
+        POST { version }: activate a registered version without dropping in-flight requests.
+        POST { reload: true }: register the checkpoint currently on disk (e.g. after retraining) and activate it.
+        Requires an X-Admin-Token header matching ADMIN_TOKEN.
+        """
+        denied = forbidden()
+        if denied:
+            return denied
+        registry = service.registry
+        if request.method == "POST":
+            data = request.get_json() or {}
+            previous = registry.active_version
+            try:
+                if data.get("reload"):
+                    version = registry.register()["version"]
+                elif data.get("version"):
+                    version = data["version"]
+                else:
+                    return jsonify({"error": "version or reload required"}), 400
+                registry.activate(version)
+            except (ValueError, FileNotFoundError) as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"previous": previous, **registry.stats()})
+        conn = sqlite3.connect(db_path())
+        try:
+            result = {
+                "active": registry.active_version,
+                "versions": registry.versions(),
+                "vectors": vectors_by_version(conn),
+                "vector_formats": vector_formats(conn),
+            }
+            user_id = request.args.get("user_id")
+            if user_id:
+                row = conn.execute("SELECT model_version FROM users WHERE id = ?", (user_id,)).fetchone()
+                if not row:
+                    return jsonify({"error": "user not found"}), 404
+                result["user"] = {"id": user_id, "model_version": row[0]}
+        finally:
+            conn.close()
+        return jsonify(result)
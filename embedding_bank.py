@@ -0,0 +1,123 @@
+"""Pre-encoded string banks: unique strings → rows of a float32/float16 matrix.
+
+Saved as ``<prefix>.npy`` (the matrix) plus ``<prefix>.json`` (the string index,
+row i ↔ texts[i], and the ``identity`` of the encoder that produced the rows);
+loaded memory-mapped so training can gather rows without ever calling the
+sentence encoder. ``load_or_build`` re-encodes a bank saved under another
+encoder or projection instead of reusing its rows.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Callable, Iterable, Sequence
+
+import numpy as np
+
+Encoder = Callable[[list[str]], np.ndarray]
+
+
+class EmbeddingBank:
+    """Embeddings for a fixed set of strings, addressed by text or integer id."""
+
+    def __init__(self, texts: Sequence[str], matrix: np.ndarray, identity: dict | None = None):
+        self.texts = list(texts)
+        self.matrix = matrix
+        self.identity = identity
+        self._rows = {t: i for i, t in enumerate(self.texts)}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self._rows
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def ids(self, strings: Sequence[str]) -> list[int]:
+        """Row ids for strings; raises KeyError for strings not in the bank."""
+        return [self._rows[s] for s in strings]
+
+    def gather(self, ids) -> np.ndarray:
+        """Rows for an integer id array of any shape → float32 array of shape ids.shape + (dim,)."""
+        return np.asarray(self.matrix[np.asarray(ids)], dtype=np.float32)
+
+    @classmethod
+    def build(
+        cls,
+        strings: Iterable[str],
+        encode: Encoder,
+        dtype=np.float32,
+        identity: dict | None = None,
+        dim: int | None = None,
+    ) -> "EmbeddingBank":
+        """
+        Encode the unique strings. An empty bank is ``dim`` wide, or as wide as
+        ``encode([])`` (response_modify.to_matrix returns (0, embedding_dim())).
+        """
+        unique = list(dict.fromkeys(strings))
+        if not unique:
+            empty = np.zeros((0, dim), dtype=dtype) if dim is not None else np.asarray(encode([]), dtype=dtype)
+            if empty.ndim != 2:
+                raise ValueError("encode([]) must return a (0, dim) matrix; pass dim to build an empty bank")
+            return cls([], empty, identity)
+        return cls(unique, np.asarray(encode(unique), dtype=dtype), identity)
+
+    @staticmethod
+    def _paths(prefix: str) -> tuple[str, str]:
+        stem = prefix[:-4] if prefix.endswith(".npy") else prefix
+        return stem + ".npy", stem + ".json"
+
+    def save(self, prefix: str) -> None:
+        matrix_path, index_path = self._paths(prefix)
+        np.save(matrix_path, np.asarray(self.matrix))
+        with open(index_path, "w") as f:
+            json.dump({"texts": self.texts, "identity": self.identity}, f)
+
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = True) -> "EmbeddingBank":
+        matrix_path, index_path = cls._paths(prefix)
+        with open(index_path) as f:
+            index = json.load(f)
+        texts = index["texts"]
+        matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+        if len(matrix) != len(texts):
+            raise ValueError(f"{matrix_path} has {len(matrix)} rows but {index_path} lists {len(texts)} strings")
+        return cls(texts, matrix, index.get("identity"))
+
+    @classmethod
+    def load_or_build(
+        cls,
+        prefix: str,
+        strings: Iterable[str],
+        encode: Encoder,
+        dtype=np.float32,
+        mmap: bool = True,
+        dim: int | None = None,
+        identity: dict | None = None,
+    ) -> "EmbeddingBank":
+        """
+        Load the bank at ``prefix`` if it covers every string (and has width ``dim``,
+        when given) and was saved with the same ``identity`` (e.g. response_modify's
+        encoder_identity()); otherwise encode them all once and save.
+        """
+        unique = list(dict.fromkeys(strings))
+        matrix_path, index_path = cls._paths(prefix)
+        if os.path.exists(matrix_path) and os.path.exists(index_path):
+            try:
+                bank = cls.load(prefix, mmap=mmap)
+            except ValueError:
+                bank = None
+            if (
+                bank is not None
+                and bank.identity == identity
+                and (dim is None or bank.dim == dim)
+                and all(s in bank for s in unique)
+            ):
+                return bank
+        bank = cls.build(unique, encode, dtype=dtype, identity=identity, dim=dim)
+        bank.save(prefix)
+        return cls.load(prefix, mmap=mmap) if mmap else bank
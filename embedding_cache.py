@@ -0,0 +1,237 @@
+"""Disk-backed, content-addressed cache for sentence embeddings.
+
+Rows are float32 vectors stored in a memory-mapped file; a sidecar ``.keys``
+file holds one content hash per row (row i ↔ line i). Hot rows are kept in a
+small in-memory LRU in front of the memmap.
+
+Several processes (the three servers, train.py, bulk_encode.py) may share one
+cache directory: appends take an exclusive ``flock`` on a ``.lock`` file and
+first catch up with rows other processes appended, so every row lands at the
+line number of its key. Readers pick up other processes' rows on a miss.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Sequence
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): one writing process per cache directory
+    fcntl = None
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache"),
+)
+CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE", "1").lower() not in {"0", "false", "no"}
+
+
+def text_key(text: str, encoder_name: str) -> str:
+    """Content hash of one string for one encoder."""
+    return hashlib.sha1(f"{encoder_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent text → embedding cache for a single encoder.
+
+    Safe for concurrent use from threads of one process and, where ``fcntl``
+    is available, from several processes sharing the cache directory.
+    """
+
+    def __init__(
+        self,
+        encoder_name: str,
+        dim: int = 384,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        lru_size: int = 4096,
+        initial_capacity: int = 1024,
+    ):
+        self.encoder_name = encoder_name
+        self.dim = dim
+        self.lru_size = lru_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lru: OrderedDict[str, np.ndarray] = OrderedDict()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        stem = re.sub(r"[^A-Za-z0-9_.-]", "_", encoder_name) + f"-{dim}"
+        self._data_path = os.path.join(cache_dir, stem + ".f32")
+        self._keys_path = os.path.join(cache_dir, stem + ".keys")
+        self._lock_file = open(os.path.join(cache_dir, stem + ".lock"), "a")
+
+        with self._flocked():
+            keys: list[str] = []
+            if os.path.exists(self._keys_path):
+                with open(self._keys_path) as f:
+                    keys = f.read().split("\n")
+            complete = [k for k in keys[:-1] if k]  # a trailing partial line is a torn write
+            row_bytes = dim * 4
+            stored_rows = os.path.getsize(self._data_path) // row_bytes if os.path.exists(self._data_path) else 0
+            complete = complete[:stored_rows]
+            if len(complete) != len([k for k in keys if k]):
+                with open(self._keys_path, "w") as f:
+                    f.write("".join(k + "\n" for k in complete))
+            self._index = {}
+            for i, k in enumerate(complete):
+                self._index.setdefault(k, i)
+            self._count = len(complete)
+            self._keys_offset = sum(len(k) + 1 for k in complete)  # bytes of .keys already read
+            self._open(max(initial_capacity, stored_rows, 1))
+            self._keys_file = open(self._keys_path, "a")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _open(self, capacity: int) -> None:
+        size = capacity * self.dim * 4
+        mode = "r+b" if os.path.exists(self._data_path) else "w+b"
+        with open(self._data_path, mode) as f:
+            if os.path.getsize(self._data_path) < size:
+                f.truncate(size)
+        self._data = np.memmap(self._data_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    @contextmanager
+    def _flocked(self):
+        """Exclusive inter-process lock on the cache directory's files (no-op without fcntl)."""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Index rows other processes appended since the last read (complete ``.keys`` lines only)."""
+        if os.path.getsize(self._keys_path) == self._keys_offset:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1
+        for key in chunk[:end].decode("ascii").split("\n")[:-1]:
+            self._index.setdefault(key, self._count)  # a key appended twice keeps its first row
+            self._count += 1
+        self._keys_offset += end
+        if self._count > self._capacity:
+            self._grow(self._count)
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._data.flush()
+        del self._data
+        self._open(capacity)
+
+    def _remember(self, key: str, row: np.ndarray) -> None:
+        self._lru[key] = row
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def lookup(self, texts: Sequence[str]) -> tuple[np.ndarray, list[int]]:
+        """
+        Fill a (len(texts), dim) float32 matrix from the cache.
+        Returns (matrix, missing) where missing lists positions that still need encoding.
+        """
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        refreshed = False
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = text_key(text, self.encoder_name)
+                row = self._lru.get(key)
+                if row is not None:
+                    self._lru.move_to_end(key)
+                else:
+                    idx = self._index.get(key)
+                    if idx is None and not refreshed:
+                        self._refresh()  # another process may have encoded it
+                        refreshed = True
+                        idx = self._index.get(key)
+                    if idx is None:
+                        missing.append(i)
+                        continue
+                    row = np.array(self._data[idx])
+                    self._remember(key, row)
+                out[i] = row
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return out, missing
+
+    def put_many(self, texts: Sequence[str], embeddings: np.ndarray) -> None:
+        """Store embeddings for texts (rows aligned with texts). Already-cached texts are skipped."""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), self.dim)
+        with self._lock, self._flocked():
+            self._refresh()  # append after every row written so far, by any process
+            new = []
+            for text, row in zip(texts, embeddings):
+                key = text_key(text, self.encoder_name)
+                if key in self._index:
+                    continue
+                self._index[key] = -1  # reserve so duplicates in this call are written once
+                new.append((key, row))
+            if not new:
+                return
+            if self._count + len(new) > self._capacity:
+                self._grow(self._count + len(new))
+            start = self._count
+            for offset, (key, row) in enumerate(new):
+                self._data[start + offset] = row
+                self._index[key] = start + offset
+                self._remember(key, np.array(row))
+            self._data.flush()  # rows first: a key line is only visible once its row is on disk
+            lines = "".join(key + "\n" for key, _ in new)
+            self._keys_file.write(lines)
+            self._keys_file.flush()
+            self._keys_offset += len(lines)
+            self._count += len(new)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "rows": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._data.flush()
+            self._keys_file.close()
+            self._lock_file.close()
+
+
+def cached_encode(
+    strings: Sequence[str],
+    encode: Callable[[list[str]], np.ndarray],
+    cache: EmbeddingCache | None,
+) -> np.ndarray:
+    """
+    Encode strings through the cache: only misses are sent to ``encode``,
+    de-duplicated and in one batch. Returns a (len(strings), dim) float32 matrix.
+    """
+    if cache is None:
+        return np.asarray(encode(list(strings)), dtype=np.float32)
+    out, missing = cache.lookup(strings)
+    if missing:
+        unique = list(dict.fromkeys(strings[i] for i in missing))
+        encoded = np.asarray(encode(unique), dtype=np.float32)
+        cache.put_many(unique, encoded)
+        rows = dict(zip(unique, encoded))
+        for i in missing:
+            out[i] = rows[strings[i]]
+    return out
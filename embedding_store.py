@@ -0,0 +1,54 @@
+"""Raw per-question/answer embeddings stored alongside the text in ``responses`` rows.
+
+Each row gets two nullable BLOB columns, ``q_embeddings`` and ``a_embeddings``,
+holding the (k, dim) sentence embeddings as little-endian float16 (dim is 384,
+or smaller under an encoder projection). Rows written before the columns
+existed (or without embeddings) keep NULL.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+
+import numpy as np
+
+EMBEDDING_DTYPE = np.dtype("<f2")
+EMBEDDING_COLUMNS = ("q_embeddings", "a_embeddings")
+
+
+def pack_embeddings(matrix: np.ndarray | None) -> bytes | None:
+    if matrix is None:
+        return None
+    return np.ascontiguousarray(matrix, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def unpack_embeddings(blob: bytes | None, k: int) -> np.ndarray | None:
+    """BLOB of ``k`` rows (one per question/answer) → (k, dim) float32 matrix, or None for a NULL column."""
+    if blob is None:
+        return None
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE).reshape(k, -1).astype(np.float32)
+
+
+def ensure_embedding_columns(conn: sqlite3.Connection) -> None:
+    """Add the embedding columns to an existing responses table (no-op once present)."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+    for column in EMBEDDING_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE responses ADD COLUMN {column} BLOB")
+    conn.commit()
+
+
+def insert_response(
+    conn: sqlite3.Connection,
+    user_id: str,
+    questions_json: str,
+    answers_json: str,
+    Q: np.ndarray | None = None,
+    A: np.ndarray | None = None,
+) -> int:
+    """Insert one responses row with its raw embeddings; returns the new row id."""
+    cur = conn.execute(
+        "INSERT INTO responses (user_id, questions, answers, q_embeddings, a_embeddings) VALUES (?, ?, ?, ?, ?)",
+        (user_id, questions_json, answers_json, pack_embeddings(Q), pack_embeddings(A)),
+    )
+    return cur.lastrowid
@@ -8,14 +8,14 @@ _parent = os.path.dirname(_here)
 if _parent not in sys.path:
     sys.path.insert(0, _parent)
 
-from friend.response_modify import to_matrix
+from friend.response_modify import embedding_dim, encoder_identity, projection_state, set_projection, to_matrix, warmup
 import numpy as np
 
 
 def vectorize_5qa(questions: list[str], answers: list[str]) -> tuple[np.ndarray, np.ndarray]:
     """
     Vectorize 5 questions and 5 answers.
-    Returns (Q, A) as (5, 384) numpy arrays.
+    Returns (Q, A) as (5, embedding_dim()) numpy arrays.
     """
     if len(questions) != 5 or len(answers) != 5:
         raise ValueError("Need exactly 5 questions and 5 answers")
@@ -9,8 +9,6 @@ import sys
 import threading
 
 import numpy as np
-import torch
-import torch.nn.functional as F
 
 _here = os.path.dirname(os.path.abspath(__file__))
 _parent = os.path.dirname(_here)
@@ -21,7 +19,23 @@ os.chdir(_here)
 
 from flask import Flask, jsonify, request, send_from_directory
 
-from response_modify import vectorize_5qa
+from embedding_store import ensure_embedding_columns, insert_response
+import model_artifacts
+from embed_service import MAX_EMBED_BATCH, EmbedService, register_admin_routes
+from model_registry import ModelRegistry, ensure_version_column
+from vector_store import (
+    WRITE_FORMAT,
+    check_vector,
+    ensure_vector_format_column,
+    load_vectors,
+    pack_vector,
+    unpack_vector,
+)
+from question_bank import QuestionBank
+from vector_index import VectorIndex
+from match_pages import encode_cursor, pair_jitter, parse_page_args, select_candidate_page, select_page, user_jitter
+import ann_index
+from response_modify import embedding_dim, encoder_identity, set_projection, to_matrix, warmup as warmup_encoder
 from compression_model_5xn import CompressionModel5xn
 from train import load_checkpoint, get_device
 
@@ -35,10 +49,14 @@ def _cors(resp):
     resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
     return resp
 
-_model = None
-_device = None
 _db_path = os.path.join(_here, "emo.db")
 _question_sets = []
+_question_bank = None
+_service = EmbedService(5, lambda questions: _question_matrix(questions), to_matrix, load_checkpoint, set_projection)
+_ann = None  # AnnMaintainer when ANN_INDEX=ivf
+_index = VectorIndex(columns=("jitter",), exact=lambda ids: load_vectors(_db_path, ids))
+_setup_lock = threading.Lock()
+_setup_done = False
 _question_cycle_index = 0
 _cycle_lock = threading.Lock()
 
@@ -54,8 +72,10 @@ def init_db():
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
-            vector TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            vector_format TEXT,
             city TEXT NOT NULL DEFAULT '',
+            model_version TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         CREATE TABLE IF NOT EXISTS responses (
@@ -63,11 +83,16 @@ def init_db():
             user_id TEXT NOT NULL,
             questions TEXT NOT NULL,
             answers TEXT NOT NULL,
+            q_embeddings BLOB,
+            a_embeddings BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users(id)
         );
     """)
     conn.commit()
+    ensure_embedding_columns(conn)
+    ensure_version_column(conn)
+    ensure_vector_format_column(conn)
     conn.close()
 
 
@@ -79,39 +104,70 @@ def _load_questions():
         _question_sets = data.get("question_sets", [])
 
 
+def _load_question_bank():
+    """Embed every question in every set once, or load them from question_embeddings.npy."""
+    global _question_bank
+    texts = [q for q_set in _question_sets for q in q_set]
+    path = os.path.join(_here, "question_embeddings.npy")
+    _question_bank = QuestionBank.load_or_build(
+        path, texts, to_matrix, dim=embedding_dim(), identity=encoder_identity()
+    )
+
+
+def _question_matrix(questions: list[str]) -> np.ndarray:
+    if _question_bank is None:
+        return to_matrix(questions)
+    return _question_bank.encode(questions, to_matrix)
+
+
 def _load_models():
-    global _model, _device
-    _device = get_device()
+    _service.device = get_device()
     model_path = os.path.join(_here, "compression_model_emo.pt")
+    _service.registry = ModelRegistry(model_path, _service.load_model_file)
     if os.path.exists(model_path):
-        _model, _ = load_checkpoint(path=model_path, device=_device)
-        _model.eval()
+        print(f"Active model version: {_service.registry.start()}")
     else:
         # Fallback: use randomly initialized model (works without training)
-        _model = CompressionModel5xn(n=384).to(_device)
-        _model.eval()
+        model = CompressionModel5xn(n=embedding_dim()).to(_service.device)
+        _service.registry.install("untrained", _service.optimize(model, None))
         print("No trained model found — using untrained weights. Run train.py to improve matches.")
 
 
-def _embed(questions: list[str], answers: list[str]) -> list[float]:
-    """Compute 64-dim embedding from 5 Q/A pairs."""
-    if len(questions) != 5 or len(answers) != 5:
-        raise ValueError("Need exactly 5 questions and 5 answers")
-    Q, A = vectorize_5qa(questions, answers)
-    Q_t = torch.tensor(Q, dtype=torch.float32, device=_device).unsqueeze(0)
-    A_t = torch.tensor(A, dtype=torch.float32, device=_device).unsqueeze(0)
-    with torch.no_grad():
-        v = _model(Q_t, A_t)
-        v = F.normalize(v, dim=-1)
-        return v.cpu().numpy().flatten().tolist()
-
-
 def _cosine_sim(vec_a: list[float], vec_b: list[float]) -> float:
     a = np.array(vec_a, dtype=np.float32)
     b = np.array(vec_b, dtype=np.float32)
     return float(np.dot(a, b))
 
 
+def _index_row(user_id: str, vector: list[float]) -> tuple[str, list[float], dict]:
+    """(id, vector, metadata) row for the resident index."""
+    return user_id, vector, {"jitter": user_jitter(user_id)}
+
+
+def _load_index():
+    """Load every stored user into the resident vector index (once, at startup)."""
+    conn = get_db()
+    rows = conn.execute("SELECT id, vector, vector_format FROM users").fetchall()
+    conn.close()
+    added = []
+    for row in rows:
+        try:
+            vec = check_vector(unpack_vector(row["vector"], row["vector_format"]))
+        except ValueError as e:
+            print(f"Skipping user {row['id']} in the vector index: {e}")
+            continue
+        added.append(_index_row(row["id"], vec))
+    _index.upsert_many(added)
+
+
+def _start_ann():
+    """With ANN_INDEX=ivf, attach an approximate index to the resident one (loaded or trained in the background)."""
+    global _ann
+    if ann_index.ENABLED:
+        _ann = ann_index.AnnMaintainer(_index, _db_path + ".ivf.npz")
+        _ann.start()
+
+
 def _similarity_to_pct(sim: float) -> float:
     return ((sim + 1) / 2) * 100
 
@@ -120,22 +176,54 @@ def _generate_user_id() -> str:
     return "EMO-" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
 
-def _load_users_from_db(exclude_id: str = None) -> list[dict]:
-    conn = get_db()
-    cur = conn.execute("SELECT id, vector, city FROM users")
-    rows = cur.fetchall()
-    conn.close()
-    users = []
-    for row in rows:
-        if exclude_id and row["id"] == exclude_id:
-            continue
-        users.append({
-            "id": row["id"],
-            "vector": json.loads(row["vector"]),
-            "city": row["city"] or "",
-            "distance": round(random.uniform(0.5, 12), 1),
-        })
-    return users
+def _match_results(
+    user_vec: list[float], user_id: str, limit: int | None = None, after: tuple[float, str] | None = None
+) -> tuple[list[dict], str | None]:
+    """
+    Score every other indexed user against user_vec in one pass (scan CPU pool); best match first.
+    Returns the page after ``after`` (at most ``limit`` matches) and the cursor of the next page.
+    With the approximate index on, a page is first served from its nearest users (at least
+    ANN_CANDIDATES) when nobody left out, including neighbours the index missed, can rank
+    inside it (see VectorIndex.search_bounded); otherwise,
+    and for unlimited requests, every user is scored.
+    """
+    if _ann is not None and limit is not None:
+        _ann.refresh()
+        candidates = max(ann_index.CANDIDATES, 4 * limit)
+        ids, sims, meta, bound = _service.on_pool("scan", _index.search_bounded, user_vec, user_id, candidates)
+        if len(ids) < len(_index) - 1:
+            match_score, pct, distance = _match_scores(user_id, sims, meta)
+            floor = _similarity_to_pct(bound)  # best score anyone left out can get, missed ANN neighbours included
+            page = select_candidate_page(match_score, ids, limit, after, floor)
+            if page is not None:
+                return _match_page(ids, match_score, pct, distance, *page)
+    ids, sims, meta = _service.on_pool("scan", _index.search, user_vec, user_id)
+    match_score, pct, distance = _match_scores(user_id, sims, meta)
+    return _match_page(ids, match_score, pct, distance, *select_page(match_score, ids, limit, after))
+
+
+def _match_scores(user_id: str, sims: np.ndarray, meta: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(matchScore, similarity %, distance) per candidate; matchScore is rounded as returned."""
+    distance = np.round(0.5 + 11.5 * pair_jitter(user_id, meta["jitter"]), 1)
+    pct = _similarity_to_pct(sims.astype(np.float64))
+    return np.round(np.clip(pct - np.minimum(10, distance * 0.5), 0, 100), 1), pct, distance
+
+
+def _match_page(ids, match_score, pct, distance, rows, next_after) -> tuple[list[dict], str | None]:
+    matches = [
+        {
+            "id": uid,
+            "emoji": "💜",
+            "matchScore": score,
+            "similarityScore": round(sim, 1),
+            "distance": dist,
+            "traits": "Emotional compatibility",
+        }
+        for uid, score, sim, dist in zip(
+            ids[rows].tolist(), match_score[rows].tolist(), pct[rows].tolist(), distance[rows].tolist()
+        )
+    ]
+    return matches, encode_cursor(*next_after) if next_after else None
 
 
 # --- Routes ---
@@ -165,7 +253,14 @@ def health():
     conn = get_db()
     count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
     conn.close()
-    return jsonify({"ok": True, "db_size": count})
+    result = {"db_size": count, "index": _index.stats()}
+    if _ann is not None:
+        result["ann"] = _ann.stats()
+    result, status = _service.health(result)
+    return jsonify(result), status
+
+
+register_admin_routes(app, _service, lambda: _db_path, embedding_dim, _index.update_vectors)
 
 
 @app.route("/api/questions", methods=["GET"])
@@ -189,101 +284,139 @@ def get_questions():
 
 @app.route("/api/embed", methods=["POST"])
 def embed():
-    """Compute 64-dim embedding from 5 Q/A. Body: { questions, answers }."""
+    """Compute 64-dim embedding from up to 5 Q/A (a null or blank answer is skipped). Body: { questions, answers }."""
     data = request.get_json()
-    if not data or "questions" not in data or "answers" not in data:
-        return jsonify({"error": "questions and answers required"}), 400
-    questions = data["questions"]
-    answers = data["answers"]
-    if len(questions) != 5 or len(answers) != 5:
-        return jsonify({"error": "need exactly 5 questions and 5 answers"}), 400
     try:
-        vec = _embed(questions, answers)
-        return jsonify({"vector": vec})
+        questions, answers = _service.profile_pair(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        vec, _, _, version = _service.embed_full(questions, answers)
+        return jsonify({"vector": vec, "model_version": version})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/embed-batch", methods=["POST"])
+def embed_batch():
+    """
+    Compute embeddings for many profiles with one encoder pass and one forward pass.
+    Body: { profiles: [{ questions, answers, city? }, ...], save? }
+    Returns { results, errors }: one entry per profile in request order, either
+    { vector, model_version } (plus user_id when saved) or { error }. Saved users are inserted in one transaction.
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get("profiles"), list):
+        return jsonify({"error": "profiles array required"}), 400
+    items = data["profiles"]
+    if len(items) > MAX_EMBED_BATCH:
+        return jsonify({"error": f"at most {MAX_EMBED_BATCH} profiles per batch"}), 400
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        try:
+            questions, answers = _service.profile_pair(item)
+        except ValueError as e:
+            results[i] = {"error": str(e)}
+            continue
+        valid.append((i, questions, answers, str(item.get("city", ""))))
+    try:
+        embedded = _service.embed_batch([(q, a) for _, q, a, _ in valid]) if valid else []
+        for (i, _, _, _), (vec, _, _, version) in zip(valid, embedded):
+            results[i] = {"vector": vec, "model_version": version}
+        if data.get("save") and valid:
+            added = []
+            conn = get_db()
+            try:
+                for (i, questions, answers, city), (vec, Q, A, version) in zip(valid, embedded):
+                    user_id = _generate_user_id()
+                    conn.execute("INSERT INTO users (id, vector, vector_format, city, model_version) VALUES (?, ?, ?, ?, ?)",
+                                 (user_id, pack_vector(vec), WRITE_FORMAT, city, version))
+                    insert_response(conn, user_id, json.dumps(questions), json.dumps(answers), Q, A)
+                    results[i]["user_id"] = user_id
+                    added.append(_index_row(user_id, vec))
+                conn.commit()
+            finally:
+                conn.close()
+            _index.upsert_many(added)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"results": results, "errors": len(items) - len(valid)})
+
+
 @app.route("/api/matches", methods=["GET"])
 def get_matches():
-    """Returns emotional compatibility matches. Query: user_id=EMO-XXXXXX"""
+    """
+    Returns emotional compatibility matches. Query: user_id=EMO-XXXXXX, limit?, cursor?
+    With limit, returns one page and next_cursor (null on the last page); pass it back as cursor.
+    """
     user_id = request.args.get("user_id")
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
-    conn = get_db()
-    row = conn.execute("SELECT vector FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
-    if not row:
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    user_vec = _index.vector(user_id)
+    if user_vec is None:
         return jsonify({"error": "user not found"}), 404
-    user_vec = json.loads(row["vector"])
-    db_users = _load_users_from_db(exclude_id=user_id)
-    results = []
-    for u in db_users:
-        raw_sim = _cosine_sim(user_vec, u["vector"])
-        pct = _similarity_to_pct(raw_sim)
-        dist_penalty = min(10, u["distance"] * 0.5)
-        match_score = max(0, min(100, pct - dist_penalty))
-        results.append({
-            "id": u["id"],
-            "emoji": "💜",
-            "matchScore": round(match_score, 1),
-            "similarityScore": round(pct, 1),
-            "distance": u["distance"],
-            "traits": f"Emotional compatibility",
-        })
-    results.sort(key=lambda x: -x["matchScore"])
-    return jsonify({"matches": results})
+    matches, next_cursor = _match_results(user_vec, user_id, limit, after)
+    if limit is None:
+        return jsonify({"matches": matches})
+    return jsonify({"matches": matches, "next_cursor": next_cursor})
 
 
 @app.route("/api/matches", methods=["POST"])
 def matches():
-    """Register user and return matches. Body: { vector, city?, user_id?, questions?, answers? }"""
+    """Register user and return matches. Body: { vector, city?, user_id?, questions?, answers?, limit?, cursor? }"""
     data = request.get_json()
     if not data or "vector" not in data:
         return jsonify({"error": "vector required"}), 400
-    user_vec = data["vector"]
+    try:
+        limit, after = parse_page_args(data)
+        user_vec = check_vector(data["vector"]).tolist()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     city = data.get("city", "")
     user_id = data.get("user_id")
     questions = data.get("questions")
     answers = data.get("answers")
+    model_version = _service.registry.active_version  # set server-side; a client-sent model_version is ignored
 
-    conn = get_db()
-    if user_id:
-        conn.execute(
-            "UPDATE users SET vector=?, city=? WHERE id=?",
-            (json.dumps(user_vec), city, user_id),
-        )
-    else:
-        user_id = _generate_user_id()
-        conn.execute(
-            "INSERT INTO users (id, vector, city) VALUES (?, ?, ?)",
-            (user_id, json.dumps(user_vec), city),
-        )
+    # The profile's raw Q/A embeddings (a profile-memo hit after /api/embed), before any write
+    raw = None
     if questions and answers:
-        conn.execute(
-            "INSERT INTO responses (user_id, questions, answers) VALUES (?, ?, ?)",
-            (user_id, json.dumps(questions), json.dumps(answers)),
-        )
-    conn.commit()
-    conn.close()
+        try:
+            raw = _service.raw_embeddings(questions, answers)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
 
-    db_users = _load_users_from_db(exclude_id=user_id)
-    results = []
-    for u in db_users:
-        raw_sim = _cosine_sim(user_vec, u["vector"])
-        pct = _similarity_to_pct(raw_sim)
-        dist_penalty = min(10, u["distance"] * 0.5)
-        match_score = max(0, min(100, pct - dist_penalty))
-        results.append({
-            "id": u["id"],
-            "emoji": "💜",
-            "matchScore": round(match_score, 1),
-            "similarityScore": round(pct, 1),
-            "distance": u["distance"],
-            "traits": "Emotional compatibility",
-        })
-    results.sort(key=lambda x: -x["matchScore"])
-    return jsonify({"user_id": user_id, "matches": results})
+    conn = get_db()
+    try:
+        if user_id:
+            stored = conn.execute(
+                "UPDATE users SET vector=?, vector_format=?, city=?, model_version=? WHERE id=?",
+                (pack_vector(user_vec), WRITE_FORMAT, city, model_version, user_id),
+            ).rowcount
+        else:
+            user_id = _generate_user_id()
+            conn.execute(
+                "INSERT INTO users (id, vector, vector_format, city, model_version) VALUES (?, ?, ?, ?, ?)",
+                (user_id, pack_vector(user_vec), WRITE_FORMAT, city, model_version),
+            )
+            stored = 1
+        if raw is not None:
+            insert_response(conn, user_id, json.dumps(questions), json.dumps(answers), *raw)
+        conn.commit()
+    finally:
+        conn.close()
+    if stored:  # an unknown user_id updates nothing, so it stays out of the index too
+        _index.upsert_many([_index_row(user_id, user_vec)])
+
+    matches, next_cursor = _match_results(user_vec, user_id, limit, after)
+    if limit is None:
+        return jsonify({"user_id": user_id, "matches": matches})
+    return jsonify({"user_id": user_id, "matches": matches, "next_cursor": next_cursor})
 
 
 @app.route("/api/seed-fake", methods=["GET", "POST"])
@@ -302,32 +435,65 @@ def seed_fake():
         return jsonify({"ok": False, "error": "No question sets or responses"}), 500
     rng = random.Random(42)
     conn = get_db()
-    added = 0
+    added = []
     try:
         for i in range(n):
             q_set = rng.choice(sets)[:5]
             resp = rng.choice(responses)
             ans = (resp.get("answers", []) + ["I'm not sure."] * 5)[:5]
-            vec = _embed(q_set, ans)
+            vec, Q, A, version = _service.embed_full(q_set, ans)
             bot_id = f"EMO-BOT-{i:03d}-" + "".join(rng.choices(string.ascii_uppercase + string.digits, k=4))
-            conn.execute("INSERT INTO users (id, vector, city) VALUES (?, ?, ?)",
-                         (bot_id, json.dumps(vec), ""))
-            conn.execute("INSERT INTO responses (user_id, questions, answers) VALUES (?, ?, ?)",
-                         (bot_id, json.dumps(q_set), json.dumps(ans)))
-            added += 1
+            conn.execute("INSERT INTO users (id, vector, vector_format, city, model_version) VALUES (?, ?, ?, ?, ?)",
+                         (bot_id, pack_vector(vec), WRITE_FORMAT, "", version))
+            insert_response(conn, bot_id, json.dumps(q_set), json.dumps(ans), Q, A)
+            added.append(_index_row(bot_id, vec))
         conn.commit()
     finally:
         conn.close()
-    return jsonify({"ok": True, "added": added})
+    _index.upsert_many(added)
+    return jsonify({"ok": True, "added": len(added)})
+
+
+def setup():
+    """
+    Load the models, question bank, database and vector index, then start the
+    background warmup. Runs once: from __main__, or on the first request when
+    the app is served by a WSGI server instead.
+    """
+    global _setup_done
+    with _setup_lock:
+        if _setup_done:
+            return
+        print("Configuring CPU pools...")
+        _service.start_cpu_pools()
+        print("Loading emo compression model...")
+        _load_models()
+        print("Loading sentence encoder...")
+        warmup_encoder()
+        print("Loading question sets...")
+        _load_questions()
+        print("Embedding question bank...")
+        _load_question_bank()
+        print("Starting embedding micro-batcher...")
+        _service.start_batcher()
+        print("Initializing database...")
+        init_db()
+        print("Loading vector index...")
+        _load_index()
+        _start_ann()
+        print(f"Warming up ({model_artifacts.RUNTIME} runtime) in the background...")
+        _service.start_warmup(_question_bank.texts)
+        _setup_done = True
+
+
+@app.before_request
+def _setup_on_first_request():
+    if not _setup_done:
+        setup()
 
 
 if __name__ == "__main__":
-    print("Loading emo compression model...")
-    _load_models()
-    print("Loading question sets...")
-    _load_questions()
-    print("Initializing database...")
-    init_db()
+    setup()
     port = int(os.environ.get("PORT", 5031))
     print(f"Emo ready. Open http://127.0.0.1:{port}")
     app.run(host="0.0.0.0", port=port, debug=True, use_reloader=False)
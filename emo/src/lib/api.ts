@@ -26,8 +26,8 @@ export async function embed(questions: string[], answers: string[]): Promise<{ v
 
 export async function getMatches(
   vector: number[],
-  options?: { city?: string; user_id?: string; questions?: string[]; answers?: string[] }
-): Promise<{ user_id: string; matches: EmoMatch[] }> {
+  options?: { city?: string; user_id?: string; questions?: string[]; answers?: string[]; limit?: number; cursor?: string }
+): Promise<{ user_id: string; matches: EmoMatch[]; next_cursor?: string | null }> {
   const res = await fetch(`${API_BASE}/api/matches`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
@@ -37,6 +37,8 @@ export async function getMatches(
       user_id: options?.user_id,
       questions: options?.questions,
       answers: options?.answers,
+      limit: options?.limit,
+      cursor: options?.cursor,
     }),
   });
   if (!res.ok) {
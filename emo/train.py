@@ -14,11 +14,15 @@ if _parent not in sys.path:
     sys.path.insert(0, _parent)
 sys.path.insert(0, _here)
 
-from response_modify import vectorize_5qa
+from response_modify import embedding_dim, encoder_identity, projection_state, set_projection, to_matrix
 from compression_model_5xn import CompressionModel5xn, SimilarityConsistencyLoss5xn
+from dim_reduction import Projection
+from embedding_bank import EmbeddingBank
 
 DATA_PATH = os.path.join(_here, "emotional_answers.json")
 SAVE_PATH = os.path.join(_here, "compression_model_emo.pt")
+BANK_PATH = os.path.join(_here, "corpus_embeddings")  # .npy + .json written by `python train.py --encode-corpus`
+PAD_ANSWER = "I'm not sure."
 
 
 def get_device() -> torch.device:
@@ -48,26 +52,36 @@ def build_pairs(data: dict, n_pairs: int, seed: int = 42) -> list:
         a1 = u1["answers"]
         a2 = u2["answers"]
         if len(a1) < 5 or len(a2) < 5:
-            a1 = (a1 + ["I'm not sure."] * 5)[:5]
-            a2 = (a2 + ["I'm not sure."] * 5)[:5]
+            a1 = (a1 + [PAD_ANSWER] * 5)[:5]
+            a2 = (a2 + [PAD_ANSWER] * 5)[:5]
         pairs.append((q_set[:5], a1[:5], q_set[:5], a2[:5]))
     return pairs
 
 
-def collate_batch(pairs: list, device: torch.device) -> tuple:
-    Q1_list, A1_list, Q2_list, A2_list = [], [], [], []
-    for q1, a1, q2, a2 in pairs:
-        Q1, A1 = vectorize_5qa(q1, a1)
-        Q2, A2 = vectorize_5qa(q2, a2)
-        Q1_list.append(Q1)
-        A1_list.append(A1)
-        Q2_list.append(Q2)
-        A2_list.append(A2)
-    Q1 = torch.tensor(np.stack(Q1_list), dtype=torch.float32, device=device)
-    A1 = torch.tensor(np.stack(A1_list), dtype=torch.float32, device=device)
-    Q2 = torch.tensor(np.stack(Q2_list), dtype=torch.float32, device=device)
-    A2 = torch.tensor(np.stack(A2_list), dtype=torch.float32, device=device)
-    return Q1, A1, Q2, A2
+def corpus_strings(data: dict) -> list[str]:
+    """Every string build_pairs can emit: set questions, answers and the padding answer."""
+    strings = [q for q_set in data["question_sets"] for q in q_set[:5]]
+    for resp in data["responses"]:
+        strings.extend(resp["answers"][:5])
+    strings.append(PAD_ANSWER)
+    return strings
+
+
+def encode_corpus(data: dict, dtype=np.float32) -> EmbeddingBank:
+    """Offline step: encode the corpus once into BANK_PATH; reused while it covers the data under the same encoder."""
+    return EmbeddingBank.load_or_build(
+        BANK_PATH, corpus_strings(data), to_matrix, dtype=dtype, dim=embedding_dim(), identity=encoder_identity()
+    )
+
+
+def index_pairs(pairs: list, bank: EmbeddingBank) -> np.ndarray:
+    """(q1, a1, q2, a2) string pairs → (n_pairs, 4, 5) array of bank row ids."""
+    return np.array([[bank.ids(part) for part in pair] for pair in pairs], dtype=np.int64)
+
+
+def collate_batch(idx: np.ndarray, bank: EmbeddingBank, device: torch.device) -> tuple:
+    rows = torch.from_numpy(bank.gather(idx)).to(device)  # (B, 4, 5, n)
+    return rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
 
 
 def save_checkpoint(model, loss_fn, epoch, loss):
@@ -76,16 +90,22 @@ def save_checkpoint(model, loss_fn, epoch, loss):
         "loss": loss,
         "model_state_dict": model.state_dict(),
         "loss_fn_state_dict": loss_fn.state_dict(),
+        "n": model.n,
+        "projection": projection_state(),
     }, SAVE_PATH)
 
 
 def load_checkpoint(path=None, device=None):
+    """Load model + loss; also switches to_matrix to the encoder projection the checkpoint was trained with."""
     path = path or SAVE_PATH
     device = device or get_device()
-    model = CompressionModel5xn(n=384).to(device)
+    ckpt = torch.load(path, map_location=device, weights_only=True) if os.path.exists(path) else None
+    if ckpt is not None:
+        projection = ckpt.get("projection")
+        set_projection(Projection.from_dict(projection) if projection else None)
+    model = CompressionModel5xn(n=ckpt.get("n", 384) if ckpt else embedding_dim()).to(device)
     loss_fn = SimilarityConsistencyLoss5xn().to(device)
-    if os.path.exists(path):
-        ckpt = torch.load(path, map_location=device, weights_only=True)
+    if ckpt is not None:
         model.load_state_dict(ckpt["model_state_dict"])
         loss_fn.load_state_dict(ckpt["loss_fn_state_dict"], strict=False)
         print(f"Loaded checkpoint from epoch {ckpt['epoch']} (loss={ckpt['loss']:.4f})")
@@ -95,19 +115,20 @@ def load_checkpoint(path=None, device=None):
 def train(n_epochs=200, batch_size=8, n_pairs=64):
     device = get_device()
     data = load_data()
-    model = CompressionModel5xn(n=384).to(device)
+    model = CompressionModel5xn(n=embedding_dim()).to(device)
     loss_fn = SimilarityConsistencyLoss5xn().to(device)
     opt = torch.optim.Adam(list(model.parameters()) + list(loss_fn.parameters()), lr=1e-3)
-    pairs = build_pairs(data, n_pairs=n_pairs)
+    bank = encode_corpus(data)
+    pairs = index_pairs(build_pairs(data, n_pairs=n_pairs), bank)
     n_batches = max(1, (len(pairs) + batch_size - 1) // batch_size)
     best_loss = float("inf")
 
     for epoch in range(n_epochs):
-        random.shuffle(pairs)
+        pairs = pairs[np.random.permutation(len(pairs))]
         total = 0.0
         for i in range(0, len(pairs), batch_size):
             batch = pairs[i : i + batch_size]
-            Q1, A1, Q2, A2 = collate_batch(batch, device)
+            Q1, A1, Q2, A2 = collate_batch(batch, bank, device)
             opt.zero_grad()
             v1, v2 = model(Q1, A1), model(Q2, A2)
             loss = loss_fn(A1, A2, v1, v2)
@@ -126,4 +147,9 @@ def train(n_epochs=200, batch_size=8, n_pairs=64):
 
 
 if __name__ == "__main__":
-    train(n_epochs=200, batch_size=16, n_pairs=48)
+    if "--encode-corpus" in sys.argv:
+        dtype = np.float16 if "--float16" in sys.argv else np.float32
+        bank = encode_corpus(load_data(), dtype=dtype)
+        print(f"Encoded {len(bank)} strings to {BANK_PATH}.npy")
+    else:
+        train(n_epochs=200, batch_size=16, n_pairs=48)
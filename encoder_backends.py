@@ -0,0 +1,258 @@
+"""Sentence-encoder backends: eager PyTorch, int8 dynamic quantization, ONNX Runtime.
+
+Select one with ENCODER_BACKEND (torch | torch-int8 | onnx | onnx-int8).
+Check a candidate against the reference before switching:
+
+    python encoder_backends.py --backend onnx --checkpoint friend/compression_model.pt \\
+        --corpus friend/personality_answers.json friend/niche_questions.json
+"""
+
+from __future__ import annotations
+
+import abc
+import argparse
+import json
+import os
+import random
+import time
+from typing import Sequence
+
+import numpy as np
+
+DEFAULT_ENCODER = "all-MiniLM-L6-v2"
+DEFAULT_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")
+ONNX_INT8_FILE = os.environ.get("ENCODER_ONNX_INT8_FILE", "onnx/model_qint8_avx2.onnx")
+
+
+class EncoderBackend(abc.ABC):
+    """Common interface: encode(strings) → (len(strings), dim) float32."""
+
+    backend = "base"
+
+    def __init__(self, model_name: str = DEFAULT_ENCODER):
+        self.model_name = model_name
+        self._st = self._load()
+
+    @abc.abstractmethod
+    def _load(self):
+        """Build the underlying SentenceTransformer (or a compatible object with ``encode``)."""
+
+    @property
+    def cache_name(self) -> str:
+        return cache_name(self.backend, self.model_name)
+
+    @property
+    def dim(self) -> int:
+        return self._st.get_sentence_embedding_dimension()
+
+    def encode(self, strings, batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        single = isinstance(strings, str)
+        out = self._st.encode(
+            [strings] if single else list(strings),
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar,
+        )
+        out = np.asarray(out, dtype=np.float32)
+        return out[0] if single else out
+
+
+class TorchEncoder(EncoderBackend):
+    """Reference backend: SentenceTransformer in eager PyTorch."""
+
+    backend = "torch"
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.model_name)
+
+
+class QuantizedTorchEncoder(EncoderBackend):
+    """Eager PyTorch with every nn.Linear dynamically quantized to int8 (CPU only)."""
+
+    backend = "torch-int8"
+
+    def _load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        st = SentenceTransformer(self.model_name, device="cpu")
+        return torch.ao.quantization.quantize_dynamic(st, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxEncoder(EncoderBackend):
+    """Exported ONNX graph run by ONNX Runtime (needs ``optimum[onnxruntime]``)."""
+
+    backend = "onnx"
+    file_name = None
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if self.file_name:
+            model_kwargs["file_name"] = self.file_name
+        return SentenceTransformer(self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+class OnnxInt8Encoder(OnnxEncoder):
+    """ONNX Runtime with the int8-quantized graph (ENCODER_ONNX_INT8_FILE)."""
+
+    backend = "onnx-int8"
+    file_name = ONNX_INT8_FILE
+
+
+BACKENDS = {
+    cls.backend: cls for cls in (TorchEncoder, QuantizedTorchEncoder, OnnxEncoder, OnnxInt8Encoder)
+}
+
+
+def cache_name(backend: str, model_name: str = DEFAULT_ENCODER) -> str:
+    """Name used to key cached embeddings; backends that change outputs get their own namespace."""
+    if backend == "torch":
+        return model_name
+    return f"{model_name}:{backend}"
+
+
+def make_encoder(backend: str | None = None, model_name: str = DEFAULT_ENCODER) -> EncoderBackend:
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[backend](model_name)
+
+
+# --- Parity check ---
+
+
+def _row_cosines(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.maximum(np.linalg.norm(a, axis=-1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=-1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=-1)
+
+
+def _drift(a: np.ndarray, b: np.ndarray) -> dict:
+    cos = _row_cosines(a, b)
+    return {
+        "cos_mean": round(float(cos.mean()), 6),
+        "cos_min": round(float(cos.min()), 6),
+        "max_abs_diff": round(float(np.abs(a - b).max()), 6),
+    }
+
+
+def _timed_encode(encoder: EncoderBackend, strings: list[str]) -> tuple[np.ndarray, float]:
+    t0 = time.perf_counter()
+    out = encoder.encode(strings, batch_size=64)
+    return out, (time.perf_counter() - t0) * 1000.0
+
+
+def load_compression_model(path: str):
+    """
+    Load a 10×n or 5×n compression checkpoint on CPU, picking the class from its
+    shapes. Returns (model, projection): the encoder projection the checkpoint
+    was trained with (None for full 384-d rows), as in train.load_checkpoint.
+    """
+    import torch
+
+    from compression_model import CompressionModel
+    from compression_model_5xn import CompressionModel5xn
+    from dim_reduction import Projection
+
+    ckpt = torch.load(path, map_location="cpu", weights_only=True)
+    state = ckpt["model_state_dict"]
+    k = state["dot_scale"].shape[0]
+    n = ckpt.get("n", 384)
+    model = CompressionModel(n=n) if k == 10 else CompressionModel5xn(n=n)
+    model.load_state_dict(state)
+    projection = ckpt.get("projection")
+    return model.eval(), Projection.from_dict(projection) if projection else None
+
+
+def parity_report(
+    reference: EncoderBackend,
+    candidate: EncoderBackend,
+    strings: Sequence[str],
+    compression_model=None,
+    n_profiles: int = 64,
+    seed: int = 0,
+    projection=None,
+) -> dict:
+    """
+    Cosine drift of ``candidate`` against ``reference`` on the 384-d sentence
+    embeddings and, if a compression model is given, on its final 64-d vectors
+    for random profiles drawn from ``strings``. ``projection`` (the model's
+    encoder projection) is applied to the embeddings before the model sees them.
+    """
+    strings = list(strings)
+    ref, ref_ms = _timed_encode(reference, strings)
+    cand, cand_ms = _timed_encode(candidate, strings)
+    report = {
+        "reference": reference.backend,
+        "candidate": candidate.backend,
+        "n_strings": len(strings),
+        "encode_ms": {"reference": round(ref_ms, 1), "candidate": round(cand_ms, 1)},
+        "embedding_384": _drift(ref, cand),
+    }
+    if compression_model is not None:
+        import torch
+        import torch.nn.functional as F
+
+        k = compression_model.dot_scale.shape[0]
+        rng = random.Random(seed)
+        idx = np.array([rng.sample(range(len(strings)), 2 * k) for _ in range(n_profiles)])
+
+        def vectors(emb: np.ndarray) -> np.ndarray:
+            if projection is not None:
+                emb = projection.apply(emb)
+            rows = torch.tensor(emb[idx], dtype=torch.float32)  # (P, 2k, n)
+            with torch.no_grad():
+                v = compression_model(rows[:, :k], rows[:, k:])
+            return F.normalize(v, dim=-1).numpy()
+
+        report["vector_64"] = _drift(vectors(ref), vectors(cand))
+    return report
+
+
+def _corpus_strings(paths: Sequence[str], limit: int, seed: int) -> list[str]:
+    found: list[str] = []
+
+    def walk(node):
+        if isinstance(node, str):
+            if len(node) > 3:
+                found.append(node)
+        elif isinstance(node, dict):
+            for v in node.values():
+                walk(v)
+        elif isinstance(node, list):
+            for v in node:
+                walk(v)
+
+    for path in paths:
+        with open(path) as f:
+            walk(json.load(f))
+    unique = list(dict.fromkeys(found))
+    random.Random(seed).shuffle(unique)
+    return unique[:limit]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare an encoder backend against the PyTorch reference.")
+    parser.add_argument("--backend", required=True, choices=sorted(BACKENDS))
+    parser.add_argument("--reference", default="torch", choices=sorted(BACKENDS))
+    parser.add_argument("--model-name", default=DEFAULT_ENCODER)
+    parser.add_argument("--checkpoint", help="compression_model .pt to also compare 64-d vectors")
+    parser.add_argument("--corpus", nargs="+", required=True, help="JSON files to draw test strings from")
+    parser.add_argument("--limit", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    strings = _corpus_strings(args.corpus, args.limit, args.seed)
+    model, projection = load_compression_model(args.checkpoint) if args.checkpoint else (None, None)
+    report = parity_report(
+        make_encoder(args.reference, args.model_name),
+        make_encoder(args.backend, args.model_name),
+        strings,
+        compression_model=model,
+        seed=args.seed,
+        projection=projection,
+    )
+    print(json.dumps(report, indent=2))
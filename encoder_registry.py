@@ -0,0 +1,64 @@
+"""Process-wide, lazily loaded sentence encoders shared by every app in the process."""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from encoder_backends import DEFAULT_BACKEND, DEFAULT_ENCODER, EncoderBackend, cache_name, make_encoder
+
+_lock = threading.Lock()
+_encoders: dict[tuple[str, str], EncoderBackend] = {}
+_load_seconds: dict[tuple[str, str], float] = {}
+
+
+def get_encoder(backend: str | None = None, model_name: str = DEFAULT_ENCODER) -> EncoderBackend:
+    """Return the shared encoder for (backend, model_name), loading it on first use."""
+    key = (backend or DEFAULT_BACKEND, model_name)
+    encoder = _encoders.get(key)
+    if encoder is not None:
+        return encoder
+    with _lock:
+        encoder = _encoders.get(key)
+        if encoder is None:
+            t0 = time.perf_counter()
+            encoder = make_encoder(*key)
+            _load_seconds[key] = time.perf_counter() - t0
+            _encoders[key] = encoder
+            print(f"Loaded encoder {model_name} ({key[0]}) in {_load_seconds[key]:.2f}s")
+    return encoder
+
+
+def stats() -> dict:
+    """Which encoders are resident and how long each took to load."""
+    return {
+        f"{name}:{backend}": {"load_seconds": round(secs, 3)}
+        for (backend, name), secs in _load_seconds.items()
+    }
+
+
+class LazyEncoder:
+    """Drop-in for an encoder object that defers loading until the first encode()."""
+
+    def __init__(self, backend: str | None = None, model_name: str = DEFAULT_ENCODER):
+        self.backend = backend or DEFAULT_BACKEND
+        self.model_name = model_name
+
+    @property
+    def cache_name(self) -> str:
+        return cache_name(self.backend, self.model_name)
+
+    @property
+    def loaded(self) -> bool:
+        return (self.backend, self.model_name) in _encoders
+
+    def encode(self, strings, batch_size: int = 32, show_progress_bar: bool = False):
+        return get_encoder(self.backend, self.model_name).encode(
+            strings, batch_size=batch_size, show_progress_bar=show_progress_bar
+        )
+
+    def warmup(self) -> float:
+        """Load now (servers call this at startup) and run one tiny encode; returns seconds spent."""
+        t0 = time.perf_counter()
+        self.encode(["warmup"])
+        return time.perf_counter() - t0
@@ -1,15 +1,92 @@
-from sentence_transformers import SentenceTransformer
+import os
+import sys
+import threading
+
 import numpy as np
 
-# Load a pretrained model once (do this at startup)
-model = SentenceTransformer("all-MiniLM-L6-v2")
+_here = os.path.dirname(os.path.abspath(__file__))
+_parent = os.path.dirname(_here)
+if _parent not in sys.path:
+    sys.path.insert(0, _parent)
+
+from dim_reduction import load_projection
+from embedding_cache import CACHE_ENABLED, EmbeddingCache, cached_encode
+from encoder_registry import LazyEncoder
+
+ENCODER_NAME = "all-MiniLM-L6-v2"
+
+# Shared process-wide encoder, loaded on first encode; backend comes from ENCODER_BACKEND
+model = LazyEncoder(model_name=ENCODER_NAME)
+
+# Optional reduced-dimension projection (ENCODER_PROJECTION=path.npz); loading a
+# checkpoint that records a projection switches to it via set_projection()
+_projection = load_projection(os.environ.get("ENCODER_PROJECTION"))
+
+# Persistent cache of encoded strings for _projection, shared by every app using this
+# encoder; opened on first use (_UNSET until then). Both change together under _lock.
+_UNSET = object()
+_cache = _UNSET
+_lock = threading.Lock()
+
+
+def _make_cache(projection):
+    if not CACHE_ENABLED:
+        return None
+    if projection is None:
+        return EmbeddingCache(model.cache_name, dim=384)
+    return EmbeddingCache(f"{model.cache_name}:{projection.tag}", dim=projection.dim)
+
+
+def _active():
+    """(projection, cache) as one consistent snapshot, opening the cache on first use."""
+    global _cache
+    with _lock:
+        if _cache is _UNSET:
+            _cache = _make_cache(_projection)
+        return _projection, _cache
+
+
+def embedding_dim() -> int:
+    """Width of to_matrix rows: 384, or the active projection's dimension."""
+    projection = _projection
+    return projection.dim if projection is not None else 384
+
+
+def projection_state() -> dict | None:
+    """Active projection in checkpoint-storable form (None when using full 384-d rows)."""
+    projection = _projection
+    return projection.to_dict() if projection is not None else None
+
+
+def encoder_identity() -> dict:
+    """What to_matrix rows depend on: encoder (backend + model) and projection; saved next to precomputed banks."""
+    projection = _projection
+    return {"encoder": model.cache_name, "projection": projection.tag if projection is not None else None}
+
+
+def set_projection(projection) -> None:
+    """Switch to_matrix to another projection (None = full 384-d); each projection has its own cache."""
+    global _projection, _cache
+    with _lock:
+        if projection is None and _projection is None:
+            return
+        if projection is not None and _projection is not None and projection.tag == _projection.tag:
+            return
+        _projection = projection
+        _cache = _UNSET
+
+
+def warmup() -> float:
+    """Load the encoder now instead of on the first request. Returns seconds spent."""
+    return model.warmup()
+
 
 def sentence_to_vector(sentence: str) -> np.ndarray:
     """
     Convert a sentence into a dense vector embedding.
     """
-    embedding = model.encode(sentence)
-    return embedding  # shape: (384,)
+    embedding = to_matrix([sentence])[0]
+    return embedding  # shape: (embedding_dim(),)
 
 # Example usage
 # if __name__ == "__main__":
@@ -21,12 +98,18 @@ def sentence_to_vector(sentence: str) -> np.ndarray:
 def to_matrix(strings: list[str], batch_size: int = 32) -> np.ndarray:
     """
     Convert a list of strings into a matrix of vectors.
-    Each row corresponds to one string. Uses batch encoding for efficiency.
+    Each row corresponds to one string. Cached strings are read from the
+    embedding cache; only misses are encoded, in one batch.
     """
+    projection, cache = _active()
     if not strings:
-        return np.array([]).reshape(0, 384)
-    embeddings = model.encode(strings, batch_size=batch_size, show_progress_bar=False)
-    return np.array(embeddings)
+        return np.array([]).reshape(0, projection.dim if projection is not None else 384)
+
+    def encode(batch: list[str]) -> np.ndarray:
+        out = model.encode(batch, batch_size=batch_size, show_progress_bar=False)
+        return out if projection is None else projection.apply(out)
+
+    return cached_encode(strings, encode, cache)
 
 
 def vectorize_pair(
@@ -38,7 +121,7 @@ def vectorize_pair(
     Use to_matrix internally; call with 10 questions and 10 answers per user.
     """
     all_strings = questions_1 + answers_1 + questions_2 + answers_2
-    all_embeddings = model.encode(all_strings, batch_size=64, show_progress_bar=False)
+    all_embeddings = to_matrix(all_strings, batch_size=64)
     n = len(questions_1)
     Q1 = np.array(all_embeddings[0:n])
     A1 = np.array(all_embeddings[n : 2 * n])
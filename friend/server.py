@@ -6,10 +6,9 @@ import random
 import sqlite3
 import string
 import sys
+import threading
 
 import numpy as np
-import torch
-import torch.nn.functional as F
 
 # Add parent dir so we can import from root (compression_model) when run from friend/
 _here = os.path.dirname(os.path.abspath(__file__))
@@ -21,16 +20,36 @@ os.chdir(_here)
 from flask import Flask, jsonify, request, send_from_directory
 
 from gravity_map import GravityLayoutConfig, compute_gravity_layout
-from response_modify import to_matrix
+from embedding_store import ensure_embedding_columns, insert_response
+import model_artifacts
+from embed_service import MAX_EMBED_BATCH, EmbedService, register_admin_routes
+from model_registry import ModelRegistry, ensure_version_column
+from vector_store import (
+    WRITE_FORMAT,
+    check_vector,
+    ensure_vector_format_column,
+    load_vectors,
+    pack_vector,
+    unpack_vector,
+)
+from question_bank import QuestionBank
+from vector_index import VectorIndex
+from match_pages import encode_cursor, pair_jitter, parse_page_args, select_candidate_page, select_page, user_jitter
+import ann_index
+from response_modify import embedding_dim, encoder_identity, set_projection, to_matrix, warmup as warmup_encoder
 from train import load_checkpoint, get_device, build_user_profile
 
 app = Flask(__name__, static_folder=".", static_url_path="")
 
 # Loaded at startup
-_model = None
-_device = None
 _db_path = os.path.join(_here, "friend.db")
 _niche_pool = []
+_question_bank = None
+_service = EmbedService(10, lambda questions: _question_matrix(questions), to_matrix, load_checkpoint, set_projection)
+_ann = None  # AnnMaintainer when ANN_INDEX=ivf
+_index = VectorIndex(columns=("standing", "traits", "jitter"), exact=lambda ids: load_vectors(_db_path, ids))
+_setup_lock = threading.Lock()
+_setup_done = False
 
 _global_questions = [
     "What are your biggest motivations?",
@@ -52,10 +71,12 @@ def init_db():
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
-            vector TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            vector_format TEXT,
             city TEXT NOT NULL DEFAULT '',
             interests TEXT NOT NULL DEFAULT '[]',
             standing INTEGER NOT NULL DEFAULT 87,
+            model_version TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         CREATE TABLE IF NOT EXISTS responses (
@@ -63,11 +84,16 @@ def init_db():
             user_id TEXT NOT NULL,
             questions TEXT NOT NULL,
             answers TEXT NOT NULL,
+            q_embeddings BLOB,
+            a_embeddings BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users(id)
         );
     """)
     conn.commit()
+    ensure_embedding_columns(conn)
+    ensure_version_column(conn)
+    ensure_vector_format_column(conn)
     conn.close()
 
 
@@ -82,26 +108,29 @@ def _load_niche_pool():
         _niche_pool = []
 
 
+def _load_question_bank():
+    """Embed the global + niche question universe once, or load it from question_embeddings.npy."""
+    global _question_bank
+    texts = _global_questions + [qa["question"] for qa in _niche_pool]
+    path = os.path.join(_here, "question_embeddings.npy")
+    _question_bank = QuestionBank.load_or_build(
+        path, texts, to_matrix, dim=embedding_dim(), identity=encoder_identity()
+    )
+
+
+def _question_matrix(questions: list[str]) -> np.ndarray:
+    if _question_bank is None:
+        return to_matrix(questions)
+    return _question_bank.encode(questions, to_matrix)
+
+
 def _load_models():
-    global _model, _device
-    _device = get_device()
+    _service.device = get_device()
     model_path = os.path.join(_here, "compression_model.pt")
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model not found: {model_path}. Run train.py first.")
-    _model, _ = load_checkpoint(path=model_path, device=_device)
-    _model.eval()
-
-
-def _embed(questions: list[str], answers: list[str]) -> list[float]:
-    """Compute 64-dim embedding for one user."""
-    all_strings = questions + answers
-    embeddings = to_matrix(all_strings)
-    Q = torch.tensor(embeddings[:10], dtype=torch.float32, device=_device).unsqueeze(0)
-    A = torch.tensor(embeddings[10:20], dtype=torch.float32, device=_device).unsqueeze(0)
-    with torch.no_grad():
-        v = _model(Q, A)
-        v = F.normalize(v, dim=-1)
-        return v.cpu().numpy().flatten().tolist()
+    _service.registry = ModelRegistry(model_path, _service.load_model_file)
+    print(f"Active model version: {_service.registry.start()}")
 
 
 def _cosine_sim(vec_a: list[float], vec_b: list[float]) -> float:
@@ -110,6 +139,79 @@ def _cosine_sim(vec_a: list[float], vec_b: list[float]) -> float:
     return float(np.dot(a, b))
 
 
+def _index_row(user_id: str, vector: list[float], interests, standing: int) -> tuple[str, list[float], dict]:
+    """(id, vector, metadata) row for the resident index, with traits pre-joined for the match list."""
+    traits = " • ".join(interests) if isinstance(interests, list) else ""
+    return user_id, vector, {"standing": standing, "traits": traits, "jitter": user_jitter(user_id)}
+
+
+def _load_index():
+    """Load every stored user into the resident vector index (once, at startup)."""
+    conn = get_db()
+    rows = conn.execute("SELECT id, vector, vector_format, interests, standing FROM users").fetchall()
+    conn.close()
+    added = []
+    for row in rows:
+        try:
+            vec = check_vector(unpack_vector(row["vector"], row["vector_format"]))
+            added.append(_index_row(row["id"], vec, json.loads(row["interests"]), row["standing"]))
+        except ValueError as e:
+            print(f"Skipping user {row['id']} in the vector index: {e}")
+    _index.upsert_many(added)
+
+
+def _start_ann():
+    """With ANN_INDEX=ivf, attach an approximate index to the resident one (loaded or trained in the background)."""
+    global _ann
+    if ann_index.ENABLED:
+        _ann = ann_index.AnnMaintainer(_index, _db_path + ".ivf.npz")
+        _ann.start()
+
+
+def _match_results(
+    user_vec: list[float], user_id: str, limit: int | None = None, after: tuple[float, str] | None = None
+) -> tuple[list[dict], str | None]:
+    """
+    Score every other indexed user against user_vec in one pass (scan CPU pool); best match first.
+    Returns the page after ``after`` (at most ``limit`` matches) and the cursor of the next page.
+    With the approximate index on, a page is first served from its nearest users (at least
+    ANN_CANDIDATES) when nobody left out, including neighbours the index missed, can rank
+    inside it (see VectorIndex.search_bounded); otherwise,
+    and for unlimited requests, every user is scored.
+    """
+    if _ann is not None and limit is not None:
+        _ann.refresh()
+        candidates = max(ann_index.CANDIDATES, 4 * limit)
+        ids, sims, meta, bound = _service.on_pool("scan", _index.search_bounded, user_vec, user_id, candidates)
+        if len(ids) < len(_index) - 1:
+            match_score, distance = _match_scores(user_id, sims, meta)
+            floor = ((bound + 1) / 2) * 100  # best score anyone left out can get, missed ANN neighbours included
+            page = select_candidate_page(match_score, ids, limit, after, floor)
+            if page is not None:
+                return _match_page(ids, meta, match_score, distance, *page)
+    ids, sims, meta = _service.on_pool("scan", _index.search, user_vec, user_id)
+    match_score, distance = _match_scores(user_id, sims, meta)
+    return _match_page(ids, meta, match_score, distance, *select_page(match_score, ids, limit, after))
+
+
+def _match_scores(user_id: str, sims: np.ndarray, meta: dict) -> tuple[np.ndarray, np.ndarray]:
+    """(matchScore, distance) per candidate: similarity in percent minus the distance penalty, rounded as returned."""
+    distance = np.round(0.5 + 14.5 * pair_jitter(user_id, meta["jitter"]), 1)
+    score_pct = ((sims + 1) / 2) * 100
+    return np.round(np.clip(score_pct - distance * 1.5, 0, 100), 1), distance
+
+
+def _match_page(ids, meta, match_score, distance, rows, next_after) -> tuple[list[dict], str | None]:
+    matches = [
+        {"id": uid, "emoji": "👤", "matchScore": score, "distance": dist, "standing": standing, "traits": traits}
+        for uid, score, dist, standing, traits in zip(
+            ids[rows].tolist(), match_score[rows].tolist(), distance[rows].tolist(),
+            meta["standing"][rows].tolist(), meta["traits"][rows].tolist(),
+        )
+    ]
+    return matches, encode_cursor(*next_after) if next_after else None
+
+
 def _generate_user_id() -> str:
     return "USR-" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
@@ -131,50 +233,26 @@ def _generate_fake_profiles(n: int = 20) -> int:
     if not responses:
         return 0
     rng = random.Random(42)
-    inserted = 0
+    added = []
     conn = get_db()
     try:
         for _ in range(n):
             entry = rng.choice(responses)
             questions, answers = build_user_profile(entry, _niche_pool, rng)
-            vec = _embed(questions, answers)
+            vec, Q, A, version = _service.embed_full(questions, answers)
             bot_id = "BOT-" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
+            standing = rng.randint(75, 98)
             conn.execute(
-                "INSERT INTO users (id, vector, city, interests, standing) VALUES (?, ?, ?, ?, ?)",
-                (bot_id, json.dumps(vec), "", "[]", rng.randint(75, 98)),
+                "INSERT INTO users (id, vector, vector_format, city, interests, standing, model_version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (bot_id, pack_vector(vec), WRITE_FORMAT, "", "[]", standing, version),
             )
-            conn.execute(
-                "INSERT INTO responses (user_id, questions, answers) VALUES (?, ?, ?)",
-                (bot_id, json.dumps(questions), json.dumps(answers)),
-            )
-            inserted += 1
+            insert_response(conn, bot_id, json.dumps(questions), json.dumps(answers), Q, A)
+            added.append(_index_row(bot_id, vec, [], standing))
         conn.commit()
     finally:
         conn.close()
-    return inserted
-
-
-def _load_users_from_db() -> list[dict]:
-    conn = get_db()
-    cur = conn.execute(
-        "SELECT id, vector, city, interests, standing FROM users"
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    users = []
-    for row in rows:
-        vec = json.loads(row["vector"])
-        interests = json.loads(row["interests"])
-        users.append({
-            "id": row["id"],
-            "vector": vec,
-            "distance": round(random.uniform(0.5, 15), 1),
-            "standing": row["standing"],
-            "traits": interests if isinstance(interests, list) else [],
-            "emoji": "👤",
-        })
-    return users
+    _index.upsert_many(added)
+    return len(added)
 
 
 # --- Routes ---
@@ -256,18 +334,13 @@ def map_layout():
     # their stored 64‑d vectors (which were produced by compression_model.pt).
     # This gives the gravity map more structure than a simple star.
     try:
-        db_users = {u["id"]: u for u in _load_users_from_db()}
         for i in range(len(matches)):
             for j in range(i + 1, len(matches)):
                 uid_i = matches[i]["id"]
                 uid_j = matches[j]["id"]
-                ui = db_users.get(uid_i)
-                uj = db_users.get(uid_j)
-                if not ui or not uj:
-                    continue
-                vec_i = ui.get("vector")
-                vec_j = uj.get("vector")
-                if not vec_i or not vec_j:
+                vec_i = _index.vector(uid_i)
+                vec_j = _index.vector(uid_j)
+                if vec_i is None or vec_j is None:
                     continue
                 raw_sim = _cosine_sim(vec_i, vec_j)
                 score_pct = ((raw_sim + 1.0) / 2.0) * 100.0
@@ -299,7 +372,14 @@ def health():
     conn = get_db()
     count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
     conn.close()
-    return jsonify({"ok": True, "db_size": count})
+    result = {"db_size": count, "index": _index.stats()}
+    if _ann is not None:
+        result["ann"] = _ann.stats()
+    result, status = _service.health(result)
+    return jsonify(result), status
+
+
+register_admin_routes(app, _service, lambda: _db_path, embedding_dim, _index.update_vectors)
 
 
 @app.route("/api/seed-fake-profiles", methods=["GET", "POST"])
@@ -327,20 +407,18 @@ def get_questions():
 @app.route("/api/embed", methods=["POST"])
 def embed():
     """
-    Compute 64-dim personality embedding from questions + answers.
+    Compute 64-dim personality embedding from up to 10 questions + answers (a null or blank answer is skipped).
     Optionally saves responses when save=true and user data (city, interests, standing) provided.
-    Returns {vector} or {vector, user_id} if saved.
+    Returns {vector, model_version} or {vector, model_version, user_id} if saved.
     """
     data = request.get_json()
-    if not data or "questions" not in data or "answers" not in data:
-        return jsonify({"error": "questions and answers required"}), 400
-    questions = data["questions"]
-    answers = data["answers"]
-    if len(questions) != 10 or len(answers) != 10:
-        return jsonify({"error": "need exactly 10 questions and 10 answers"}), 400
     try:
-        vec = _embed(questions, answers)
-        result = {"vector": vec}
+        questions, answers = _service.profile_pair(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        vec, Q, A, version = _service.embed_full(questions, answers)
+        result = {"vector": vec, "model_version": version}
 
         # Optionally save user + responses
         if data.get("save") and data.get("city"):
@@ -353,15 +431,13 @@ def embed():
 
             conn = get_db()
             conn.execute(
-                "INSERT INTO users (id, vector, city, interests, standing) VALUES (?, ?, ?, ?, ?)",
-                (user_id, json.dumps(vec), city, json.dumps(interests), standing),
-            )
-            conn.execute(
-                "INSERT INTO responses (user_id, questions, answers) VALUES (?, ?, ?)",
-                (user_id, json.dumps(questions), json.dumps(answers)),
+                "INSERT INTO users (id, vector, vector_format, city, interests, standing, model_version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, pack_vector(vec), WRITE_FORMAT, city, json.dumps(interests), standing, version),
             )
+            insert_response(conn, user_id, json.dumps(questions), json.dumps(answers), Q, A)
             conn.commit()
             conn.close()
+            _index.upsert_many([_index_row(user_id, vec, interests, standing)])
             result["user_id"] = user_id
 
         return jsonify(result)
@@ -369,54 +445,97 @@ def embed():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/embed-batch", methods=["POST"])
+def embed_batch():
+    """
+    Compute embeddings for many profiles with one encoder pass and one forward pass.
+    Body: {profiles: [{questions, answers, city?, interests?, standing?}, ...], save?}
+    Returns {results, errors}: one entry per profile in request order, either
+    {vector, model_version} (plus user_id when saved) or {error}. Saved users are inserted in one transaction.
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get("profiles"), list):
+        return jsonify({"error": "profiles array required"}), 400
+    items = data["profiles"]
+    if len(items) > MAX_EMBED_BATCH:
+        return jsonify({"error": f"at most {MAX_EMBED_BATCH} profiles per batch"}), 400
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        try:
+            questions, answers = _service.profile_pair(item)
+            interests = item.get("interests", [])
+            if isinstance(interests, str):
+                interests = json.loads(interests) if interests else []
+            user = (str(item.get("city", "")), interests, int(item.get("standing", 87)))
+        except (ValueError, TypeError) as e:
+            results[i] = {"error": str(e)}
+            continue
+        valid.append((i, questions, answers, user))
+    try:
+        embedded = _service.embed_batch([(q, a) for _, q, a, _ in valid]) if valid else []
+        for (i, _, _, _), (vec, _, _, version) in zip(valid, embedded):
+            results[i] = {"vector": vec, "model_version": version}
+        if data.get("save") and valid:
+            added = []
+            conn = get_db()
+            try:
+                for (i, questions, answers, (city, interests, standing)), (vec, Q, A, version) in zip(valid, embedded):
+                    user_id = _generate_user_id()
+                    conn.execute(
+                        "INSERT INTO users (id, vector, vector_format, city, interests, standing, model_version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (user_id, pack_vector(vec), WRITE_FORMAT, city, json.dumps(interests), standing, version),
+                    )
+                    insert_response(conn, user_id, json.dumps(questions), json.dumps(answers), Q, A)
+                    results[i]["user_id"] = user_id
+                    added.append(_index_row(user_id, vec, interests, standing))
+                conn.commit()
+            finally:
+                conn.close()
+            _index.upsert_many(added)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"results": results, "errors": len(items) - len(valid)})
+
+
 @app.route("/api/matches", methods=["GET"])
 def get_matches():
-    """Returns matches for existing user. Query: user_id=USR-XXXXXX"""
+    """
+    Returns matches for existing user. Query: user_id=USR-XXXXXX, limit?, cursor?
+    With limit, returns one page and next_cursor (null on the last page); pass it back as cursor.
+    """
     user_id = request.args.get("user_id")
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
-    conn = get_db()
-    row = conn.execute(
-        "SELECT vector, city FROM users WHERE id = ?", (user_id,)
-    ).fetchone()
-    conn.close()
-    if not row:
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    user_vec = _index.vector(user_id)
+    if user_vec is None:
         return jsonify({"error": "user not found"}), 404
-    user_vec = json.loads(row["vector"])
-    db_users = [u for u in _load_users_from_db() if u["id"] != user_id]
-    results = []
-    for u in db_users:
-        raw_sim = _cosine_sim(user_vec, u["vector"])
-        score_pct = ((raw_sim + 1) / 2) * 100
-        dist_penalty = u["distance"] * 1.5
-        match_score = max(0, min(100, score_pct - dist_penalty))
-        traits_str = u["traits"]
-        if isinstance(traits_str, list):
-            traits_str = " • ".join(traits_str)
-        results.append({
-            "id": u["id"],
-            "emoji": u["emoji"],
-            "matchScore": round(match_score, 1),
-            "distance": u["distance"],
-            "standing": u["standing"],
-            "traits": traits_str,
-        })
-    results.sort(key=lambda x: -x["matchScore"])
-    return jsonify({"matches": results})
+    matches, next_cursor = _match_results(user_vec, user_id, limit, after)
+    if limit is None:
+        return jsonify({"matches": matches})
+    return jsonify({"matches": matches, "next_cursor": next_cursor})
 
 
 @app.route("/api/matches", methods=["POST"])
 def matches():
     """
     Registers user to DB (if not already) and returns matches.
-    Body: {vector, city, interests?, standing?, user_id?, questions?, answers?}
+    Body: {vector, city, interests?, standing?, user_id?, questions?, answers?, limit?, cursor?}
     If user_id provided, updates existing user. Otherwise creates new user.
-    If questions/answers provided, saves to responses table.
+    If questions/answers provided, saves to responses table. limit / cursor page the matches as in GET.
     """
     data = request.get_json()
     if not data or "vector" not in data:
         return jsonify({"error": "vector required"}), 400
-    user_vec = data["vector"]
+    try:
+        limit, after = parse_page_args(data)
+        user_vec = check_vector(data["vector"]).tolist()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     city = data.get("city", "")
     interests = data.get("interests", [])
     if isinstance(interests, str):
@@ -425,73 +544,96 @@ def matches():
     user_id = data.get("user_id")
     questions = data.get("questions")
     answers = data.get("answers")
+    model_version = _service.registry.active_version  # set server-side; a client-sent model_version is ignored
+
+    # The profile's raw Q/A embeddings (a profile-memo hit after /api/embed), before any write
+    raw = None
+    if questions and answers:
+        try:
+            raw = _service.raw_embeddings(questions, answers)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
 
     conn = get_db()
+    try:
+        if user_id:
+            # Update existing user
+            stored = conn.execute(
+                "UPDATE users SET vector=?, vector_format=?, city=?, interests=?, standing=?, model_version=? WHERE id=?",
+                (pack_vector(user_vec), WRITE_FORMAT, city, json.dumps(interests), standing, model_version, user_id),
+            ).rowcount
+        else:
+            # Register new user
+            user_id = _generate_user_id()
+            conn.execute(
+                "INSERT INTO users (id, vector, vector_format, city, interests, standing, model_version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, pack_vector(user_vec), WRITE_FORMAT, city, json.dumps(interests), standing, model_version),
+            )
+            stored = 1
 
-    if user_id:
-        # Update existing user
-        conn.execute(
-            "UPDATE users SET vector=?, city=?, interests=?, standing=? WHERE id=?",
-            (json.dumps(user_vec), city, json.dumps(interests), standing, user_id),
-        )
-    else:
-        # Register new user
-        user_id = _generate_user_id()
-        conn.execute(
-            "INSERT INTO users (id, vector, city, interests, standing) VALUES (?, ?, ?, ?, ?)",
-            (user_id, json.dumps(user_vec), city, json.dumps(interests), standing),
-        )
+        if raw is not None:
+            insert_response(conn, user_id, json.dumps(questions), json.dumps(answers), *raw)
+        conn.commit()
+    finally:
+        conn.close()
+    if stored:  # an unknown user_id updates nothing, so it stays out of the index too
+        _index.upsert_many([_index_row(user_id, user_vec, interests, standing)])
 
-    if questions and answers:
-        conn.execute(
-            "INSERT INTO responses (user_id, questions, answers) VALUES (?, ?, ?)",
-            (user_id, json.dumps(questions), json.dumps(answers)),
-        )
+    matches, next_cursor = _match_results(user_vec, user_id, limit, after)
+    if limit is None:
+        return jsonify({"user_id": user_id, "matches": matches})
+    return jsonify({"user_id": user_id, "matches": matches, "next_cursor": next_cursor})
 
-    conn.commit()
-    conn.close()
 
-    # Load other users (exclude self)
-    db_users = [u for u in _load_users_from_db() if u["id"] != user_id]
-
-    results = []
-    for u in db_users:
-        raw_sim = _cosine_sim(user_vec, u["vector"])
-        score_pct = ((raw_sim + 1) / 2) * 100
-        dist_penalty = u["distance"] * 1.5
-        match_score = max(0, min(100, score_pct - dist_penalty))
-        traits_str = u["traits"]
-        if isinstance(traits_str, list):
-            traits_str = " • ".join(traits_str)
-        results.append({
-            "id": u["id"],
-            "emoji": u["emoji"],
-            "matchScore": round(match_score, 1),
-            "distance": u["distance"],
-            "standing": u["standing"],
-            "traits": traits_str,
-        })
-
-    results.sort(key=lambda x: -x["matchScore"])
-    return jsonify({"user_id": user_id, "matches": results})
+def setup():
+    """
+    Load the models, question bank, database and vector index, then start the
+    background warmup. Runs once: from __main__, or on the first request when
+    the app is served by a WSGI server instead.
+    """
+    global _setup_done
+    with _setup_lock:
+        if _setup_done:
+            return
+        print("Configuring CPU pools...")
+        _service.start_cpu_pools()
+        print("Loading compression model...")
+        _load_models()
+        print("Loading sentence encoder...")
+        warmup_encoder()
+        print("Loading niche questions...")
+        _load_niche_pool()
+        print("Embedding question bank...")
+        _load_question_bank()
+        print("Starting embedding micro-batcher...")
+        _service.start_batcher()
+        print("Initializing database...")
+        init_db()
+        print("Loading vector index...")
+        _load_index()
+        _start_ann()
+        # Seed fake profiles if DB has very few users (so new users see matches)
+        conn = get_db()
+        count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        conn.close()
+        if count < 5:
+            n = 20
+            added = _generate_fake_profiles(n)
+            if added:
+                print(f"Seeded {added} fake profiles (BOT-*) for demo matches.")
+        print(f"Warming up ({model_artifacts.RUNTIME} runtime) in the background...")
+        _service.start_warmup(_question_bank.texts)
+        _setup_done = True
+
+
+@app.before_request
+def _setup_on_first_request():
+    if not _setup_done:
+        setup()
 
 
 if __name__ == "__main__":
-    print("Loading compression model...")
-    _load_models()
-    print("Loading niche questions...")
-    _load_niche_pool()
-    print("Initializing database...")
-    init_db()
-    # Seed fake profiles if DB has very few users (so new users see matches)
-    conn = get_db()
-    count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-    conn.close()
-    if count < 5:
-        n = 20
-        added = _generate_fake_profiles(n)
-        if added:
-            print(f"Seeded {added} fake profiles (BOT-*) for demo matches.")
+    setup()
     port = int(os.environ.get("PORT", 5001))
     print(f"Ready. Open http://127.0.0.1:{port}")
     app.run(host="0.0.0.0", port=port, debug=True)
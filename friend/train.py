@@ -2,15 +2,34 @@
 
 import json
 import random
+import sys
 
 import numpy as np
 import torch
-from response_modify import vectorize_pair
+from response_modify import embedding_dim, encoder_identity, projection_state, set_projection, to_matrix
+from dim_reduction import Projection
 from compression_model import CompressionModel, SimilarityConsistencyLoss
+from embedding_bank import EmbeddingBank
 
 PERSONALITY_PATH = "personality_answers.json"
 NICHE_PATH = "niche_questions.json"
 SAVE_PATH = "compression_model.pt"
+BANK_PATH = "corpus_embeddings"  # .npy + .json written by `python train.py --encode-corpus`
+
+GLOBAL_QUESTIONS = [
+    "What are your biggest motivations?",
+    "What are your biggest weaknesses? Strengths?",
+    "What activities do you do to handle stress or recharge?",
+    "Do you think or act first?",
+    "Do you work better alone or with a group?",
+]
+GLOBAL_ANSWER_KEYS = [
+    "q1_motivation",
+    "q2_weakness_strength",
+    "q3_stress_recharge",
+    "q4_think_or_act",
+    "q5_alone_or_group",
+]
 
 
 def get_device() -> torch.device:
@@ -35,27 +54,14 @@ def build_user_profile(personality_entry: dict, niche_pool: list, rng: random.Ra
     Q1-5: global personality questions with the user's answers.
     Q6-10: randomly sampled niche questions with their answers.
     """
-    global_questions = [
-        "What are your biggest motivations?",
-        "What are your biggest weaknesses? Strengths?",
-        "What activities do you do to handle stress or recharge?",
-        "Do you think or act first?",
-        "Do you work better alone or with a group?",
-    ]
     ans = personality_entry["answers"]
-    global_answers = [
-        ans["q1_motivation"],
-        ans["q2_weakness_strength"],
-        ans["q3_stress_recharge"],
-        ans["q4_think_or_act"],
-        ans["q5_alone_or_group"],
-    ]
+    global_answers = [ans[key] for key in GLOBAL_ANSWER_KEYS]
 
     niche_sample = rng.sample(niche_pool, 5)
     niche_questions = [qa["question"] for qa in niche_sample]
     niche_answers = [qa["answer"] for qa in niche_sample]
 
-    questions = global_questions + niche_questions
+    questions = GLOBAL_QUESTIONS + niche_questions
     answers = global_answers + niche_answers
     return questions, answers
 
@@ -79,23 +85,40 @@ def build_pairs(personality: dict, niche: dict, n_pairs: int, seed: int = 42) ->
     return pairs
 
 
-def collate_batch(pairs: list, device: torch.device) -> tuple:
-    """Vectorize a batch of pairs and return (Q1, A1, Q2, A2) tensors."""
-    Q1_list, A1_list, Q2_list, A2_list = [], [], [], []
+def corpus_strings(personality: dict, niche: dict) -> list[str]:
+    """Every string build_user_profile can emit: global questions, global answers, niche Q/A."""
+    strings = list(GLOBAL_QUESTIONS)
+    for entry in personality["responses"]:
+        strings.extend(entry["answers"][key] for key in GLOBAL_ANSWER_KEYS)
+    for qa in niche["qa_pairs"]:
+        strings.extend((qa["question"], qa["answer"]))
+    return strings
 
-    for q1, a1, q2, a2 in pairs:
-        Q1, A1, Q2, A2 = vectorize_pair(q1, a1, q2, a2)
-        Q1_list.append(Q1)
-        A1_list.append(A1)
-        Q2_list.append(Q2)
-        A2_list.append(A2)
 
-    Q1 = torch.tensor(np.stack(Q1_list), dtype=torch.float32, device=device)
-    A1 = torch.tensor(np.stack(A1_list), dtype=torch.float32, device=device)
-    Q2 = torch.tensor(np.stack(Q2_list), dtype=torch.float32, device=device)
-    A2 = torch.tensor(np.stack(A2_list), dtype=torch.float32, device=device)
+def encode_corpus(personality: dict, niche: dict, dtype=np.float32) -> EmbeddingBank:
+    """
+    Offline step: encode the whole training corpus once into BANK_PATH (.npy + .json).
+    Reuses the saved bank when it already covers the corpus and was encoded with the active encoder and projection.
+    """
+    return EmbeddingBank.load_or_build(
+        BANK_PATH,
+        corpus_strings(personality, niche),
+        to_matrix,
+        dtype=dtype,
+        dim=embedding_dim(),
+        identity=encoder_identity(),
+    )
+
 
-    return Q1, A1, Q2, A2
+def index_pairs(pairs: list, bank: EmbeddingBank) -> np.ndarray:
+    """Turn (q1, a1, q2, a2) string pairs into a (n_pairs, 4, 10) array of bank row ids."""
+    return np.array([[bank.ids(part) for part in pair] for pair in pairs], dtype=np.int64)
+
+
+def collate_batch(idx: np.ndarray, bank: EmbeddingBank, device: torch.device) -> tuple:
+    """Gather a batch of indexed pairs from the bank and return (Q1, A1, Q2, A2) tensors."""
+    rows = torch.from_numpy(bank.gather(idx)).to(device)  # (B, 4, 10, n)
+    return rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
 
 
 def save_checkpoint(model, loss_fn, epoch, loss, path=SAVE_PATH):
@@ -104,14 +127,19 @@ def save_checkpoint(model, loss_fn, epoch, loss, path=SAVE_PATH):
         "loss": loss,
         "model_state_dict": model.state_dict(),
         "loss_fn_state_dict": loss_fn.state_dict(),
+        "n": model.n,
+        "projection": projection_state(),
     }, path)
 
 
 def load_checkpoint(path=SAVE_PATH, device=None):
+    """Load model + loss; also switches to_matrix to the encoder projection the checkpoint was trained with."""
     device = device or get_device()
-    model = CompressionModel(n=384).to(device)
-    loss_fn = SimilarityConsistencyLoss().to(device)
     ckpt = torch.load(path, map_location=device, weights_only=True)
+    projection = ckpt.get("projection")
+    set_projection(Projection.from_dict(projection) if projection else None)
+    model = CompressionModel(n=ckpt.get("n", 384)).to(device)
+    loss_fn = SimilarityConsistencyLoss().to(device)
     model.load_state_dict(ckpt["model_state_dict"])
     loss_fn.load_state_dict(ckpt["loss_fn_state_dict"])
     print(f"Loaded checkpoint from epoch {ckpt['epoch']} (loss={ckpt['loss']:.4f})")
@@ -133,14 +161,15 @@ def train(
     personality, niche = load_data()
     print(f"Loaded {len(personality['responses'])} personality profiles, {niche['total']} niche Q/A pairs")
 
-    model = CompressionModel(n=384).to(device)
+    model = CompressionModel(n=embedding_dim()).to(device)
     loss_fn = SimilarityConsistencyLoss().to(device)
     opt = torch.optim.Adam(
         list(model.parameters()) + list(loss_fn.parameters()), lr=lr
     )
     scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(opt, T_max=n_epochs)
 
-    pairs = build_pairs(personality, niche, n_pairs=n_pairs)
+    bank = encode_corpus(personality, niche)
+    pairs = index_pairs(build_pairs(personality, niche, n_pairs=n_pairs), bank)
     n_batches = (len(pairs) + batch_size - 1) // batch_size
 
     best_loss = float("inf")
@@ -149,7 +178,7 @@ def train(
         total_loss = 0.0
         for i in range(0, len(pairs), batch_size):
             batch = pairs[i : i + batch_size]
-            Q1, A1, Q2, A2 = collate_batch(batch, device)
+            Q1, A1, Q2, A2 = collate_batch(batch, bank, device)
 
             opt.zero_grad()
             v1 = model(Q1, A1)
@@ -174,4 +203,10 @@ def train(
 
 
 if __name__ == "__main__":
-    train(n_epochs=1000, batch_size=64, n_pairs=32)
+    if "--encode-corpus" in sys.argv:
+        personality, niche = load_data()
+        dtype = np.float16 if "--float16" in sys.argv else np.float32
+        bank = encode_corpus(personality, niche, dtype=dtype)
+        print(f"Encoded {len(bank)} strings to {BANK_PATH}.npy")
+    else:
+        train(n_epochs=1000, batch_size=64, n_pairs=32)
@@ -0,0 +1,116 @@
+"""Top-k selection and cursor pagination for /api/matches.
+
+Matches are ordered by (matchScore as returned, descending; user id,
+ascending), a total order, so a page is fully described by its last
+entry. ``cursor`` encodes that (score, id) pair. The next page is every
+match ordered strictly after it, found with one vectorized comparison and
+an argpartition over the candidates (O(N + k log k), no full sort). Users
+who register in between are placed by the same order, so pages never repeat
+or skip an existing match. A new user's match lands on a later page, or is
+absent if it sorts before the cursor.
+
+With an approximate index only the nearest users are scored.
+``select_candidate_page`` serves a page from them only when no user who was
+left out, whether cut from the candidates or missed by the index, can rank
+inside that page.
+
+The demo "distance" on each match is fixed per (viewer, candidate) pair via
+``user_jitter``, not redrawn per request, so scores and pages are repeatable.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import zlib
+from typing import Any, Mapping
+
+import numpy as np
+
+MAX_LIMIT = 1000
+
+
+def user_jitter(user_id: str) -> float:
+    """Stable pseudo-uniform value in [0, 1) for a user id (kept in the index metadata)."""
+    return zlib.crc32(user_id.encode("utf-8")) / 2**32
+
+
+def pair_jitter(user_id: str, jitters: np.ndarray) -> np.ndarray:
+    """Per-candidate value in [0, 1), fixed for each (user, candidate) pair."""
+    return np.modf(user_jitter(user_id) + jitters.astype(np.float64))[0]
+
+
+def encode_cursor(score: float, user_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, user_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    try:
+        score, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(score), str(user_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def parse_page_args(args: Mapping[str, Any]) -> tuple[int | None, tuple[float, str] | None]:
+    """(limit, after) from request args / JSON body; no limit means every match. Raises ValueError."""
+    limit = args.get("limit")
+    if limit is not None and limit != "":
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError("limit must be an integer") from None
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    else:
+        limit = None
+    cursor = args.get("cursor")
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def select_page(
+    scores: np.ndarray, ids: np.ndarray, limit: int | None = None, after: tuple[float, str] | None = None
+) -> tuple[np.ndarray, tuple[float, str] | None]:
+    """
+    Positions of the page after ``after`` (or the first page), best first, at
+    most ``limit`` of them; ``scores`` are the rounded scores that are returned.
+    Also returns the cursor key for the following page (None on the last one).
+    """
+    rows = np.arange(len(scores))
+    if after is not None:
+        score, last_id = after
+        later = scores < score
+        ties = np.flatnonzero(scores == score)
+        if len(ties):
+            later[ties[ids[ties] > last_id]] = True
+        rows = np.flatnonzero(later)
+    more = limit is not None and len(rows) > limit
+    if more:
+        kth = np.partition(scores[rows], len(rows) - limit)[len(rows) - limit]
+        rows = rows[scores[rows] >= kth]  # every tie at the cut stays in, for the id order below
+    order = np.lexsort((ids[rows].astype(str), -scores[rows]))
+    rows = rows[order[:limit]]
+    next_after = (float(scores[rows[-1]]), str(ids[rows[-1]])) if more else None
+    return rows, next_after
+
+
+def select_candidate_page(
+    scores: np.ndarray, ids: np.ndarray, limit: int, after: tuple[float, str] | None, floor: float
+) -> tuple[np.ndarray, tuple[float, str] | None] | None:
+    """
+    ``select_page`` over a candidate subset, e.g. the users nearest in raw
+    similarity from an ANN index. ``floor`` must bound the score of every
+    user left out, including any the approximate search missed (see
+    VectorIndex.search_bounded); a floor taken from the candidates alone
+    does not. Only candidates scoring above it (allowing for the 0.1
+    rounding) then outrank everyone left out, so the page matches the exact
+    ranking. Returns None when the page would reach past them, and the
+    caller then falls back to a full scan.
+    """
+    certain = np.flatnonzero(scores > floor + 0.05)
+    rows, next_after = select_page(scores[certain], ids[certain], limit, after)
+    if len(rows) < limit:
+        return None
+    if next_after is None:  # users left out still follow this page
+        next_after = (float(scores[certain[rows[-1]]]), str(ids[certain[rows[-1]]]))
+    return certain[rows], next_after
@@ -0,0 +1,131 @@
+"""Cross-request micro-batching: concurrent callers share one batched encode + forward pass."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Sequence
+
+import numpy as np
+
+DEFAULT_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_WAIT_MS", 5.0))
+DEFAULT_MAX_ITEMS = int(os.environ.get("EMBED_BATCH_MAX_STRINGS", 128))
+
+
+class MicroBatcher:
+    """
+    Queue of jobs drained by one worker thread. The worker waits for the first
+    job, keeps collecting for up to ``max_wait_ms`` or until the queued jobs
+    hold ``max_items`` strings, then calls ``run_batch(jobs)`` once and hands
+    result i back to the caller of job i.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[list[Any]], Sequence[Any]],
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        history: int = 1024,
+    ):
+        self.run_batch = run_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_items = max_items
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._batch_sizes: deque = deque(maxlen=history)
+        self._batch_jobs: deque = deque(maxlen=history)
+        self._waits_ms: deque = deque(maxlen=history)
+        self._max_depth = 0
+        self._batches = 0
+        self._jobs = 0
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, job: Any, size: int = 1) -> Any:
+        """Queue one job (``size`` = number of strings it contributes) and block for its result."""
+        fut: Future = Future()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("MicroBatcher is stopped")
+            self._pending.append((job, size, fut, time.perf_counter()))
+            self._max_depth = max(self._max_depth, len(self._pending))
+            self._cond.notify()
+        return fut.result()
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            if not self._pending:
+                return []
+            deadline = time.perf_counter() + self.max_wait
+            while sum(item[1] for item in self._pending) < self.max_items:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or self._stopped:
+                    break
+                self._cond.wait(remaining)
+            batch, total = [], 0
+            while self._pending and (not batch or total + self._pending[0][1] <= self.max_items):
+                item = self._pending.popleft()
+                batch.append(item)
+                total += item[1]
+            return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            start = time.perf_counter()
+            futures = [item[2] for item in batch]
+            try:
+                results = self.run_batch([item[0] for item in batch])
+            except Exception as e:
+                for fut in futures:
+                    fut.set_exception(e)
+            else:
+                for fut, result in zip(futures, results):
+                    fut.set_result(result)
+            with self._cond:
+                self._batches += 1
+                self._jobs += len(batch)
+                self._batch_jobs.append(len(batch))
+                self._batch_sizes.append(sum(item[1] for item in batch))
+                self._waits_ms.extend((start - item[3]) * 1000.0 for item in batch)
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting right now (cheap; background work uses it to yield to live traffic)."""
+        return len(self._pending)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self) -> dict:
+        """Queue depth, batch sizes (strings and jobs) and queue wait percentiles over recent batches."""
+        with self._cond:
+            sizes = np.array(self._batch_sizes, dtype=np.float64)
+            jobs = np.array(self._batch_jobs, dtype=np.float64)
+            waits = np.array(self._waits_ms, dtype=np.float64)
+            out = {
+                "queue_depth": len(self._pending),
+                "max_queue_depth": self._max_depth,
+                "batches": self._batches,
+                "jobs": self._jobs,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "max_items": self.max_items,
+            }
+        if len(sizes):
+            out["batch_strings_mean"] = round(float(sizes.mean()), 2)
+            out["batch_strings_p99"] = round(float(np.percentile(sizes, 99)), 2)
+            out["batch_jobs_mean"] = round(float(jobs.mean()), 2)
+            out["queue_wait_ms_p50"] = round(float(np.percentile(waits, 50)), 3)
+            out["queue_wait_ms_p99"] = round(float(np.percentile(waits, 99)), 3)
+        return out
@@ -0,0 +1,87 @@
+"""Optimized compression-model artifacts and startup warmup for the servers.
+
+COMPRESSION_RUNTIME picks how a server runs its compression model (served as
+CompressionModelKxn, see embed_service.py):
+
+    torch        eager nn.Module (default)
+    torchscript  scripted module, saved next to the checkpoint as <stem>.torchscript.pt and reused while fresh
+    compile      torch.compile(dynamic=True); compiled lazily, so the warmup batch pays for it
+    numpy        pure-NumPy runtime (see numpy_runtime.py)
+
+For the sentence encoder, the onnx / onnx-int8 backends (ENCODER_BACKEND) are
+the ahead-of-time artifact; warmup() drives it through the same batch.
+"""
+
+from __future__ import annotations
+
+import inspect
+import os
+import time
+from typing import Callable
+
+import numpy as np
+
+from numpy_runtime import RUNTIME
+
+RUNTIMES = ("torch", "torchscript", "compile", "numpy")
+WARMUP_BATCH = int(os.environ.get("EMBED_WARMUP_BATCH", "8"))
+WARMUP_ROUNDS = int(os.environ.get("EMBED_WARMUP_ROUNDS", "50"))
+
+if RUNTIME not in RUNTIMES:
+    raise ValueError(f"COMPRESSION_RUNTIME must be one of {RUNTIMES}, got {RUNTIME!r}")
+
+
+def torchscript_path(ckpt_path: str) -> str:
+    return os.path.splitext(ckpt_path)[0] + ".torchscript.pt"
+
+
+def optimize(model, ckpt_path: str | None, device, runtime: str = RUNTIME):
+    """
+    Wrap an eval-mode eager model for ``runtime``. TorchScript artifacts are
+    rebuilt when missing, older than the checkpoint or the model's source
+    file, or scripted from a different model class; ``ckpt_path=None`` (an untrained model) scripts in memory only.
+    """
+    import torch
+
+    if runtime == "torchscript":
+        path = torchscript_path(ckpt_path) if ckpt_path else None
+        source = inspect.getsourcefile(type(model))
+        newest = max(os.path.getmtime(ckpt_path), os.path.getmtime(source)) if path else 0.0
+        if path and os.path.exists(path) and os.path.getmtime(path) >= newest:
+            loaded = torch.jit.load(path, map_location=device)
+            if loaded.original_name == type(model).__name__:  # else scripted from another model class
+                return loaded.eval()
+        scripted = torch.jit.script(model)
+        if path:
+            scripted.save(path)
+        return scripted.eval()
+    if runtime == "compile":
+        return torch.compile(model, dynamic=True)
+    return model
+
+
+def warmup(step: Callable[[], object], rounds: int = WARMUP_ROUNDS, window: int = 5, tolerance: float = 0.25) -> dict:
+    """
+    Call ``step`` (one warmup batch) until latency settles: the p99 of the last
+    ``window`` calls within ``tolerance`` of the window before it, or ``rounds``
+    calls. Returns timing stats for /api/health.
+    """
+    times_ms = []
+    settled = False
+    for _ in range(max(rounds, 1)):
+        t0 = time.perf_counter()
+        step()
+        times_ms.append((time.perf_counter() - t0) * 1000)
+        if len(times_ms) >= 2 * window + 1:
+            prev = np.percentile(times_ms[-2 * window : -window], 99)
+            last = np.percentile(times_ms[-window:], 99)
+            if abs(last - prev) <= tolerance * prev:
+                settled = True
+                break
+    return {
+        "runtime": RUNTIME,
+        "rounds": len(times_ms),
+        "first_ms": round(times_ms[0], 2),
+        "p99_ms": round(float(np.percentile(times_ms[-window:], 99)), 2),
+        "settled": settled,
+    }
@@ -0,0 +1,232 @@
+"""Versioned compression-model checkpoints with zero-downtime hot swap.
+
+Each checkpoint is identified by the sha256 of its file. Registering one copies
+it to ``<versions_dir>/<hash12>.pt`` and gives it the next ``vN`` label; the
+labels, hashes and the active version live in ``<versions_dir>/index.json``.
+
+Servers take a lease on the active model for each forward pass (``acquire()``).
+``activate()`` loads the new version first, swaps the pointer under the lock,
+and releases the old model only after its last in-flight lease is returned.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+VERSIONS_DIRNAME = "model_versions"
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def checkpoint_signature(path: str) -> dict:
+    """What must match for two checkpoints to be hot-swappable: k, encoder width and projection."""
+    import torch
+
+    from dim_reduction import Projection
+
+    ckpt = torch.load(path, map_location="cpu", weights_only=True)
+    projection = ckpt.get("projection")
+    return {
+        "k": int(ckpt["model_state_dict"]["dot_scale"].shape[0]),
+        "n": int(ckpt.get("n", 384)),
+        "projection": Projection.from_dict(projection).tag if projection else None,
+    }
+
+
+def ensure_version_column(conn: sqlite3.Connection) -> None:
+    """Add users.model_version to an existing table (no-op once present); NULL = produced before versioning."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    if "model_version" not in existing:
+        conn.execute("ALTER TABLE users ADD COLUMN model_version TEXT")
+    conn.commit()
+
+
+def vectors_by_version(conn: sqlite3.Connection) -> dict[str, int]:
+    """Count of stored user vectors per producing model version ("unknown" for NULL)."""
+    rows = conn.execute("SELECT model_version, COUNT(*) FROM users GROUP BY model_version").fetchall()
+    return {(version or "unknown"): count for version, count in rows}
+
+
+class _Lease:
+    __slots__ = ("version", "model", "leases", "retired")
+
+    def __init__(self, version: str, model: Any):
+        self.version = version
+        self.model = model
+        self.leases = 0
+        self.retired = False
+
+
+class ModelRegistry:
+    """Tracks checkpoint versions for one server and holds the active model."""
+
+    def __init__(self, checkpoint_path: str, load_model: Callable[[str], Any], versions_dir: str | None = None):
+        self.checkpoint_path = checkpoint_path
+        self.load_model = load_model
+        self.versions_dir = versions_dir or os.path.join(os.path.dirname(os.path.abspath(checkpoint_path)), VERSIONS_DIRNAME)
+        self._index_path = os.path.join(self.versions_dir, "index.json")
+        self._cond = threading.Condition()
+        self._active: _Lease | None = None
+        self._draining: list[_Lease] = []
+        self._index = self._read_index()
+
+    # --- version index ---
+
+    def _read_index(self) -> dict:
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as f:
+                return json.load(f)
+        return {"versions": [], "active": None}
+
+    def _write_index(self) -> None:
+        os.makedirs(self.versions_dir, exist_ok=True)
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(tmp, self._index_path)
+
+    def _entry(self, version: str) -> dict:
+        for entry in self._index["versions"]:
+            if entry["version"] == version:
+                return entry
+        raise ValueError(f"Unknown model version {version!r}")
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, self._entry(version)["file"])
+
+    def register(self, path: str | None = None) -> dict:
+        """Record a checkpoint file (default: the server's checkpoint path); returns its entry. Idempotent per content hash."""
+        path = path or self.checkpoint_path
+        digest = file_hash(path)
+        with self._cond:
+            for entry in self._index["versions"]:
+                if entry["hash"] == digest:
+                    return entry
+        os.makedirs(self.versions_dir, exist_ok=True)
+        name = f"{digest[:12]}.pt"
+        dest = os.path.join(self.versions_dir, name)
+        if not os.path.exists(dest):
+            shutil.copy2(path, dest + ".tmp")
+            os.replace(dest + ".tmp", dest)
+        entry = {
+            "file": name,
+            "hash": digest,
+            "source": os.path.abspath(path),
+            "registered_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **checkpoint_signature(dest),
+        }
+        with self._cond:
+            entry["version"] = f"v{len(self._index['versions']) + 1}"
+            self._index["versions"].append(entry)
+            self._write_index()
+        return entry
+
+    # --- activation ---
+
+    def start(self) -> str:
+        """
+        Register the checkpoint on disk and activate it (or the version pinned by
+        MODEL_VERSION). Returns the active version.
+        """
+        entry = self.register()
+        return self.activate(os.environ.get("MODEL_VERSION") or entry["version"])
+
+    def activate(self, version: str) -> str:
+        """Load ``version`` and make it active; requests already running finish on the old model."""
+        entry = self._entry(version)
+        with self._cond:
+            current = self._active.version if self._active is not None else None
+        if current == version:
+            return version
+        if current is not None and current in {e["version"] for e in self._index["versions"]}:
+            old = self._entry(current)
+            for key in ("k", "n", "projection"):
+                if entry.get(key) != old.get(key):
+                    raise ValueError(
+                        f"{version} has {key}={entry.get(key)!r} but active {current} has {old.get(key)!r}; "
+                        "restart the server to switch"
+                    )
+        model = self.load_model(self.path(version))
+        self.install(version, model)
+        with self._cond:
+            self._index["active"] = version
+            self._write_index()
+        return version
+
+    def install(self, version: str, model: Any) -> None:
+        """Swap in an already-loaded model (e.g. untrained weights with no checkpoint)."""
+        with self._cond:
+            old, self._active = self._active, _Lease(version, model)
+            if old is not None:
+                old.retired = True
+                if old.leases:
+                    self._draining.append(old)
+                else:
+                    old.model = None
+            self._cond.notify_all()
+
+    @contextmanager
+    def acquire(self) -> Iterator[tuple[str, Any]]:
+        """Lease the active (version, model) for one forward pass."""
+        with self._cond:
+            lease = self._active
+            if lease is None:
+                raise RuntimeError("No model version is active")
+            lease.leases += 1
+        try:
+            yield lease.version, lease.model
+        finally:
+            with self._cond:
+                lease.leases -= 1
+                if lease.retired and lease.leases == 0:
+                    lease.model = None
+                    if lease in self._draining:
+                        self._draining.remove(lease)
+                    self._cond.notify_all()
+
+    def wait_drained(self, timeout: float | None = None) -> bool:
+        """Block until every retired version has released its last lease."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._draining, timeout=timeout)
+
+    @property
+    def active_version(self) -> str | None:
+        active = self._active
+        return active.version if active is not None else None
+
+    # --- reporting ---
+
+    def versions(self) -> list[dict]:
+        with self._cond:
+            active = self.active_version
+            draining = {lease.version: lease.leases for lease in self._draining}
+            return [
+                {
+                    **{k: v for k, v in entry.items() if k not in ("file", "source")},
+                    "active": entry["version"] == active,
+                    **({"draining_requests": draining[entry["version"]]} if entry["version"] in draining else {}),
+                }
+                for entry in self._index["versions"]
+            ]
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "active": self.active_version,
+                "in_flight": self._active.leases if self._active is not None else 0,
+                "draining": {lease.version: lease.leases for lease in self._draining},
+            }
@@ -0,0 +1,144 @@
+"""Pure-NumPy inference for CompressionModel / CompressionModel5xn / CompressionModelKxn checkpoints.
+
+Export once (needs torch), then serve without torch in the request path:
+
+    python numpy_runtime.py friend/compression_model.pt            # → friend/compression_model.npz
+    COMPRESSION_RUNTIME=numpy python friend/server.py
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from typing import Sequence
+
+import numpy as np
+
+RUNTIME = os.environ.get("COMPRESSION_RUNTIME", "torch")
+
+
+def export_npz(ckpt_path: str, out_path: str | None = None) -> str:
+    """Write a checkpoint's model weights (and encoder projection, if any) to a small .npz."""
+    import torch
+
+    out_path = out_path or os.path.splitext(ckpt_path)[0] + ".npz"
+    ckpt = torch.load(ckpt_path, map_location="cpu", weights_only=True)
+    state = {k: v.numpy() for k, v in ckpt["model_state_dict"].items()}
+    arrays = {
+        "dot_scale": state["dot_scale"],
+        "dot_bias": state["dot_bias"],
+        "w": state["w"],
+        "proj_weight": state["proj.weight"],
+        "proj_bias": state["proj.bias"],
+        "n": np.array(ckpt.get("n", 384)),
+    }
+    projection = ckpt.get("projection")
+    if projection:
+        arrays["projection_method"] = np.array(projection["method"])
+        arrays["projection_dim"] = np.array(projection["dim"])
+        if projection.get("components") is not None:
+            arrays["projection_mean"] = np.asarray(projection["mean"], dtype=np.float32)
+            arrays["projection_components"] = np.asarray(projection["components"], dtype=np.float32)
+    np.savez(out_path, **arrays)
+    return out_path
+
+
+def answered(answers: Sequence[str | None]) -> list[bool]:
+    """``pad_profiles`` flags for one profile's answer texts: a null or blank answer is a skipped question."""
+    return [bool(a and a.strip()) for a in answers]
+
+
+def pad_profiles(
+    profiles: Sequence[tuple[np.ndarray, np.ndarray]],
+    k: int,
+    answered: Sequence[Sequence[bool]] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Stack (Q, A) pairs of shape (m_i, n), m_i <= k, into zero-padded (B, k, n)
+    arrays plus a (B, k) float32 mask. ``answered`` optionally marks skipped
+    questions inside a profile (False → masked out).
+    """
+    n = profiles[0][0].shape[1]
+    Q = np.zeros((len(profiles), k, n), dtype=np.float32)
+    A = np.zeros((len(profiles), k, n), dtype=np.float32)
+    mask = np.zeros((len(profiles), k), dtype=np.float32)
+    for b, (q, a) in enumerate(profiles):
+        m = len(q)
+        if m > k:
+            raise ValueError(f"Profile {b} has {m} questions; model takes at most {k}")
+        Q[b, :m], A[b, :m] = q, a
+        mask[b, :m] = 1.0 if answered is None else np.asarray(answered[b], dtype=np.float32)
+    return Q, A, mask
+
+
+class NumpyCompressionModel:
+    """Same math as CompressionModel.forward: bmm → scale/bias → ReLU → w-aggregate → ReLU → Linear."""
+
+    def __init__(self, dot_scale, dot_bias, w, proj_weight, proj_bias, n: int = 384, projection=None):
+        self.dot_scale = np.asarray(dot_scale, dtype=np.float32)
+        self.dot_bias = np.asarray(dot_bias, dtype=np.float32)
+        self.w = np.asarray(w, dtype=np.float32)
+        self.proj_weight_t = np.ascontiguousarray(np.asarray(proj_weight, dtype=np.float32).T)
+        self.proj_bias = np.asarray(proj_bias, dtype=np.float32)
+        self.n = n
+        self.k = self.dot_scale.shape[0]
+        self.projection = projection
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyCompressionModel":
+        data = np.load(path)
+        projection = None
+        if "projection_method" in data:
+            from dim_reduction import Projection
+
+            projection = Projection(
+                str(data["projection_method"]),
+                int(data["projection_dim"]),
+                data["projection_mean"] if "projection_mean" in data else None,
+                data["projection_components"] if "projection_components" in data else None,
+            )
+        return cls(
+            data["dot_scale"], data["dot_bias"], data["w"], data["proj_weight"], data["proj_bias"],
+            n=int(data["n"]), projection=projection,
+        )
+
+    @classmethod
+    def from_checkpoint(cls, ckpt_path: str) -> "NumpyCompressionModel":
+        """Load ``<ckpt>.npz``, exporting it first if it is missing or older than the checkpoint."""
+        npz = os.path.splitext(ckpt_path)[0] + ".npz"
+        if not os.path.exists(npz) or os.path.getmtime(npz) < os.path.getmtime(ckpt_path):
+            export_npz(ckpt_path, npz)
+        return cls.load(npz)
+
+    def __call__(self, Q: np.ndarray, A: np.ndarray, mask: np.ndarray | None = None) -> np.ndarray:
+        """
+        Q, A: (batch, k, n) or (k, n). Returns (batch, 64) or (64,).
+        A (k, n) Q block with (batch, k, n) answers is shared by every row.
+        mask: optional (batch, k) padding mask, as in CompressionModelKxn.forward.
+        """
+        single = A.ndim == 2
+        if single:
+            Q, A = Q[None], A[None]
+            mask = None if mask is None else mask[None]
+        if Q.ndim == 2:
+            # Shared block: one (B*k, n) x (n, k) GEMM, no per-row copies of Q
+            B, k, n = A.shape
+            M_raw = (A.reshape(B * k, n) @ Q.T).reshape(B, k, k).transpose(0, 2, 1)
+        else:
+            M_raw = np.matmul(Q, A.transpose(0, 2, 1))  # (B, k, k)
+        M = np.maximum(self.dot_scale * M_raw + self.dot_bias, 0.0)
+        if mask is not None:
+            M = M * (mask[:, :, None] * mask[:, None, :])
+        z = np.maximum(np.matmul(self.w, M)[:, 0], 0.0)  # (B, k)
+        v = z @ self.proj_weight_t + self.proj_bias  # (B, 64)
+        return v[0] if single else v
+
+    def embed(self, Q: np.ndarray, A: np.ndarray, mask: np.ndarray | None = None) -> np.ndarray:
+        """Forward pass followed by L2 normalization (what the servers store)."""
+        v = self(np.asarray(Q, dtype=np.float32), np.asarray(A, dtype=np.float32), mask)
+        return v / np.maximum(np.linalg.norm(v, axis=-1, keepdims=True), 1e-12)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(f"{path} → {export_npz(path)}")
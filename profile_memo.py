@@ -0,0 +1,77 @@
+"""Profile-level memo: identical (questions, answers) under the same model version → cached result.
+
+Seeded bots, retried submissions and unchanged re-saves skip the encoder and
+the compression model entirely. Entries hold the 64-d vector plus the raw
+Q/A embeddings as float16, the precision responses rows store them in anyway.
+PROFILE_MEMO_SIZE bounds the entry count (LRU eviction; 0 disables).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+DEFAULT_SIZE = int(os.environ.get("PROFILE_MEMO_SIZE", "2048"))
+
+
+def profile_key(questions: list[str], answers: list[str], model_version: str | None) -> str:
+    """Canonical hash of the Q/A lists (order-sensitive, exact text) and the model version."""
+    payload = json.dumps([questions, answers], ensure_ascii=False, separators=(",", ":"))
+    h = hashlib.sha256(payload.encode("utf-8"))
+    h.update(b"\0" + (model_version or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+class ProfileMemo:
+    """Thread-safe LRU of key → (vector, Q, A); Q/A kept as float16, returned as float32."""
+
+    def __init__(self, max_size: int = DEFAULT_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[list[float], np.ndarray, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> tuple[list[float], np.ndarray, np.ndarray] | None:
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        vec, Q, A = entry
+        return list(vec), Q.astype(np.float32), A.astype(np.float32)
+
+    def put(self, key: str, vector: list[float], Q: np.ndarray, A: np.ndarray) -> None:
+        if self.max_size <= 0:
+            return
+        entry = (list(vector), np.asarray(Q, dtype=np.float16), np.asarray(A, dtype=np.float16))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,44 @@
+"""Precomputed question-embedding table: question text → 384-d row."""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+
+from embedding_bank import EmbeddingBank, Encoder
+
+
+class QuestionBank(EmbeddingBank):
+    """Embeddings for a fixed universe of question strings, looked up by exact text."""
+
+    def __init__(self, texts: Sequence[str], matrix: np.ndarray, identity: dict | None = None):
+        super().__init__(texts, np.ascontiguousarray(matrix, dtype=np.float32), identity)
+
+    @classmethod
+    def load_or_build(
+        cls, path: str, texts, encode: Encoder, dim: int | None = None, identity: dict | None = None
+    ) -> "QuestionBank":
+        """
+        Load the table from ``path`` (.npy) plus its ``.json`` text index if it
+        covers every text (at width ``dim``, from the encoder ``identity``);
+        otherwise encode the universe once and save it there.
+        """
+        return super().load_or_build(path, texts, encode, mmap=False, dim=dim, identity=identity)
+
+    def encode(self, questions: Sequence[str], fallback: Encoder) -> np.ndarray:
+        """
+        (len(questions), dim) matrix of question rows. Questions outside the
+        universe are sent to ``fallback`` in one batch.
+        """
+        out = np.empty((len(questions), self.dim), dtype=np.float32)
+        missing = []
+        for i, q in enumerate(questions):
+            row = self._rows.get(q)
+            if row is None:
+                missing.append(i)
+            else:
+                out[i] = self.matrix[row]
+        if missing:
+            out[missing] = fallback([questions[i] for i in missing])
+        return out
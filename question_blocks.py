@@ -0,0 +1,81 @@
+"""Question-side blocks for the compression model, cached per question combination.
+
+The Q half of M_raw = Q·Aᵀ comes from a small fixed universe (global + niche
+questions, or emo's question sets), so the (k, n) Q block of a combination is
+built once (a gather from the question bank) and reused read-only. Users in one
+batch who answered the same combination share a single block: the model scores
+them with one (b·k, n) × (n, k) matmul against their answers instead of
+stacking a private copy of Q per row.
+
+QUESTION_BLOCK_CACHE bounds the number of cached combinations (LRU; 0 disables).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Sequence
+
+import numpy as np
+
+DEFAULT_SIZE = int(os.environ.get("QUESTION_BLOCK_CACHE", "4096"))
+
+
+def group_by_questions(question_lists: Sequence[Sequence[str]]) -> tuple[list[tuple[tuple[str, ...], list[int]]], list[int]]:
+    """
+    Split positions into shared groups (combinations answered by 2+ rows, first
+    appearance order) and singles (everything else, in order).
+    """
+    groups: dict[tuple[str, ...], list[int]] = {}
+    for i, qs in enumerate(question_lists):
+        groups.setdefault(tuple(qs), []).append(i)
+    shared = [(key, rows) for key, rows in groups.items() if len(rows) > 1]
+    singles = sorted(rows[0] for rows in groups.values() if len(rows) == 1)
+    return shared, singles
+
+
+class QuestionBlockCache:
+    """Thread-safe LRU of question combination → read-only (k, n) float32 Q block."""
+
+    def __init__(self, build: Callable[[list[str]], np.ndarray], max_size: int = DEFAULT_SIZE):
+        self.build = build
+        self.max_size = max_size
+        self._blocks: OrderedDict[tuple[str, ...], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, questions: Sequence[str]) -> np.ndarray:
+        key = tuple(questions)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return block
+            self.misses += 1
+        block = np.ascontiguousarray(self.build(list(key)), dtype=np.float32)
+        block.flags.writeable = False  # shared by every caller; never mutate in place
+        if self.max_size > 0:
+            with self._lock:
+                self._blocks[key] = block
+                while len(self._blocks) > self.max_size:
+                    self._blocks.popitem(last=False)
+        return block
+
+    def clear(self) -> None:
+        """Drop every block (e.g. after the encoder projection changes)."""
+        with self._lock:
+            self._blocks.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._blocks),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
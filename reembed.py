@@ -0,0 +1,238 @@
+"""Background re-embedding of stored users after a model version change.
+
+Walks ``responses`` in id order and recomputes each user's vector with the
+active model. Rows that carry raw embeddings (see embedding_store) skip the
+sentence encoder; rows without them are encoded once and the embeddings are
+written back. Every batch is one transaction, and progress is checkpointed to
+``<db>.reembed.json`` so a crashed or stopped job resumes where it left off
+for the same target version.
+
+A user with several responses ends up with the vector of their latest one,
+matching what the servers store on each new submission: older responses are
+passed over, and so are users already on the target version (the servers
+wrote them after the switch). The vector UPDATE itself is guarded on the
+stored version, so a submission that lands while a batch is computing is
+never overwritten. Partial responses (fewer than k questions, skipped answers)
+are padded and masked as the servers embed them.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+
+from embedding_store import pack_embeddings, unpack_embeddings
+from numpy_runtime import answered, pad_profiles
+from vector_store import WRITE_FORMAT, pack_vector
+
+DEFAULT_BATCH_SIZE = int(os.environ.get("REEMBED_BATCH_SIZE", "256"))
+# Fraction of wall time the job may spend computing; it sleeps for the rest
+DEFAULT_DUTY_CYCLE = float(os.environ.get("REEMBED_DUTY_CYCLE", "0.25"))
+
+Forward = Callable[[np.ndarray, np.ndarray, np.ndarray | None], tuple[list[list[float]], str]]
+Encoder = Callable[[list[str]], np.ndarray]
+
+
+def progress_path(db_path: str) -> str:
+    return db_path + ".reembed.json"
+
+
+class ReembedJob:
+    """
+    One pass over ``responses`` for ``target_version``.
+
+    forward(Q, A, mask) runs the compression model on (b, k, dim) arrays with an
+    optional (b, k) padding mask and returns (vectors, version); question_matrix /
+    answer_matrix encode text for rows without stored embeddings. ``busy()`` returning True makes the job wait
+    (e.g. while the serving micro-batcher has queued requests). ``on_update``
+    receives the (user_id, vector) pairs of each committed batch, so in-memory
+    copies (the servers' vector index) stay in sync.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        k: int,
+        dim: int,
+        target_version: str,
+        forward: Forward,
+        question_matrix: Encoder,
+        answer_matrix: Encoder,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        duty_cycle: float = DEFAULT_DUTY_CYCLE,
+        busy: Callable[[], bool] | None = None,
+        on_update: Callable[[list[tuple[str, list[float]]]], None] | None = None,
+    ):
+        self.db_path = db_path
+        self.k = k
+        self.dim = dim
+        self.target_version = target_version
+        self.forward = forward
+        self.question_matrix = question_matrix
+        self.answer_matrix = answer_matrix
+        self.batch_size = batch_size
+        self.duty_cycle = min(max(duty_cycle, 0.01), 1.0)
+        self.busy = busy
+        self.on_update = on_update
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._state = self._load_progress()
+
+    # --- progress checkpoint ---
+
+    def _load_progress(self) -> dict:
+        path = progress_path(self.db_path)
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get("version") == self.target_version and state.get("status") != "done":
+                state["status"] = "resumed"
+                state.setdefault("rows_current", 0)
+                return state
+        return {
+            "version": self.target_version,
+            "status": "pending",
+            "last_id": 0,
+            "rows": 0,
+            "users_updated": 0,
+            "rows_encoded": 0,
+            "rows_skipped": 0,
+            "rows_current": 0,
+        }
+
+    def _save_progress(self) -> None:
+        path = progress_path(self.db_path)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._state, f)
+        os.replace(tmp, path)
+
+    def status(self) -> dict:
+        return dict(self._state, running=self.running)
+
+    # --- control ---
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "ReembedJob":
+        self._thread = threading.Thread(target=self.run, name="reembed", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # --- work ---
+
+    def _raw(self, blob: bytes | None, m: int) -> np.ndarray | None:
+        matrix = unpack_embeddings(blob, m) if blob is not None else None
+        return matrix if matrix is not None and matrix.shape[1] == self.dim else None
+
+    def _batch(self, conn: sqlite3.Connection, rows: list) -> bool:
+        """Re-embed one batch in one transaction. Returns False if the active model moved past the target."""
+        user_ids = list({row[1] for row in rows})
+        marks = ",".join("?" * len(user_ids))
+        latest = dict(conn.execute(
+            f"SELECT user_id, MAX(id) FROM responses WHERE user_id IN ({marks}) GROUP BY user_id", user_ids
+        ).fetchall())
+        items, encode_q, encode_a = [], [], []
+        for row_id, user_id, questions_json, answers_json, q_blob, a_blob, user_version in rows:
+            if row_id != latest.get(user_id) or user_version == self.target_version:
+                self._state["rows_current"] += 1  # a later response, or the servers, set this user's vector
+                continue
+            questions, answers = json.loads(questions_json), json.loads(answers_json)
+            flags = answered(answers)
+            if len(questions) != len(answers) or not 1 <= len(questions) <= self.k or not any(flags):
+                self._state["rows_skipped"] += 1
+                continue
+            Q, A = self._raw(q_blob, len(questions)), self._raw(a_blob, len(answers))
+            if Q is None:
+                encode_q.append((len(items), questions))
+            if A is None:
+                encode_a.append((len(items), ["" if a is None else a for a in answers]))
+            items.append([row_id, user_id, Q, A, flags])
+        if not items:
+            return True
+
+        # Encode only what is missing, each side in one batch
+        for pending, encode, slot in ((encode_q, self.question_matrix, 2), (encode_a, self.answer_matrix, 3)):
+            if pending:
+                flat = encode([s for _, strings in pending for s in strings])
+                bounds = np.cumsum([len(strings) for _, strings in pending])[:-1]
+                for (i, _), matrix in zip(pending, np.split(flat, bounds)):
+                    items[i][slot] = matrix
+        encoded_ids = {items[i][0] for i, _ in encode_q + encode_a}
+
+        Q, A, mask = pad_profiles([(item[2], item[3]) for item in items], self.k, answered=[item[4] for item in items])
+        vectors, version = self.forward(Q, A, mask if (mask < 1).any() else None)
+        if version != self.target_version:
+            return False
+
+        updated = []
+        for vec, item in zip(vectors, items):
+            cur = conn.execute(
+                "UPDATE users SET vector = ?, vector_format = ?, model_version = ? "
+                "WHERE id = ? AND model_version IS NOT ?",
+                (pack_vector(vec), WRITE_FORMAT, version, item[1], version),
+            )
+            if cur.rowcount:
+                updated.append((item[1], vec))
+        conn.executemany(
+            "UPDATE responses SET q_embeddings = ?, a_embeddings = ? WHERE id = ?",
+            [(pack_embeddings(item[2]), pack_embeddings(item[3]), item[0]) for item in items if item[0] in encoded_ids],
+        )
+        conn.commit()
+        if self.on_update is not None:
+            self.on_update(updated)
+        self._state["users_updated"] += len(updated)
+        self._state["rows_current"] += len(items) - len(updated)
+        self._state["rows_encoded"] += len(encoded_ids)
+        return True
+
+    def run(self) -> dict:
+        self._state["status"] = "running"
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            # For the per-batch latest-response lookup
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_user_id ON responses (user_id)")
+            conn.commit()
+            while not self._stop.is_set():
+                while self.busy is not None and self.busy() and not self._stop.is_set():
+                    time.sleep(0.05)
+                t0 = time.perf_counter()
+                rows = conn.execute(
+                    "SELECT r.id, r.user_id, r.questions, r.answers, r.q_embeddings, r.a_embeddings, u.model_version "
+                    "FROM responses r LEFT JOIN users u ON u.id = r.user_id WHERE r.id > ? ORDER BY r.id LIMIT ?",
+                    (self._state["last_id"], self.batch_size),
+                ).fetchall()
+                if not rows:
+                    self._state["status"] = "done"
+                    break
+                if not self._batch(conn, rows):
+                    self._state["status"] = "superseded"
+                    break
+                self._state["last_id"] = rows[-1][0]
+                self._state["rows"] += len(rows)
+                self._save_progress()
+                elapsed = time.perf_counter() - t0
+                self._stop.wait(elapsed * (1 - self.duty_cycle) / self.duty_cycle)
+            else:
+                self._state["status"] = "stopped"
+        except Exception as e:
+            self._state["status"] = "failed"
+            self._state["error"] = str(e)
+            raise
+        finally:
+            conn.close()
+            self._save_progress()
+        return self.status()
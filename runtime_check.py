@@ -0,0 +1,187 @@
+"""
+Numerical parity of the NumPy runtime against the torch CompressionModel / CompressionModel5xn,
+and of the masked CompressionModelKxn against both fixed-size models.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from compression_model import CompressionModel
+from compression_model_5xn import CompressionModel5xn
+from compression_model_kxn import CompressionModelKxn
+from dim_reduction import Projection
+from numpy_runtime import NumpyCompressionModel, export_npz, pad_profiles
+
+_here = os.path.dirname(os.path.abspath(__file__))
+ATOL = 1e-4
+
+
+def _randomized(model: torch.nn.Module, seed: int) -> torch.nn.Module:
+    """Perturb every parameter so the check does not pass on the identity-ish init."""
+    g = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for p in model.parameters():
+            p.add_(torch.randn(p.shape, generator=g) * 0.5)
+    return model.eval()
+
+
+def _inputs(batch: int, k: int, n: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    Q = rng.standard_normal((batch, k, n)).astype(np.float32)
+    A = rng.standard_normal((batch, k, n)).astype(np.float32)
+    Q /= np.linalg.norm(Q, axis=-1, keepdims=True)
+    A /= np.linalg.norm(A, axis=-1, keepdims=True)
+    return Q, A
+
+
+def _roundtrip(model: torch.nn.Module, projection: Projection | None = None) -> NumpyCompressionModel:
+    """Save a checkpoint the way the train scripts do, export it, load the .npz."""
+    with tempfile.TemporaryDirectory() as tmp:
+        ckpt = os.path.join(tmp, "model.pt")
+        torch.save({
+            "model_state_dict": model.state_dict(),
+            "n": model.n,
+            "projection": None if projection is None else projection.to_dict(),
+        }, ckpt)
+        return NumpyCompressionModel.load(export_npz(ckpt))
+
+
+def _assert_parity(model: torch.nn.Module, runtime: NumpyCompressionModel, k: int, batch: int = 32) -> float:
+    Q, A = _inputs(batch, k, model.n, seed=k)
+    with torch.no_grad():
+        expected = model(torch.from_numpy(Q), torch.from_numpy(A)).numpy()
+        expected_unit = F.normalize(torch.from_numpy(expected), dim=-1).numpy()
+    got = runtime(Q, A)
+    assert got.shape == (batch, 64)
+    err = float(np.abs(got - expected).max())
+    assert err < ATOL, f"max abs diff {err}"
+    assert np.abs(runtime.embed(Q, A) - expected_unit).max() < ATOL
+    # Unbatched call matches the first batch row
+    assert np.abs(runtime(Q[0], A[0]) - expected[0]).max() < ATOL
+    return err
+
+
+def test_parity_10xn() -> None:
+    model = _randomized(CompressionModel(n=384), seed=1)
+    err = _assert_parity(model, _roundtrip(model), k=10)
+    print(f"  10xn: max abs diff {err:.2e} OK")
+
+
+def test_parity_5xn() -> None:
+    model = _randomized(CompressionModel5xn(n=384), seed=2)
+    err = _assert_parity(model, _roundtrip(model), k=5)
+    print(f"  5xn: max abs diff {err:.2e} OK")
+
+
+def test_projection_roundtrip() -> None:
+    """Reduced-dimension checkpoints carry their encoder projection through the export."""
+    rng = np.random.default_rng(3)
+    projection = Projection("pca", 64, rng.standard_normal(384), rng.standard_normal((384, 64)))
+    model = _randomized(CompressionModel(n=64), seed=3)
+    runtime = _roundtrip(model, projection)
+    assert runtime.n == 64
+    assert runtime.projection.tag == projection.tag
+    err = _assert_parity(model, runtime, k=10)
+    print(f"  projected n=64: max abs diff {err:.2e}, projection {runtime.projection.tag} OK")
+
+
+def test_shipped_checkpoints() -> None:
+    """Each trained checkpoint in the tree that loads also exports with parity."""
+    for rel, cls in [
+        ("friend/compression_model.pt", CompressionModel),
+        ("depolarizer/political_compression_model.pt", CompressionModel),
+        ("emo/compression_model_emo.pt", CompressionModel5xn),
+    ]:
+        path = os.path.join(_here, rel)
+        if not os.path.exists(path):
+            print(f"  {rel}: not present, skipped")
+            continue
+        ckpt = torch.load(path, map_location="cpu", weights_only=True)
+        model = cls(n=ckpt.get("n", 384))
+        model.load_state_dict(ckpt["model_state_dict"])
+        model.eval()
+        with tempfile.TemporaryDirectory() as tmp:
+            runtime = NumpyCompressionModel.load(export_npz(path, os.path.join(tmp, "model.npz")))
+        err = _assert_parity(model, runtime, k=runtime.k)
+        print(f"  {rel}: max abs diff {err:.2e} OK")
+
+
+def test_kxn_loads_fixed_checkpoints() -> None:
+    """10- and 5-question state dicts load unchanged and give the same vectors."""
+    for cls, k in [(CompressionModel, 10), (CompressionModel5xn, 5)]:
+        fixed = _randomized(cls(n=384), seed=k)
+        kxn = CompressionModelKxn.from_state_dict(fixed.state_dict()).eval()
+        assert kxn.k == k
+        Q, A = _inputs(16, k, 384, seed=k)
+        with torch.no_grad():
+            err = (kxn(torch.from_numpy(Q), torch.from_numpy(A)) - fixed(torch.from_numpy(Q), torch.from_numpy(A))).abs().max()
+        assert float(err) < ATOL
+        print(f"  kxn k={k}: loads {cls.__name__} state dict, max abs diff {float(err):.2e} OK")
+
+
+def test_kxn_mixed_batch() -> None:
+    """One masked forward pass over 10-, 5- and partial profiles matches per-profile results."""
+    emo = _randomized(CompressionModel5xn(n=384), seed=5)
+    wide = CompressionModelKxn.from_state_dict(emo.state_dict(), k=10).eval()
+    Q10, A10 = _inputs(3, 10, 384, seed=10)
+    Q5, A5 = _inputs(3, 5, 384, seed=11)
+    profiles = [(Q5[0], A5[0]), (Q10[0], A10[0]), (Q5[1], A5[1]), (Q10[1], A10[1]), (Q5[2], A5[2])]
+    Q, A, mask = pad_profiles(profiles, k=10)
+    with torch.no_grad():
+        mixed = wide(torch.from_numpy(Q), torch.from_numpy(A), torch.from_numpy(mask)).numpy()
+        # 5-question rows are exactly the 5xn checkpoint's output
+        expected5 = emo(torch.from_numpy(Q5), torch.from_numpy(A5)).numpy()
+        assert np.abs(mixed[[0, 2, 4]] - expected5).max() < ATOL
+        # Every row matches its own unbatched, unpadded call
+        for i, (q, a) in enumerate(profiles):
+            alone = wide(torch.from_numpy(q[None]), torch.from_numpy(a[None])).numpy()[0]
+            assert np.abs(mixed[i] - alone).max() < ATOL
+        # A skipped question is ignored: whatever sits in its slot does not change the vector
+        answered = [[True] * 4 + [False] + [True] * 5]
+        Qs, As, ms = pad_profiles([(Q10[2], A10[2])], k=10, answered=answered)
+        skipped = wide(torch.from_numpy(Qs), torch.from_numpy(As), torch.from_numpy(ms)).numpy()
+        Qs[0, 4], As[0, 4] = Q10[0, 4], -A10[0, 4]
+        changed = wide(torch.from_numpy(Qs), torch.from_numpy(As), torch.from_numpy(ms)).numpy()
+        assert np.abs(skipped - changed).max() < ATOL
+    runtime = _roundtrip(wide)
+    assert np.abs(runtime(Q, A, mask) - mixed).max() < ATOL
+    print(f"  kxn mixed batch: {len(profiles)} profiles (5/10 questions) in one pass, torch + numpy OK")
+
+
+def test_shared_question_block() -> None:
+    """A (k, n) Q block shared by the batch gives the same vectors as per-row copies, torch and numpy."""
+    for cls, k in ((CompressionModel, 10), (CompressionModel5xn, 5)):
+        model = _randomized(cls(n=384), seed=20 + k)
+        runtime = _roundtrip(model)
+        Q, A = _inputs(16, k, 384, seed=30 + k)
+        block = Q[0]
+        stacked = np.broadcast_to(block, A.shape).copy()
+        with torch.no_grad():
+            expected = model(torch.from_numpy(stacked), torch.from_numpy(A)).numpy()
+            shared = model(torch.from_numpy(block), torch.from_numpy(A)).numpy()
+        assert np.abs(shared - expected).max() < ATOL
+        assert np.abs(runtime(block, A) - expected).max() < ATOL
+        assert np.abs(runtime(block, A[0]) - expected[0]).max() < ATOL
+        print(f"  shared Q block k={k}: torch + numpy match stacked copies OK")
+
+
+def run_all() -> None:
+    """Run all tests and print summary."""
+    print("Testing NumPy runtime parity against torch (atol=%g)" % ATOL)
+    test_parity_10xn()
+    test_parity_5xn()
+    test_projection_roundtrip()
+    test_shipped_checkpoints()
+    test_kxn_loads_fixed_checkpoints()
+    test_kxn_mixed_batch()
+    test_shared_question_block()
+    print("All tests passed.")
+
+
+if __name__ == "__main__":
+    run_all()
@@ -0,0 +1,188 @@
+"""Streaming, bounded-memory encoder for very large answer corpora.
+
+Strings are read incrementally from JSONL (one record per line) or from one
+array inside a JSON document, encoded in fixed-size chunks and written straight
+into a preallocated ``.npy`` memmap. Peak memory is set by ``chunk_size``, not
+by corpus size. Progress is checkpointed after every chunk in
+``<out>.progress``, so re-running the same command resumes where it stopped.
+
+    python stream_encode.py synthetic_answers.jsonl answers.npy --field answers
+    python stream_encode.py political_answers.json answers.npy --key responses
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import sys
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+_decoder = json.JSONDecoder()
+
+
+def _strings_in(node, field: str | None = None) -> Iterator[str]:
+    """String leaves of a record, or only those under ``field`` when given."""
+    if field is not None:
+        node = node.get(field) if isinstance(node, dict) else None
+    if isinstance(node, str):
+        yield node
+    elif isinstance(node, dict):
+        for v in node.values():
+            yield from _strings_in(v)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _strings_in(v)
+
+
+def iter_jsonl(path: str) -> Iterator:
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_json_array(path: str, key: str | None = None, read_size: int = 1 << 20) -> Iterator:
+    """
+    Yield the items of a JSON array one at a time without loading the document:
+    the first top-level array, or the array following ``"key":`` when given.
+    """
+    with open(path) as f:
+        buf = f.read(read_size)
+        marker = f'"{key}"' if key is not None else None
+        # Seek to the opening bracket of the target array
+        while True:
+            start = buf.find(marker) if marker else buf.find("[")
+            if start >= 0:
+                bracket = buf.find("[", start)
+                if bracket >= 0:
+                    buf = buf[bracket + 1 :]
+                    break
+            more = f.read(read_size)
+            if not more:
+                raise ValueError(f"No array {'for key ' + key if key else ''} found in {path}")
+            buf += more
+        while True:
+            buf = buf.lstrip().lstrip(",").lstrip()
+            if buf.startswith("]"):
+                return
+            try:
+                item, end = _decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                more = f.read(read_size)
+                if not more:
+                    raise
+                buf += more
+                continue
+            # A number at the end of the buffer may be truncated; make sure a delimiter follows
+            if end == len(buf) and not isinstance(item, (dict, list, str)):
+                more = f.read(read_size)
+                if more:
+                    buf += more
+                    continue
+            yield item
+            buf = buf[end:]
+
+
+def iter_corpus_strings(path: str, field: str | None = None, key: str | None = None) -> Iterator[str]:
+    """Stream every string of a JSONL or JSON corpus (optionally only ``field`` of each record)."""
+    records = iter_jsonl(path) if path.endswith(".jsonl") else iter_json_array(path, key=key)
+    for record in records:
+        yield from _strings_in(record, field)
+
+
+def _chunks(strings: Iterable[str], size: int) -> Iterator[list[str]]:
+    it = iter(strings)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_progress(path: str) -> dict:
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"done": 0}
+
+
+def _write_progress(path: str, state: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def encode_stream(
+    make_strings: Callable[[], Iterable[str]],
+    out_path: str,
+    encode: Callable[[list[str]], np.ndarray],
+    chunk_size: int = 4096,
+    dim: int = 384,
+    dtype=np.float32,
+    total: int | None = None,
+    progress: Callable[[int, int], None] | None = None,
+) -> np.memmap:
+    """
+    Encode the strings from ``make_strings()`` into ``out_path`` (a (total, dim) .npy)
+    chunk by chunk. ``make_strings`` is called again on resume, so it must replay
+    the same sequence. Returns the finished output as a read-only memmap.
+    """
+    progress_path = out_path + ".progress"
+    state = _read_progress(progress_path)
+    if state["done"] and os.path.exists(out_path):
+        out = np.load(out_path, mmap_mode="r+")
+        total = out.shape[0]
+    else:
+        if total is None:
+            total = sum(1 for _ in make_strings())
+        out = np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=(total, dim))
+        state = {"done": 0, "total": total}
+        _write_progress(progress_path, state)
+
+    done = state["done"]
+    remaining = itertools.islice(make_strings(), done, None)
+    for chunk in _chunks(remaining, chunk_size):
+        out[done : done + len(chunk)] = np.asarray(encode(chunk), dtype=dtype)
+        out.flush()
+        done += len(chunk)
+        state["done"] = done
+        _write_progress(progress_path, state)
+        if progress is not None:
+            progress(done, total)
+    del out
+    if done != total:
+        raise ValueError(f"Corpus produced {done} strings but {total} were expected; was the input modified?")
+    os.remove(progress_path)
+    return np.load(out_path, mmap_mode="r")
+
+
+if __name__ == "__main__":
+    from bulk_encode import print_progress
+    from encoder_registry import get_encoder
+
+    parser = argparse.ArgumentParser(description="Stream-encode a JSON/JSONL corpus into a .npy memmap.")
+    parser.add_argument("corpus", help=".jsonl (one record per line) or .json file")
+    parser.add_argument("out", help="output .npy path; rows follow corpus order")
+    parser.add_argument("--field", help="only encode strings under this record field")
+    parser.add_argument("--key", help="for .json input: name of the array to stream")
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--float16", action="store_true")
+    parser.add_argument("--backend", default=None)
+    args = parser.parse_args()
+
+    encoder = get_encoder(args.backend)
+    out = encode_stream(
+        lambda: iter_corpus_strings(args.corpus, field=args.field, key=args.key),
+        args.out,
+        lambda chunk: encoder.encode(chunk, batch_size=64),
+        chunk_size=args.chunk_size,
+        dtype=np.float16 if args.float16 else np.float32,
+        progress=print_progress,
+    )
+    print(f"Wrote {out.shape[0]} × {out.shape[1]} to {args.out}", file=sys.stderr)
@@ -0,0 +1,95 @@
+"""Tests for match_pages: cursor pages against the full ranking."""
+
+import numpy as np
+import pytest
+
+from match_pages import (
+    decode_cursor,
+    encode_cursor,
+    parse_page_args,
+    select_candidate_page,
+    select_page,
+)
+
+
+def _ranking(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    scores = np.round(rng.uniform(0, 100, n), 1)
+    scores[::7] = 50.0  # plenty of ties, ordered by id
+    ids = np.array([f"U{i:04d}" for i in rng.permutation(n)], dtype=object)
+    order = np.lexsort((ids.astype(str), -scores))
+    return scores, ids, ids[order].tolist()
+
+
+def _walk(scores, ids, limit):
+    got, after = [], None
+    while True:
+        rows, after = select_page(scores, ids, limit, after)
+        got += ids[rows].tolist()
+        if after is None:
+            return got
+
+
+@pytest.mark.parametrize("limit", [1, 7, 50, 499, 500, 1000])
+def test_pages_concatenate_to_full_ranking(limit):
+    scores, ids, full = _ranking()
+    assert _walk(scores, ids, limit) == full
+
+
+def test_unlimited_is_full_ranking():
+    scores, ids, full = _ranking()
+    rows, after = select_page(scores, ids)
+    assert ids[rows].tolist() == full
+    assert after is None
+
+
+def test_cursor_is_stable_under_inserts():
+    scores, ids, full = _ranking()
+    rows, after = select_page(scores, ids, 25)
+    first = ids[rows].tolist()
+    # A user registering between requests with a better score than the cursor is not shown later;
+    # one below it lands on a later page. Nobody already ranked repeats or goes missing.
+    scores = np.append(scores, [100.0, 0.0])
+    ids = np.append(ids, np.array(["NEW-TOP", "ZZZ-LAST"], dtype=object))
+    rest = []
+    while after is not None:
+        rows, after = select_page(scores, ids, 25, after)
+        rest += ids[rows].tolist()
+    assert "NEW-TOP" not in rest
+    assert rest[-1] == "ZZZ-LAST"
+    assert first + rest[:-1] == full
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(87.5, "USR-ABC123")) == (87.5, "USR-ABC123")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+@pytest.mark.parametrize("args", [{"limit": "0"}, {"limit": "x"}, {"limit": 1001}, {"cursor": "%%%"}])
+def test_parse_page_args_rejects(args):
+    with pytest.raises(ValueError):
+        parse_page_args(args)
+
+
+def test_candidate_page_matches_full_ranking_above_floor():
+    scores, ids, full = _ranking()
+    top = np.argsort(-scores, kind="stable")[:200]
+    floor = float(scores[top].min())  # nobody left out scores above the lowest candidate
+    got, after = [], None
+    while True:
+        page = select_candidate_page(scores[top], ids[top], 20, after, floor)
+        if page is None:
+            break
+        rows, after = page
+        got += ids[top][rows].tolist()
+    assert got and got == full[: len(got)]
+    assert all(s > floor + 0.05 for s in scores[top][np.isin(ids[top], got)])
+
+
+def test_candidate_page_falls_back_past_floor():
+    scores = np.array([90.0, 80.0, 70.0])
+    ids = np.array(["a", "b", "c"], dtype=object)
+    assert select_candidate_page(scores, ids, 3, None, 75.0) is None
+    rows, after = select_candidate_page(scores, ids, 1, None, 75.0)
+    assert ids[rows].tolist() == ["a"] and after == (90.0, "a")
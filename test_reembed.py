@@ -0,0 +1,178 @@
+"""Tests for reembed.ReembedJob against a small SQLite database and a NumPy stand-in model."""
+
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from embedding_store import pack_embeddings, unpack_embeddings
+from reembed import ReembedJob, progress_path
+from vector_store import pack_vector, unpack_vector
+
+K, DIM = 5, 8
+P = np.random.default_rng(0).standard_normal((2 * DIM, 64)).astype(np.float32)
+
+
+def _encode(texts):
+    """Deterministic stand-in sentence encoder: (len(texts), DIM)."""
+    return np.array([np.random.default_rng(sum(map(ord, t))).standard_normal(DIM) for t in texts], dtype=np.float32)
+
+
+def _model(Q, A, mask=None):
+    mask = np.ones(Q.shape[:2], dtype=np.float32) if mask is None else mask
+    pooled = np.concatenate([(Q * mask[..., None]).sum(1), (A * mask[..., None]).sum(1)], axis=1)
+    return pooled @ P
+
+
+class Counter:
+    def __init__(self):
+        self.texts = 0
+
+    def __call__(self, texts):
+        self.texts += len(texts)
+        return _encode(texts)
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Ten users on model v1; even users' responses carry stored embeddings, U3 has a partial profile."""
+    path = str(tmp_path / "app.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (id TEXT PRIMARY KEY, vector BLOB NOT NULL, vector_format TEXT, model_version TEXT);
+        CREATE TABLE responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, questions TEXT NOT NULL,
+            answers TEXT NOT NULL, q_embeddings BLOB, a_embeddings BLOB
+        );
+    """)
+    for i in range(10):
+        questions = [f"q{j}" for j in range(K)]
+        answers = [f"a{i}-{j}" for j in range(K)]
+        if i == 3:
+            questions, answers = questions[:3], [answers[0], None, answers[2]]
+        Q = _encode(questions) if i % 2 == 0 else None
+        A = _encode(["" if a is None else a for a in answers]) if i % 2 == 0 else None
+        conn.execute(
+            "INSERT INTO users VALUES (?, ?, 'f32', 'v1')", (f"U{i}", pack_vector(np.zeros(64, np.float32), "f32"))
+        )
+        conn.execute(
+            "INSERT INTO responses (user_id, questions, answers, q_embeddings, a_embeddings) VALUES (?, ?, ?, ?, ?)",
+            (f"U{i}", json.dumps(questions), json.dumps(answers), pack_embeddings(Q), pack_embeddings(A)),
+        )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _job(path, forward=None, version="v2", **kwargs):
+    encoder = Counter()
+
+    def default_forward(Q, A, mask):
+        return _model(Q, A, mask).tolist(), version
+
+    job = ReembedJob(path, K, DIM, version, forward or default_forward, encoder, encoder, batch_size=4, duty_cycle=1.0, **kwargs)
+    return job, encoder
+
+
+def _users(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT id, vector, vector_format, model_version FROM users ORDER BY id").fetchall()
+    conn.close()
+    return {uid: (unpack_vector(vec, fmt), version) for uid, vec, fmt, version in rows}
+
+
+def _expected(i):
+    questions = [f"q{j}" for j in range(K)]
+    answers = [f"a{i}-{j}" for j in range(K)]
+    mask = np.ones((1, K), dtype=np.float32)
+    Q, A = np.zeros((1, K, DIM), np.float32), np.zeros((1, K, DIM), np.float32)
+    if i == 3:
+        questions, answers = questions[:3], [answers[0], "", answers[2]]
+        mask[0] = [1, 0, 1, 0, 0]
+    Q[0, : len(questions)], A[0, : len(answers)] = _encode(questions), _encode(answers)
+    return _model(Q, A, mask)[0]
+
+
+def test_reembeds_every_user(db):
+    updates = []
+    job, encoder = _job(db, on_update=updates.extend)
+    state = job.run()
+    assert state["status"] == "done" and state["users_updated"] == 10 and state["rows_skipped"] == 0
+    assert state["rows_encoded"] == 5  # only the odd users lacked stored embeddings
+    users = _users(db)
+    for i in range(10):
+        vec, version = users[f"U{i}"]
+        assert version == "v2"
+        np.testing.assert_allclose(vec, _expected(i), rtol=1e-2, atol=1e-2)
+    assert sorted(uid for uid, _ in updates) == sorted(users)
+
+    conn = sqlite3.connect(db)
+    for user_id, questions, q_blob, a_blob in conn.execute("SELECT user_id, questions, q_embeddings, a_embeddings FROM responses"):
+        m = len(json.loads(questions))
+        assert unpack_embeddings(q_blob, m).shape == unpack_embeddings(a_blob, m).shape == (m, DIM), user_id
+    conn.close()
+
+
+def test_rerun_is_idempotent(db):
+    _job(db)[0].run()
+    before = _users(db)
+    job, encoder = _job(db)
+    state = job.run()
+    assert state["status"] == "done"
+    assert state["users_updated"] == 0 and state["rows_current"] == 10
+    assert encoder.texts == 0
+    after = _users(db)
+    for user_id, (vec, version) in before.items():
+        np.testing.assert_array_equal(after[user_id][0], vec)
+        assert after[user_id][1] == version
+
+
+def test_resumes_from_checkpoint(db):
+    job, _ = _job(db)
+    batch = job._batch
+
+    def first_batch_only(conn, rows):
+        job._stop.set()
+        return batch(conn, rows)
+
+    job._batch = first_batch_only
+    job.run()
+    assert job.status()["status"] == "stopped" and job.status()["last_id"] == 4
+    resumed, _ = _job(db)
+    assert resumed.status()["status"] == "resumed"
+    state = resumed.run()
+    assert state["status"] == "done" and state["rows"] == 10 and state["users_updated"] == 10
+
+
+def test_never_overwrites_newer_server_write(db):
+    server_vec = np.full(64, 0.5, dtype=np.float32)
+
+    def forward(Q, A, mask):
+        # A submission for U0 lands while the first batch is computing
+        conn = sqlite3.connect(db)
+        conn.execute(
+            "UPDATE users SET vector = ?, vector_format = 'f32', model_version = 'v2' WHERE id = 'U0'",
+            (pack_vector(server_vec, "f32"),),
+        )
+        conn.commit()
+        conn.close()
+        return _model(Q, A, mask).tolist(), "v2"
+
+    updates = []
+    job, _ = _job(db, forward=forward, on_update=updates.extend)
+    state = job.run()
+    assert state["status"] == "done" and state["users_updated"] == 9
+    assert "U0" not in [uid for uid, _ in updates]
+    vec, version = _users(db)["U0"]
+    np.testing.assert_array_equal(vec, server_vec)
+    assert version == "v2"
+
+
+def test_superseded_by_newer_model(db):
+    job, _ = _job(db, forward=lambda Q, A, mask: (_model(Q, A, mask).tolist(), "v3"))
+    state = job.run()
+    assert state["status"] == "superseded" and state["users_updated"] == 0
+    assert {version for _, version in _users(db).values()} == {"v1"}
+    with open(progress_path(db)) as f:
+        assert json.load(f)["status"] == "superseded"
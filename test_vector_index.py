@@ -0,0 +1,158 @@
+"""Tests for vector_index (VectorIndex, PartitionedIndex) and ann_index.IVFIndex against brute force."""
+
+import threading
+
+import numpy as np
+import pytest
+
+import ann_index
+from vector_index import PartitionedIndex, VectorIndex
+
+
+def _vectors(n, dim=64, seed=0):
+    X = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def _filled(n=2000, **kwargs):
+    X = _vectors(n)
+    index = VectorIndex(("city",), **kwargs)
+    index.upsert_many([(f"U{i}", X[i], {"city": f"C{i % 3}"}) for i in range(n)])
+    return index, X
+
+
+def _brute(X, query, exclude=None):
+    scores = X @ query
+    ids = np.array([f"U{i}" for i in range(len(X))], dtype=object)
+    keep = ids != exclude
+    return ids[keep], scores[keep]
+
+
+def test_search_matches_brute_force():
+    index, X = _filled()
+    for q in range(5):
+        ids, scores, meta = index.search(X[q], exclude=f"U{q}")
+        want_ids, want_scores = _brute(X, X[q], exclude=f"U{q}")
+        assert ids.tolist() == want_ids.tolist()
+        np.testing.assert_allclose(scores, want_scores, atol=1e-5)
+        assert meta["city"].tolist() == [f"C{int(u[1:]) % 3}" for u in ids]
+
+
+@pytest.mark.parametrize("mode", ["float32", "int8", "float16"])
+def test_limited_search_is_top_k(mode):
+    index, X = _filled(mode=mode, keep_float32=True)
+    ids, scores, _ = index.search(X[0], exclude="U0", limit=25)
+    want_ids, want_scores = _brute(X, X[0], exclude="U0")
+    top = np.argsort(-want_scores, kind="stable")[:25]
+    assert ids.tolist() == want_ids[top].tolist()
+    np.testing.assert_allclose(scores, want_scores[top], atol=1e-5)
+
+
+def test_upsert_replaces_vector_and_meta():
+    index, X = _filled(100)
+    index.upsert("U5", X[6], city="elsewhere")
+    assert len(index) == 100
+    np.testing.assert_array_equal(index.vector("U5"), X[6])
+    assert index.get("U5", "city") == "elsewhere"
+
+
+def test_tombstones_compact_and_keep_results():
+    index, X = _filled(1000)
+    removed = set(range(0, 1000, 2)) | set(range(1, 400, 2))
+    for i in sorted(removed):
+        assert index.remove(f"U{i}")
+    assert not index.remove("U0")
+    live = [i for i in range(1000) if i not in removed]
+    assert len(index) == len(live)
+    assert index._n == len(live) + index._dead < 1000  # compacted once dead rows outnumbered live ones
+    ids, scores, _ = index.search(X[1])
+    assert sorted(ids.tolist()) == sorted(f"U{i}" for i in live)
+    np.testing.assert_allclose(scores, X[[int(u[1:]) for u in ids]] @ X[1], atol=1e-5)
+    assert index.max_score(X[1]) >= scores.max()
+
+
+def test_ann_search_bounded_covers_missed_users():
+    index, X = _filled(5000)
+    ids, vectors, clock = index.snapshot()
+    index.attach_ann(ann_index.IVFIndex.build(ids.tolist(), vectors, nlist=64, nprobe=2), clock)
+    for q in range(20):
+        found, scores, _, bound = index.search_bounded(X[q], f"U{q}", 30)
+        all_ids, all_scores = _brute(X, X[q], exclude=f"U{q}")
+        left_out = ~np.isin(all_ids, found)
+        assert all_scores[left_out].max() <= bound
+        np.testing.assert_allclose(scores, X[[int(u[1:]) for u in found]] @ X[q], atol=1e-5)
+
+
+def test_ann_full_probe_matches_brute_force():
+    X = _vectors(3000)
+    ids = [f"U{i}" for i in range(len(X))]
+    ann = ann_index.IVFIndex.build(ids, X, nlist=32)
+    for q in range(5):
+        found, scores = ann.search(X[q], 20, nprobe=32, exclude=f"U{q}")
+        want_ids, want_scores = _brute(X, X[q], exclude=f"U{q}")
+        top = np.argsort(-want_scores, kind="stable")[:20]
+        assert found.tolist() == want_ids[top].tolist()
+        np.testing.assert_allclose(scores, want_scores[top], atol=1e-5)
+
+
+def test_ann_save_load_round_trip(tmp_path):
+    X = _vectors(1000)
+    ann = ann_index.IVFIndex.build([f"U{i}" for i in range(len(X))], X, nlist=16)
+    ann.remove("U3")
+    path = str(tmp_path / "ann.npz")
+    ann.save(path)
+    loaded = ann_index.IVFIndex.load(path)
+    assert len(loaded) == 999 and "U3" not in loaded
+    for got, want in zip(loaded.search(X[0], 10, nprobe=16), ann.search(X[0], 10, nprobe=16)):
+        assert got.tolist() == want.tolist()
+
+
+def test_partitions_route_and_prune():
+    X = _vectors(600)
+    index = PartitionedIndex("stance", ("city",))
+    index.upsert_many([(f"U{i}", X[i], {"stance": i % 3, "city": ""}) for i in range(600)])
+    assert sorted(index.partitions()) == [0, 1, 2]
+    ids, scores, meta = index.search(X[0], exclude="U0", partitions=[1])
+    assert sorted(ids.tolist()) == sorted(f"U{i}" for i in range(1, 600, 3))
+    assert set(meta["stance"].tolist()) == {1}
+    ids, _, _ = index.search(X[0], min_score=2.0)  # above any unit-vector similarity: every partition is pruned
+    assert len(ids) == 0 and index.pruned == 3
+
+
+def test_partition_move():
+    X = _vectors(30)
+    index = PartitionedIndex("stance")
+    index.upsert_many([(f"U{i}", X[i], {"stance": "a"}) for i in range(30)])
+    index.upsert("U7", X[8], stance="b")
+    assert len(index) == 30
+    assert index.get("U7", "stance") == "b"
+    np.testing.assert_array_equal(index.vector("U7"), X[8])
+    a, _, _ = index.search(X[0], partitions=["a"])
+    b, _, _ = index.search(X[0], partitions=["b"])
+    assert "U7" not in a.tolist() and b.tolist() == ["U7"]
+    index.update_vectors([("U7", X[9]), ("nobody", X[0])])
+    np.testing.assert_array_equal(index.vector("U7"), X[9])
+    assert index.get("U7", "stance") == "b" and "nobody" not in index
+
+
+def test_search_sees_each_user_once_during_moves():
+    X = _vectors(200)
+    index = PartitionedIndex("stance")
+    index.upsert_many([(f"U{i}", X[i], {"stance": i % 2}) for i in range(200)])
+    stop = threading.Event()
+
+    def mover():  # paced: a writer that never pauses can outlast MOVE_RETRIES
+        flip = 0
+        while not stop.wait(0.001):
+            flip ^= 1
+            index.upsert_many([(f"U{i}", X[i], {"stance": (i + flip) % 2}) for i in range(0, 200, 5)])
+
+    thread = threading.Thread(target=mover)
+    thread.start()
+    try:
+        for _ in range(300):
+            ids, _, _ = index.search(X[0])
+            assert len(ids) == 200 and len(set(ids.tolist())) == 200
+    finally:
+        stop.set()
+        thread.join()
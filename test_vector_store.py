@@ -0,0 +1,98 @@
+"""Tests for vector_store: value packing and the JSON → BLOB migration."""
+
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from vector_store import check_vector, load_vectors, migrate, pack_vector, unpack_vector, vector_formats
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, 64)).astype(np.float32)
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """users table as it was before vector_format: JSON text vectors."""
+    path = str(tmp_path / "users.db")
+    X = _vectors(250)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id TEXT PRIMARY KEY, vector BLOB NOT NULL, model_version TEXT)")
+    conn.executemany(
+        "INSERT INTO users (id, vector, model_version) VALUES (?, ?, 'v1')",
+        [(f"U{i}", json.dumps(X[i].tolist())) for i in range(len(X))],
+    )
+    conn.commit()
+    conn.close()
+    return path, X
+
+
+@pytest.mark.parametrize("fmt", ["f32", "f16", "json"])
+def test_pack_unpack_round_trip(fmt):
+    vec = _vectors(1)[0]
+    value = pack_vector(vec, fmt)
+    assert isinstance(value, str if fmt == "json" else bytes)
+    tol = 1e-3 if fmt == "f16" else 0
+    np.testing.assert_allclose(unpack_vector(value, fmt), vec, atol=tol)
+    np.testing.assert_allclose(unpack_vector(value), vec, atol=tol)  # BLOB format inferred from its length
+
+
+def test_migration_round_trip(legacy_db):
+    path, X = legacy_db
+    ids = [f"U{i}" for i in range(len(X))]
+    out = migrate(path, "f32", batch_size=64)
+    assert out["converted"] == 250 and out["batches"] == 4 and out["formats"] == {"f32": 250}
+    np.testing.assert_array_equal(load_vectors(path, ids), X)
+
+    out = migrate(path, "f16", batch_size=64)
+    assert out["formats"] == {"f16": 250}
+    np.testing.assert_allclose(load_vectors(path, ids), X, atol=1e-2)
+
+    out = migrate(path, "json")
+    assert out["formats"] == {"json": 250}
+    np.testing.assert_allclose(load_vectors(path, ids), X, atol=1e-2)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM users WHERE model_version = 'v1'").fetchone()[0] == 250
+    conn.close()
+
+
+def test_migration_is_idempotent(legacy_db):
+    path, X = legacy_db
+    migrate(path, "f32")
+    again = migrate(path, "f32")
+    assert again["converted"] == 0 and again["batches"] == 0
+    assert again["formats"] == {"f32": 250}
+    np.testing.assert_array_equal(load_vectors(path, [f"U{i}" for i in range(len(X))]), X)
+
+
+def test_mixed_formats_read_during_migration(legacy_db):
+    path, X = legacy_db
+    conn = sqlite3.connect(path)
+    migrate(path, "f32", batch_size=10)
+    conn.execute("UPDATE users SET vector = ?, vector_format = NULL WHERE id = 'U7'", (json.dumps(X[7].tolist()),))
+    conn.commit()
+    assert vector_formats(conn) == {"f32": 249, "json": 1}
+    conn.close()
+    np.testing.assert_array_equal(load_vectors(path, ["U7", "U8", "missing"])[:2], X[7:9])
+    assert np.isnan(load_vectors(path, ["missing"])).all()
+
+
+def test_migrate_rejects_unknown_format(legacy_db):
+    with pytest.raises(ValueError):
+        migrate(legacy_db[0], "f8")
+
+
+@pytest.mark.parametrize(
+    "value",
+    [None, "1,2", [1.0] * 63, [1.0] * 65, [[1.0] * 64], [True] * 64, ["1"] * 64, [1.0] * 63 + [float("nan")], [1e39] * 64],
+)
+def test_check_vector_rejects(value):
+    with pytest.raises(ValueError):
+        check_vector(value)
+
+
+def test_check_vector_accepts():
+    assert check_vector([1] * 64).dtype == np.float32
+    np.testing.assert_array_equal(check_vector(unpack_vector(pack_vector(np.arange(64.0)))), np.arange(64.0))
@@ -0,0 +1,525 @@
+"""Process-resident user-vector index: one contiguous float32 matrix plus parallel id / metadata arrays.
+
+The servers load the users table into it once at startup and upsert every
+insert / update afterwards, so /api/matches scores all users with a single
+matrix-vector product instead of re-reading and JSON-decoding the table per
+request. In a VECTOR_QUANT mode other than float32 only the quantized
+codes are resident and scanned; the top VECTOR_RERANK rows are re-scored in
+float32 through an ``exact`` loader (the servers read the stored BLOBs), or
+against a resident float32 copy kept only with VECTOR_KEEP_FLOAT32=1.
+
+An approximate index (ann_index.IVFIndex) can be attached: it is kept in step
+with every write, and searches that ask for a ``limit`` go through it while it
+is fresh, falling back to the exact scan when it is stale or missing.
+
+Each index also keeps a bounding ball (center, radius) around its vectors, so
+``max_score`` gives an upper bound on any row's similarity to a query.
+PartitionedIndex splits users by a metadata key into one VectorIndex per value
+and uses that bound to skip whole partitions that cannot reach a threshold.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+from vector_quant import DEFAULT_MODE, DEFAULT_RERANK, KEEP_FLOAT32, MODES, QuantizedMatrix, quantize_int8, rerank_exact
+
+_MISSING = object()
+MOVE_RETRIES = 8  # bound on PartitionedIndex.search re-runs while users keep moving between partitions
+
+
+class VectorIndex:
+    """
+    Rows are appended in insertion order and updated in place; ``columns``
+    names the per-user metadata kept alongside each vector (any Python value).
+    A search snapshots the first ``n`` rows under the lock and scores outside
+    it, so a long scan never holds up writers (growth swaps in new arrays).
+    Removed rows are tombstoned and dropped from results; once they outnumber
+    the live ones the arrays are compacted into fresh copies.
+
+    ``exact`` (user ids → float32 rows, NaN for unknown ids) supplies the
+    float32 vectors of a quantized index when ``keep_float32`` is off: for the
+    re-rank and for ``vector``. Without it those use the decoded codes.
+    """
+
+    def __init__(
+        self,
+        columns: Iterable[str] = (),
+        dim: int = 64,
+        mode: str = DEFAULT_MODE,
+        rerank: int = DEFAULT_RERANK,
+        capacity: int = 1024,
+        exact: Callable[[list[str]], np.ndarray] | None = None,
+        keep_float32: bool = KEEP_FLOAT32,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown vector mode {mode!r}")
+        self.columns = tuple(columns)
+        self.dim = dim
+        self.mode = mode
+        self.rerank = rerank
+        self.exact = exact
+        self.resident = mode == "float32" or keep_float32  # whether _X holds the float32 vectors
+        self._lock = threading.Lock()
+        self._n = 0
+        self._pos: dict[str, int] = {}
+        self._clock = 0  # write counter; _seq[row] = clock value of the row's last write
+        self.ann = None
+        self._dead = 0  # tombstoned rows below _n
+        self._center: np.ndarray | None = None  # bounding ball of the live vectors, see max_score
+        self._radius = 0.0
+        self._centered = 0  # live rows when the center was last recomputed
+        self._alloc(max(capacity, 1))
+
+    def _alloc(self, capacity: int, keep: np.ndarray | None = None) -> None:
+        """(Re)allocate every array at ``capacity`` rows, keeping the first ``n`` (or only rows ``keep``)."""
+        n = self._n
+
+        def grow(old, dtype, shape=()):
+            new = np.empty((capacity, *shape), dtype=dtype)
+            if old is not None:
+                if keep is None:
+                    new[:n] = old[:n]
+                else:
+                    new[: len(keep)] = old[keep]
+            return new
+
+        self._capacity = capacity
+        self._X = grow(getattr(self, "_X", None), np.float32, (self.dim,)) if self.resident else None
+        self._ids = grow(getattr(self, "_ids", None), object)
+        self._seq = grow(getattr(self, "_seq", None), np.int64)
+        self._alive = grow(getattr(self, "_alive", None), bool)
+        self._meta = {c: grow(getattr(self, "_meta", {}).get(c), object) for c in self.columns}
+        if self.mode == "int8":
+            self._codes = grow(getattr(self, "_codes", None), np.int8, (self.dim,))
+            self._scales = grow(getattr(self, "_scales", None), np.float32)
+        elif self.mode == "float16":
+            self._codes = grow(getattr(self, "_codes", None), np.float16, (self.dim,))
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._pos
+
+    # --- writes ---
+
+    def _put(self, user_id: str, vector, meta: dict[str, Any] | None) -> None:
+        row = self._pos.get(user_id)
+        if row is None:
+            if self._n == self._capacity:
+                self._alloc(2 * self._capacity)
+            row = self._n
+        vec = np.asarray(vector, dtype=np.float32)
+        if vec.shape != (self.dim,):
+            raise ValueError(f"vector must have {self.dim} values, got shape {vec.shape}")
+        if self.resident:
+            self._X[row] = vec
+        if self.mode == "int8":
+            self._codes[row], self._scales[row] = quantize_int8(vec)
+        elif self.mode == "float16":
+            self._codes[row] = vec
+        if meta is not None:
+            for c in self.columns:
+                self._meta[c][row] = meta.get(c)
+        self._clock += 1
+        self._seq[row] = self._clock
+        if self._center is not None:
+            self._radius = max(self._radius, float(np.linalg.norm(vec - self._center)))
+        if row == self._n:
+            self._ids[row] = user_id
+            self._alive[row] = True
+            self._pos[user_id] = row
+            self._n += 1  # publish the row last: snapshots only see complete rows
+
+    def _after_write(self, user_ids: list[str]) -> None:
+        """Mirror written rows into the attached ANN index; re-center the bounding ball as the index doubles."""
+        if self.ann is not None and user_ids:
+            rows = [self._pos[u] for u in user_ids]
+            self.ann.add_many([self._ids[r] for r in rows], self._rows(rows))
+        if len(self._pos) > 2 * self._centered:
+            self._recenter()
+
+    def _recenter(self) -> None:
+        rows = np.flatnonzero(self._alive[: self._n])
+        self._centered = len(rows)
+        if not len(rows):
+            self._center, self._radius = None, 0.0
+            return
+        X = self._rows(rows)
+        self._center = X.mean(axis=0)
+        self._radius = float((np.linalg.norm(X - self._center, axis=1) + self._decode_error(rows, X)).max())
+
+    def _rows(self, rows) -> np.ndarray:
+        """float32 vectors of ``rows``: the resident copy, else the decoded codes."""
+        if self.resident:
+            return self._X[rows]
+        if self.mode == "int8":
+            return self._codes[rows].astype(np.float32) * self._scales[rows][:, None]
+        return self._codes[rows].astype(np.float32)
+
+    def _decode_error(self, rows, X: np.ndarray) -> np.ndarray | float:
+        """Bound on |x - decoded x| for ``rows`` (decoded as ``X``), so the bounding ball covers the real vectors."""
+        if self.resident:
+            return 0.0
+        if self.mode == "int8":
+            return self._scales[rows] * (0.5 * np.sqrt(self.dim))  # each code is off by at most half a step
+        return np.linalg.norm(X, axis=1) * 2.0**-10  # float16 keeps 11 significant bits
+
+    def upsert(self, user_id: str, vector, **meta: Any) -> None:
+        """Insert a user or replace their vector and metadata."""
+        with self._lock:
+            self._put(user_id, vector, meta)
+            self._after_write([user_id])
+
+    def upsert_many(self, rows: Iterable[tuple[str, Any, dict[str, Any]]]) -> None:
+        """Bulk upsert of (user_id, vector, metadata) rows under one lock."""
+        with self._lock:
+            written = []
+            for user_id, vector, meta in rows:
+                self._put(user_id, vector, meta)
+                written.append(user_id)
+            self._after_write(written)
+
+    def update_vectors(self, pairs: Iterable[tuple[str, Any]]) -> None:
+        """Replace vectors of known users, keeping their metadata (e.g. after re-embedding); unknown ids are skipped."""
+        with self._lock:
+            written = []
+            for user_id, vector in pairs:
+                if user_id in self._pos:
+                    self._put(user_id, vector, None)
+                    written.append(user_id)
+            self._after_write(written)
+
+    def remove(self, user_id: str) -> bool:
+        """Drop a user; returns whether they were indexed."""
+        with self._lock:
+            row = self._pos.pop(user_id, None)
+            if row is None:
+                return False
+            self._alive[row] = False
+            self._dead += 1
+            self._clock += 1
+            if self.ann is not None:
+                self.ann.remove(user_id)
+            if self._dead > max(256, len(self._pos)):
+                self._compact()
+            return True
+
+    def _compact(self) -> None:
+        """Copy the live rows into new arrays (searches holding the old ones are unaffected)."""
+        live = np.flatnonzero(self._alive[: self._n])
+        self._alloc(max(self._capacity // 2, len(live), 1), keep=live)
+        self._n = len(live)
+        self._pos = {user_id: row for row, user_id in enumerate(self._ids[: self._n].tolist())}
+        self._dead = 0
+        self._recenter()
+
+    def snapshot(self) -> tuple[np.ndarray, np.ndarray, int]:
+        """Copies of live (ids, vectors) and the write clock, e.g. to train an approximate index off-lock."""
+        with self._lock:
+            live = np.flatnonzero(self._alive[: self._n])
+            return self._ids[live], self._rows(live), self._clock
+
+    def attach_ann(self, ann, since: int | None = None) -> None:
+        """
+        Route limited searches through ``ann`` from now on. Rows written after
+        the ``since`` clock value (the snapshot it was built from) are replayed
+        into it first, under the write lock, so it misses no update.
+        """
+        with self._lock:
+            if since is not None:
+                rows = np.flatnonzero((self._seq[: self._n] > since) & self._alive[: self._n])
+                if len(rows):
+                    ann.add_many(self._ids[rows].tolist(), self._rows(rows))
+            self.ann = ann
+
+    # --- reads ---
+
+    def vector(self, user_id: str) -> np.ndarray | None:
+        with self._lock:  # _compact may renumber rows and swap arrays
+            row = self._pos.get(user_id)
+            if row is None:
+                return None
+            vec = self._rows([row])[0].copy()
+        if not self.resident and self.exact is not None:
+            exact = self.exact([user_id])[0]
+            if not np.isnan(exact).any():
+                return exact
+        return vec
+
+    def get(self, user_id: str, column: str) -> Any:
+        with self._lock:
+            row = self._pos.get(user_id)
+            return None if row is None else self._meta[column][row]
+
+    def search(
+        self, query, exclude: str | None = None, limit: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+        """
+        Similarity (dot product) of ``query`` with every user but ``exclude``.
+        Returns (ids, scores, metadata columns) as parallel arrays in row order.
+        With ``limit``, only the ``limit`` most similar users, best first: from
+        the attached approximate index while it is fresh, else by exact scan.
+        """
+        if limit is None:
+            return self._scan(query, exclude)
+        ids, scores, meta, _ = self.search_bounded(query, exclude, limit)
+        return ids, scores, meta
+
+    def search_bounded(
+        self, query, exclude: str | None, limit: int
+    ) -> tuple[np.ndarray, np.ndarray, dict[str, np.ndarray], float]:
+        """
+        ``search`` with a ``limit``, plus an upper bound on the similarity of
+        every user it left out (-inf when it left out none). The approximate
+        index may miss better users than the ones it returns; the bound still
+        covers them, so callers can tell which results are exact.
+        """
+        ann = self.ann
+        if ann is not None and not ann.stale:
+            ids, scores, bound = ann.search_bounded(query, limit, exclude=exclude)
+            with self._lock:
+                found = [i for i, u in enumerate(ids.tolist()) if u in self._pos]  # removed while the ANN was retraining
+                ids, scores = ids[found], scores[found]
+                rows = [self._pos[u] for u in ids.tolist()]
+                meta = {c: a[rows] for c, a in self._meta.items()}
+            if not self.resident and self.exact is not None:  # the ANN holds decoded vectors: re-score like the scan
+                scores = rerank_exact(scores.copy(), lambda top: self.exact(ids[top].tolist()), query, self.rerank)
+                order = np.argsort(-scores, kind="stable")
+                ids, scores, meta = ids[order], scores[order], {c: a[order] for c, a in meta.items()}
+            return ids, scores, meta, bound + self._decode_slack(query)
+        ids, scores, meta = self._scan(query, exclude)
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit - 1)[:limit] if limit > 0 else np.empty(0, dtype=np.int64)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            rest = np.ones(len(scores), dtype=bool)
+            rest[top] = False
+            bound = float(scores[rest].max()) + self._decode_slack(query)
+            return ids[top], scores[top], {c: a[top] for c, a in meta.items()}, bound
+        return ids, scores, meta, float("-inf")
+
+    def _decode_slack(self, query) -> float:
+        """Bound on how far a score from decoded codes can sit below the float32 one (0 for float32 indexes)."""
+        if self.mode == "float32":
+            return 0.0
+        with self._lock:
+            center, radius = self._center, self._radius
+            scales = self._scales[: self._n] if self.mode == "int8" else None
+        if center is None:
+            return 0.0
+        norm = float(np.linalg.norm(query))
+        if self.mode == "int8":
+            return float(scales.max()) * 0.5 * np.sqrt(self.dim) * norm if len(scales) else 0.0
+        return (float(np.linalg.norm(center)) + radius) * 2.0**-10 * norm  # |x| <= |center| + radius
+
+    def _scan(self, query, exclude: str | None) -> tuple[np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+        with self._lock:
+            n = self._n
+            X = self._X[:n] if self.resident else None
+            ids, meta = self._ids[:n], {c: a[:n] for c, a in self._meta.items()}
+            codes = getattr(self, "_codes", None)
+            codes = None if codes is None else codes[:n]
+            scales = self._scales[:n] if self.mode == "int8" else None
+            skip = self._pos.get(exclude) if exclude is not None else None
+            alive = self._alive[:n].copy() if self._dead else None
+        query = np.asarray(query, dtype=np.float32)
+        if self.mode == "float32":
+            scores = X @ query
+        else:
+            scores = QuantizedMatrix(self.mode, codes, scales).dot(query)
+            if X is not None:
+                scores = rerank_exact(scores, X, query, self.rerank)
+            elif self.exact is not None:
+                scores = rerank_exact(scores, lambda top: self.exact(ids[top].tolist()), query, self.rerank)
+        if skip is not None or alive is not None:
+            keep = np.ones(n, dtype=bool) if alive is None else alive
+            if skip is not None:
+                keep[skip] = False
+            return ids[keep], scores[keep], {c: a[keep] for c, a in meta.items()}
+        return ids, scores, meta
+
+    def max_score(self, query) -> float:
+        """Upper bound on ``query · x`` over the indexed vectors (-inf when empty): q·center + radius·|q|."""
+        with self._lock:
+            center, radius = self._center, self._radius
+        if center is None:
+            return float("-inf")
+        query = np.asarray(query, dtype=np.float32)
+        return float(query @ center) + radius * float(np.linalg.norm(query)) + 1e-5  # float32 rounding slack
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            bytes_used = self._X[: self._n].nbytes if self.resident else 0
+            if self.mode != "float32":
+                bytes_used += self._codes[: self._n].nbytes
+            if self.mode == "int8":
+                bytes_used += self._scales[: self._n].nbytes
+            out = {
+                "users": len(self._pos),
+                "capacity": self._capacity,
+                "removed_rows": self._dead,
+                "mode": self.mode,
+                "float32_resident": self.resident,
+                "vector_mb": round(bytes_used / 2**20, 2),
+            }
+        if self.ann is not None:
+            out["ann"] = self.ann.stats()
+        return out
+
+
+class PartitionedIndex:
+    """
+    One VectorIndex per value of the metadata column ``key`` (e.g. political
+    stance). Writes route each user to their partition, moving them when the
+    key changes; a search scans only the requested partitions and skips any
+    whose ``max_score`` bound is below ``min_score``. A move inserts the user
+    into the new partition before removing them from the old one, and a search
+    that overlapped a move is re-run, so it sees each user exactly once.
+    """
+
+    def __init__(self, key: str, columns: Iterable[str] = (), **kwargs: Any):
+        self.key = key
+        self.columns = tuple(dict.fromkeys((key, *columns)))
+        self._kwargs = kwargs
+        self._parts: dict[Any, VectorIndex] = {}
+        self._part_of: dict[str, Any] = {}
+        self._lock = threading.Lock()  # guards the routing tables; each partition has its own lock
+        self._write_lock = threading.Lock()  # serializes writes, so a partition move is never interleaved
+        self._moves = 0  # odd while a move is in flight; searches that saw it change are re-run
+        self.searches = 0
+        self.scanned = 0
+        self.pruned = 0
+
+    def __len__(self) -> int:
+        return len(self._part_of)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._part_of
+
+    def partitions(self) -> list[Any]:
+        with self._lock:
+            return list(self._parts)
+
+    def _partition(self, user_id: str) -> VectorIndex | None:
+        with self._lock:
+            value = self._part_of.get(user_id, _MISSING)
+            return None if value is _MISSING else self._parts[value]
+
+    # --- writes ---
+
+    def upsert(self, user_id: str, vector, **meta: Any) -> None:
+        self.upsert_many([(user_id, vector, meta)])
+
+    def upsert_many(self, rows: Iterable[tuple[str, Any, dict[str, Any]]]) -> None:
+        """
+        Bulk upsert. A user whose key changed is inserted into the new partition
+        before leaving the old one, so concurrent searches never miss them.
+        """
+        groups: dict[Any, list] = {}
+        for user_id, vector, meta in rows:
+            groups.setdefault(meta.get(self.key), []).append((user_id, vector, meta))
+        with self._write_lock:
+            for value, group in groups.items():
+                with self._lock:
+                    part = self._parts.get(value)
+                    if part is None:
+                        part = self._parts[value] = VectorIndex(self.columns, **self._kwargs)
+                    moved = [(u, self._parts[self._part_of[u]]) for u, _, _ in group if self._part_of.get(u, value) != value]
+                    if moved:
+                        self._moves += 1
+                part.upsert_many(group)
+                with self._lock:
+                    for user_id, _, _ in group:
+                        self._part_of[user_id] = value
+                for user_id, old in moved:
+                    old.remove(user_id)
+                if moved:
+                    with self._lock:
+                        self._moves += 1
+
+    def update_vectors(self, pairs: Iterable[tuple[str, Any]]) -> None:
+        """Replace vectors of known users, keeping their metadata and partition; unknown ids are skipped."""
+        groups: dict[Any, list] = {}
+        with self._write_lock:
+            with self._lock:
+                for user_id, vector in pairs:
+                    if user_id in self._part_of:
+                        groups.setdefault(self._part_of[user_id], []).append((user_id, vector))
+                parts = {value: self._parts[value] for value in groups}
+            for value, group in groups.items():
+                parts[value].update_vectors(group)
+
+    def remove(self, user_id: str) -> bool:
+        with self._write_lock:
+            with self._lock:
+                value = self._part_of.pop(user_id, _MISSING)
+                part = None if value is _MISSING else self._parts[value]
+            return part is not None and part.remove(user_id)
+
+    # --- reads ---
+
+    def vector(self, user_id: str) -> np.ndarray | None:
+        part = self._partition(user_id)
+        return None if part is None else part.vector(user_id)
+
+    def get(self, user_id: str, column: str) -> Any:
+        part = self._partition(user_id)
+        return None if part is None else part.get(user_id, column)
+
+    def search(
+        self, query, exclude: str | None = None, partitions: Iterable[Any] | None = None, min_score: float | None = None
+    ) -> tuple[np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+        """
+        Like VectorIndex.search over the ``partitions`` given (default: all),
+        concatenated partition by partition. With ``min_score``, partitions
+        whose bound says no row can reach it are not scanned; rows of scanned
+        partitions are returned unfiltered.
+        """
+        partitions = None if partitions is None else list(partitions)
+        for _ in range(MOVE_RETRIES):
+            with self._lock:
+                moves = self._moves
+                parts = list(self._parts.items()) if partitions is None else [
+                    (value, self._parts[value]) for value in partitions if value in self._parts
+                ]
+            results, pruned = [], 0
+            for _, part in parts:
+                if min_score is not None and part.max_score(query) < min_score:
+                    pruned += 1
+                    continue
+                results.append(part.search(query, exclude))
+            if moves % 2 == 0 and self._moves == moves:
+                break
+        with self._lock:
+            self.searches += 1
+            self.scanned += len(results)
+            self.pruned += pruned
+        if not results:
+            return (
+                np.empty(0, dtype=object),
+                np.empty(0, dtype=np.float32),
+                {c: np.empty(0, dtype=object) for c in self.columns},
+            )
+        return (
+            np.concatenate([ids for ids, _, _ in results]),
+            np.concatenate([scores for _, scores, _ in results]),
+            {c: np.concatenate([meta[c] for _, _, meta in results]) for c in self.columns},
+        )
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            parts = dict(self._parts)
+            out = {
+                "users": len(self._part_of),
+                "key": self.key,
+                "searches": self.searches,
+                "partitions_scanned": self.scanned,
+                "partitions_pruned": self.pruned,
+            }
+        out["partitions"] = {str(value): len(part) for value, part in parts.items()}
+        return out
+
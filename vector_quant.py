@@ -0,0 +1,127 @@
+"""Compact user-vector storage and scoring: float32, float16, or int8 with a per-vector scale.
+
+int8 codes are scored with integer-accumulated dot products. The products
+and their 64-term sums stay below 2**24, so running them through float32
+BLAS is exact and much faster than NumPy's integer matmul. The top
+candidates can then be re-scored against the exact float32 vectors.
+
+VECTOR_QUANT picks the mode the servers use (default float32). VECTOR_RERANK
+sets how many top candidates get that float32 re-rank (0 = off). The
+servers read those float32 rows back from the database; VECTOR_KEEP_FLOAT32=1
+keeps a resident float32 copy for it instead, at the full float32 memory cost.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Callable
+
+import numpy as np
+
+MODES = ("float32", "float16", "int8")
+DEFAULT_MODE = os.environ.get("VECTOR_QUANT", "float32")
+DEFAULT_RERANK = int(os.environ.get("VECTOR_RERANK", "100"))
+KEEP_FLOAT32 = os.environ.get("VECTOR_KEEP_FLOAT32", "0") == "1"
+SCAN_CHUNK = 8192
+
+if DEFAULT_MODE not in MODES:
+    raise ValueError(f"VECTOR_QUANT must be one of {MODES}, got {DEFAULT_MODE!r}")
+
+
+def quantize_int8(X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8: X ≈ codes * scales[:, None]. Works on one vector or a matrix."""
+    X = np.asarray(X, dtype=np.float32)
+    scales = np.abs(X).max(axis=-1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(X / scales[..., None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+class QuantizedMatrix:
+    """User vectors in one of MODES, scored against a float32 query by dot product."""
+
+    def __init__(self, mode: str, data: np.ndarray, scales: np.ndarray | None = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown vector mode {mode!r}")
+        self.mode = mode
+        self.data = data
+        self.scales = scales
+
+    @classmethod
+    def from_float32(cls, X: np.ndarray, mode: str = DEFAULT_MODE) -> "QuantizedMatrix":
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if mode == "int8":
+            return cls(mode, *quantize_int8(X))
+        if mode == "float16":
+            return cls(mode, X.astype(np.float16))
+        return cls(mode, X)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.data.shape[1] * self.data.itemsize + (4 if self.scales is not None else 0)
+
+    def dot(self, query: np.ndarray) -> np.ndarray:
+        """(N,) float32 dot products with ``query`` (approximate unless mode is float32)."""
+        query = np.asarray(query, dtype=np.float32)
+        if self.mode == "float32":
+            return self.data @ query
+        out = np.empty(len(self.data), dtype=np.float32)
+        if self.mode == "float16":
+            for i in range(0, len(self.data), SCAN_CHUNK):
+                out[i : i + SCAN_CHUNK] = self.data[i : i + SCAN_CHUNK].astype(np.float32) @ query
+            return out
+        q_codes, q_scale = quantize_int8(query)
+        q_codes = q_codes.astype(np.float32)
+        for i in range(0, len(self.data), SCAN_CHUNK):
+            acc = self.data[i : i + SCAN_CHUNK].astype(np.float32) @ q_codes  # exact integer sums
+            out[i : i + SCAN_CHUNK] = acc * self.scales[i : i + SCAN_CHUNK] * q_scale
+        return out
+
+    def top_k(
+        self,
+        query: np.ndarray,
+        k: int,
+        exact: Callable[[np.ndarray], np.ndarray] | None = None,
+        rerank: int = DEFAULT_RERANK,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Indices and scores of the ``k`` best rows, best first. With ``exact``
+        (row indices → float32 vectors), the best max(k, rerank) approximate
+        candidates are re-scored in float32 before the final cut.
+        """
+        scores = self.dot(query)
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        pool = min(len(scores), max(k, rerank if exact is not None else k))
+        idx = np.argpartition(-scores, pool - 1)[:pool]
+        cand = scores[idx]
+        if exact is not None and self.mode != "float32" and rerank > 0:
+            cand = np.asarray(exact(idx), dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+        order = np.argsort(-cand, kind="stable")[:k]
+        return idx[order], cand[order]
+
+
+def rerank_exact(
+    scores: np.ndarray,
+    X: np.ndarray | Callable[[np.ndarray], np.ndarray],
+    query: np.ndarray,
+    rerank: int = DEFAULT_RERANK,
+) -> np.ndarray:
+    """
+    Overwrite the ``rerank`` best approximate ``scores`` (in place) with exact
+    float32 dot products. ``X`` is the float32 matrix or a loader (row
+    indices → float32 vectors); rows it returns as NaN keep their score.
+    """
+    if rerank > 0 and len(scores):
+        top = np.argpartition(-scores, min(rerank, len(scores)) - 1)[:rerank]
+        exact = (X(top) if callable(X) else X[top]) @ query
+        scores[top] = np.where(np.isnan(exact), scores[top], exact)
+    return scores
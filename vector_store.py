@@ -0,0 +1,178 @@
+"""Binary ``users.vector`` storage and the online migration from JSON text.
+
+``users.vector`` used to hold ``json.dumps`` of the 64 floats (~1.3 KB per row,
+one JSON parse per row on load). It now holds a little-endian float32 BLOB
+(256 bytes) or, optionally, float16 (128 bytes), and ``users.vector_format``
+records which: ``f32``, ``f16``, or ``json`` / NULL for legacy text rows. The
+per-row ``model_version`` column (see model_registry) is kept as is.
+
+SQLite keeps BLOBs unchanged in a TEXT-declared column, so existing tables
+are converted in place, with no table rebuild. Reads accept every format, so
+servers keep running while the migration walks the table. New writes use
+VECTOR_FORMAT (default f32; ``json`` keeps writing text). The API still
+returns plain JSON lists.
+
+Migrate a live database in small batches (WAL mode, one short write
+transaction per batch):
+
+    python vector_store.py friend/friend.db                    # → float32 BLOBs
+    python vector_store.py emo/emo.db --format f16 --pause 0.05
+    python vector_store.py friend/friend.db --format json      # roll back to text
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+
+FORMATS = {"f32": np.dtype("<f4"), "f16": np.dtype("<f2")}
+WRITE_FORMAT = os.environ.get("VECTOR_FORMAT", "f32")
+
+if WRITE_FORMAT not in FORMATS and WRITE_FORMAT != "json":
+    raise ValueError(f"VECTOR_FORMAT must be one of {[*FORMATS, 'json']}, got {WRITE_FORMAT!r}")
+
+
+def pack_vector(vector, fmt: str = WRITE_FORMAT) -> bytes | str:
+    """Vector → stored ``users.vector`` value in ``fmt``."""
+    if fmt == "json":
+        return json.dumps([float(x) for x in vector])
+    return np.asarray(vector, dtype=FORMATS[fmt]).tobytes()
+
+
+def unpack_vector(value: bytes | str, fmt: str | None = None) -> np.ndarray:
+    """
+    Stored ``users.vector`` value → float32 array. Text is JSON; a BLOB is
+    decoded as ``fmt``, or inferred from its length (64-d vectors) when the
+    row's format is unknown.
+    """
+    if isinstance(value, str):
+        return np.asarray(json.loads(value), dtype=np.float32)
+    if fmt not in FORMATS:
+        fmt = "f16" if len(value) == 64 * 2 else "f32"
+    return np.frombuffer(value, dtype=FORMATS[fmt]).astype(np.float32)
+
+
+def check_vector(value, dim: int = 64) -> np.ndarray:
+    """
+    A vector from a request body or a stored row → float32 (dim,) array.
+    Raises ValueError unless it is ``dim`` finite numbers (a JSON list, or an
+    array from ``unpack_vector``).
+    """
+    numbers = isinstance(value, list) and all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in value)
+    if not numbers and not isinstance(value, np.ndarray):
+        raise ValueError(f"vector must be a list of {dim} numbers")
+    with np.errstate(over="ignore"):  # values beyond float32 become inf and fail the check below
+        vec = np.asarray(value, dtype=np.float32)
+    if vec.shape != (dim,):
+        raise ValueError(f"vector must have {dim} values, got shape {vec.shape}")
+    if not np.isfinite(vec).all():
+        raise ValueError("vector values must be finite")
+    return vec
+
+
+def ensure_vector_format_column(conn: sqlite3.Connection) -> None:
+    """Add users.vector_format to an existing table (no-op once present); NULL = legacy JSON text."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    if "vector_format" not in existing:
+        conn.execute("ALTER TABLE users ADD COLUMN vector_format TEXT")
+    conn.commit()
+
+
+def vector_formats(conn: sqlite3.Connection) -> dict[str, int]:
+    """Stored vectors per format ("json" includes pre-migration rows with NULL format)."""
+    rows = conn.execute("SELECT COALESCE(vector_format, 'json'), COUNT(*) FROM users GROUP BY 1").fetchall()
+    return {fmt: count for fmt, count in rows}
+
+
+def load_vectors(db_path: str, user_ids: list[str], dim: int = 64) -> np.ndarray:
+    """(len(user_ids), dim) float32 stored vectors, in order; rows of users not in the table are NaN."""
+    out = np.full((len(user_ids), dim), np.nan, dtype=np.float32)
+    pos = {user_id: i for i, user_id in enumerate(user_ids)}
+    conn = sqlite3.connect(db_path)
+    try:
+        for start in range(0, len(user_ids), 500):  # stay under SQLite's bound-parameter limit
+            chunk = user_ids[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            for user_id, value, fmt in conn.execute(
+                f"SELECT id, vector, vector_format FROM users WHERE id IN ({marks})", chunk
+            ):
+                out[pos[user_id]] = unpack_vector(value, fmt)
+    finally:
+        conn.close()
+    return out
+
+
+def migrate(
+    db_path: str,
+    fmt: str = "f32",
+    batch_size: int = 1000,
+    pause: float = 0.0,
+    progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """
+    Rewrite every ``users.vector`` not already in ``fmt``. Each batch is read
+    and rewritten inside one BEGIN IMMEDIATE transaction, so a concurrent
+    server write to the same row lands either before the batch (and gets
+    converted) or after it (already in its own format); readers never block
+    under WAL. Sleeps ``pause`` seconds between batches. Safe to interrupt
+    and re-run.
+    """
+    if fmt not in FORMATS and fmt != "json":
+        raise ValueError(f"Unknown vector format {fmt!r}")
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        ensure_vector_format_column(conn)
+        remaining = conn.execute(
+            "SELECT COUNT(*) FROM users WHERE COALESCE(vector_format, 'json') != ?", (fmt,)
+        ).fetchone()[0]
+        converted, batches, last_rowid = 0, 0, 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT rowid, vector, vector_format FROM users "
+                    "WHERE rowid > ? AND COALESCE(vector_format, 'json') != ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, fmt, batch_size),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE users SET vector = ?, vector_format = ? WHERE rowid = ?",
+                    [(pack_vector(unpack_vector(value, old), fmt), fmt, rowid) for rowid, value, old in rows],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            converted += len(rows)
+            batches += 1
+            if progress is not None:
+                progress(converted, remaining)
+            if pause:
+                time.sleep(pause)
+        return {"format": fmt, "converted": converted, "batches": batches, "formats": vector_formats(conn)}
+    finally:
+        conn.close()
+
+
+def print_progress(done: int, total: int) -> None:
+    print(f"\rConverted {done}/{total}", end="\n" if done >= total else "", file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert users.vector between JSON text and binary BLOBs, online.")
+    parser.add_argument("db", help="server database (friend.db, depolarizer.db, emo.db)")
+    parser.add_argument("--format", default="f32", choices=[*FORMATS, "json"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    args = parser.parse_args()
+    print(json.dumps(migrate(args.db, args.format, args.batch_size, args.pause, print_progress)))